@@ -0,0 +1,186 @@
+import importlib
+import os
+import random
+import sys
+import time
+
+from mirror import StateMirror
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from config.game_config import GameConfig
+
+FIELD_WIDTH = GameConfig.FIELD_WIDTH
+FIELD_HEIGHT = GameConfig.FIELD_HEIGHT
+MOVE_STEPS = {"run": 1, "rush": 2}
+
+
+class Bot:
+    # 机器人接口。think()是生成器：每找到一个更好的答案就yield一次动作列表，
+    # 截止时间（time.monotonic()）一到，客户端就采用最后一次yield的结果，所以应尽早给出第一个答案。
+    # self.mirror是机器人自己的状态镜像，提供带缓存的距离和范围查询
+    def setup(self, player_id, side, star_ids):
+        self.player_id = player_id
+        self.side = side
+        self.star_ids = list(star_ids)
+        self.mirror = StateMirror(player_id, star_ids)
+
+    def observe(self, message):
+        # 在机器人所在的线程/进程里应用服务器消息，返回完整状态；缺增量时返回None
+        return self.mirror.apply(message)
+
+    def fallback(self, state):
+        # 还没有任何答案时使用，必须立即返回；空列表表示全员nope
+        return []
+
+    def think(self, state, deadline):
+        yield self.fallback(state)
+
+    @classmethod
+    def decide_batch(cls, bots, states, deadline):
+        # 多路客户端把同一类机器人所有待答的回合合并成一次调用，返回与bots一一对应的动作列表。
+        # 默认依次运行各自的think()并平分剩余时间；基于模型的机器人可覆盖它，一次前向计算整批局面
+        answers = []
+        for i, (bot, state) in enumerate(zip(bots, states)):
+            share = time.monotonic() + max(deadline - time.monotonic(), 0) / (len(bots) - i)
+            actions = bot.fallback(state)
+            for actions in bot.think(state, share):
+                if time.monotonic() >= share:
+                    break
+            answers.append(actions)
+        return answers
+
+
+class RandomBot(Bot):
+    # 每名球员随机选择动作和目标位置
+    def think(self, state, deadline):
+        yield [{"starId": star_id,
+                "action": random.choice(GameConfig.ACTION_TYPES),
+                "x": random.randrange(FIELD_WIDTH),
+                "y": random.randrange(FIELD_HEIGHT)} for star_id in self.star_ids]
+
+
+def distance(x1, y1, x2, y2):
+    return max(abs(x1 - x2), abs(y1 - y2))
+
+
+def step_towards(x, y, tx, ty, steps):
+    for _ in range(steps):
+        x += (tx > x) - (tx < x)
+        y += (ty > y) - (ty < y)
+    return x, y
+
+
+class GreedyBot(Bot):
+    # 随时可中断的局部搜索示例：先构造一个贪心方案立即交出，
+    # 之后不断随机改动单名球员的动作，按一回合后的局面打分，得分更高就交出新方案
+    def __init__(self, seed=None):
+        self.rng = random.Random(seed)
+
+    def setup(self, player_id, side, star_ids):
+        super().setup(player_id, side, star_ids)
+        self.goal = (FIELD_WIDTH - 1 if side == 'left' else 0, FIELD_HEIGHT // 2)
+
+    def think(self, state, deadline):
+        own = self.mirror.own_stars()
+        if not own:
+            yield []
+            return
+        plan = self.greedy_plan(state, own)
+        best = self.evaluate(state, plan)
+        yield self.to_actions(plan)
+        while time.monotonic() < deadline:
+            candidate = dict(plan)
+            star_id = self.rng.choice(own)
+            candidate[star_id] = self.random_move(state, star_id)
+            score = self.evaluate(state, candidate)
+            if score > best:
+                plan, best = candidate, score
+                yield self.to_actions(plan)
+
+    def greedy_plan(self, state, own):
+        ball = state["ball"]
+        stars = state["stars"]
+        bx, by = ball["x"], ball["y"]
+        if ball["pass"] is not None:
+            bx, by = ball["pass"]["tx"], ball["pass"]["ty"]
+        plan = {}
+        if ball["pass"] is None:
+            chaser = self.mirror.nearest_to_ball()[0]
+        else:
+            chaser = min(own, key=lambda star_id: distance(*self.mirror.position(star_id), bx, by))
+        for star_id in own:
+            star = stars[str(star_id)]
+            if self.mirror.holder() == star_id and ball["playerId"] == self.player_id:
+                if distance(star["x"], star["y"], *self.goal) <= GameConfig.SHORT_PASS_MAX_DISTANCE:
+                    plan[star_id] = ("shortPass",) + self.goal
+                else:
+                    plan[star_id] = ("rush",) + self.goal
+            elif star_id == chaser:
+                holder = self.mirror.holder()
+                near_holder = holder is not None and ball["playerId"] != self.player_id \
+                    and any(other == holder for other, _ in self.mirror.tackle_targets(star_id))
+                plan[star_id] = ("steal" if near_holder else "rush", bx, by)
+            else:
+                plan[star_id] = ("nope", star["x"], star["y"])
+        return plan
+
+    def random_move(self, state, star_id):
+        star = state["stars"][str(star_id)]
+        ball = state["ball"]
+        action = self.rng.choice(("run", "rush", "nope", "steal", "shortPass"))
+        if action in ("steal", "nope"):
+            return action, ball["x"], ball["y"]
+        if action == "shortPass":
+            return (action,) + self.goal
+        x = min(max(star["x"] + self.rng.randint(-20, 20), 0), FIELD_WIDTH - 1)
+        y = min(max(star["y"] + self.rng.randint(-20, 20), 0), FIELD_HEIGHT - 1)
+        return action, x, y
+
+    def evaluate(self, state, plan):
+        # 只看一回合后的局面：离球越近、持球者越靠近对方球门越好，球员扎堆和无效动作扣分
+        ball = state["ball"]
+        stars = state["stars"]
+        holding = ball["status"] == "hold" and ball["playerId"] == self.player_id
+        positions = []
+        score = 0.0
+        for star_id, (action, x, y) in plan.items():
+            star = stars[str(star_id)]
+            sx, sy = star["x"], star["y"]
+            if star["state"] == "stun":
+                action = "nope"
+            if GameConfig.STAMINA_COST[action] > star["stamina"]:
+                score -= 50
+                action = "nope"
+            if action in MOVE_STEPS:
+                sx, sy = step_towards(sx, sy, x, y, MOVE_STEPS[action])
+            positions.append((sx, sy))
+            if holding and ball["starId"] == star_id:
+                goal_distance = distance(sx, sy, *self.goal)
+                if action == "shortPass":
+                    in_range = distance(star["x"], star["y"], *self.goal) <= GameConfig.SHORT_PASS_MAX_DISTANCE
+                    score += 200 if in_range and (x, y) == self.goal else -100
+                score -= goal_distance
+            elif action == "steal":
+                holder = self.mirror.holder()
+                near = holder is not None and ball["playerId"] != self.player_id \
+                    and any(other == holder for other, _ in self.mirror.tackle_targets(star_id))
+                score += 60 if near else -30
+            elif action == "shortPass":
+                score -= 100
+            score -= GameConfig.STAMINA_COST[action] * 0.05
+        if not holding:
+            score -= 3 * min(distance(x, y, ball["x"], ball["y"]) for x, y in positions)
+        for i, (x1, y1) in enumerate(positions):
+            for x2, y2 in positions[i + 1:]:
+                if distance(x1, y1, x2, y2) < 5:
+                    score -= 5
+        return score
+
+    def to_actions(self, plan):
+        return [{"starId": star_id, "action": action, "x": x, "y": y} for star_id, (action, x, y) in plan.items()]
+
+
+def load_bot(spec):
+    # "module:Class"形式，模块从client目录或sys.path中查找
+    module_name, _, class_name = spec.partition(':')
+    return getattr(importlib.import_module(module_name), class_name)()
@@ -0,0 +1,132 @@
+import multiprocessing
+import queue
+import threading
+import time
+
+DECISION_MODES = ("thread", "process")
+
+
+def search_loop(bot, requests, results):
+    # 工作线程/进程：机器人自己的状态镜像按服务器消息逐条更新，然后运行搜索，把每次改进的答案送回客户端。
+    # 积压的消息全部应用，但只为最新的一回合思考
+    while True:
+        job = requests.get()
+        pending = None
+        while job is not None:
+            round_no, message, deadline = job
+            state = bot.observe(message)
+            if round_no is not None:
+                pending = (round_no, state, deadline)
+            try:
+                job = requests.get_nowait()
+            except queue.Empty:
+                break
+        if job is None:
+            return
+        if pending is None:
+            continue
+        round_no, state, deadline = pending
+        if state is None:
+            # 镜像缺了增量，等补发的关键帧；本回合由客户端发送兜底答案
+            results.put((round_no, None, True))
+            continue
+        try:
+            for actions in bot.think(state, deadline):
+                results.put((round_no, actions, False))
+                if time.monotonic() >= deadline:
+                    break
+        except Exception as e:
+            results.put((round_no, repr(e), True))
+            continue
+        results.put((round_no, None, True))
+
+
+class Decision:
+    __slots__ = ('round_no', 'deadline', 'actions', 'sent')
+
+    def __init__(self, round_no, deadline, actions):
+        self.round_no = round_no
+        self.deadline = deadline
+        self.actions = actions
+        self.sent = False
+
+
+class DecisionRunner:
+    # 机器人在后台线程或进程中思考；截止时间一到，或搜索提前结束，就发送当前最好的答案。
+    # 接收线程只负责提交，不会被机器人阻塞
+    def __init__(self, bot, send, mode="thread", log=None):
+        self.bot = bot
+        self.send = send  # send(round_no, actions)
+        self.log = log
+        self.lock = threading.Condition()
+        self.current = None
+        self.running = True
+        if mode == "process":
+            self.requests = multiprocessing.Queue()
+            self.results = multiprocessing.Queue()
+            self.worker = multiprocessing.Process(target=search_loop, args=(bot, self.requests, self.results),
+                                                  daemon=True)
+        else:
+            self.requests = queue.Queue()
+            self.results = queue.Queue()
+            self.worker = threading.Thread(target=search_loop, args=(bot, self.requests, self.results), daemon=True)
+        self.worker.start()
+        threading.Thread(target=self.result_loop, daemon=True).start()
+        threading.Thread(target=self.deadline_loop, daemon=True).start()
+
+    def submit(self, round_no, message, deadline, state=None):
+        # message为服务器的关键帧/增量，转给机器人的状态镜像。
+        # 新回合立即取代旧回合；旧回合如果还没发送，先按当前答案发出
+        with self.lock:
+            self.flush()
+            self.current = Decision(round_no, deadline, self.bot.fallback(state))
+            self.lock.notify_all()
+        self.requests.put((round_no, message, deadline))
+
+    def update(self, message):
+        # 只更新镜像不思考，用于补发的关键帧
+        self.requests.put((None, message, None))
+
+    def flush(self):
+        decision = self.current
+        if decision is not None and not decision.sent:
+            decision.sent = True
+            self.send(decision.round_no, decision.actions)
+
+    def result_loop(self):
+        while self.running:
+            try:
+                round_no, actions, final = self.results.get()
+            except (EOFError, OSError):
+                return
+            with self.lock:
+                decision = self.current
+                if decision is None or decision.round_no != round_no or decision.sent:
+                    continue
+                if final:
+                    if isinstance(actions, str) and self.log:
+                        self.log.warning("Bot raised an error", round=round_no, error=actions)
+                    self.flush()
+                else:
+                    decision.actions = actions
+
+    def deadline_loop(self):
+        with self.lock:
+            while self.running:
+                decision = self.current
+                if decision is None or decision.sent:
+                    self.lock.wait()
+                    continue
+                remaining = decision.deadline - time.monotonic()
+                if remaining > 0:
+                    self.lock.wait(remaining)
+                    continue
+                if self.log:
+                    self.log.debug("Deadline reached, sending best answer so far", round=decision.round_no)
+                self.flush()
+
+    def stop(self):
+        with self.lock:
+            self.running = False
+            self.lock.notify_all()
+        self.requests.put(None)
@@ -1,57 +1,93 @@
 import socket
 import json
 import argparse
+import os
 import threading
 import time
 import sys
-import random
+
+from bots import RandomBot, load_bot
+from decision import DECISION_MODES, DecisionRunner
+from mirror import StateMirror
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.codec import CODECS, JSON_CODEC, CodecError
+from common.framing import FRAMING_MODES, FrameDecoder, FrameError, encode_frame
+from common.log import add_log_arguments, get_logger, setup_logging_from_args
 
 
 class GameClient:
-    def __init__(self, server_host, server_port, player_id):
+    def __init__(self, server_host, server_port, player_id, framing="length", match_id=None, codec="json",
+                 bot=None, decision_mode="thread", margin=0.1, team_name="A"):
         self.max_rounds = None
         self.server_host = server_host
         self.server_port = server_port
         self.player_id = player_id
-        self.team_name = "A"
+        self.match_id = match_id
+        self.team_name = team_name  # 阵容名，对应服务器阵容表中的一队
         self.client_socket = None
+        self.framing = framing
+        self.decoder = FrameDecoder(framing)
+        self.requested_codec = CODECS[codec]
+        self.codec = JSON_CODEC  # 注册消息总是JSON，之后切换到协商的编解码器
         self.running = False
         self.registered = False
         self.game_active = False
         self.current_round = 0
+        self.side = None
+        self.star_ids = []
+        self.mirror = StateMirror(player_id)
+        self.state = None  # 本地重建的完整状态
+        self.bot = bot or RandomBot()
+        self.decision_mode = decision_mode
+        self.runner = None
+        self.round_timeout = 0.5
+        self.margin = margin  # 提前于服务器截止时间发送的余量，覆盖网络和编解码耗时
+        self.inquiry_received = {}  # 回合 -> 收到查询的时刻，用于上报思考时间
+        self.send_lock = threading.Lock()
+        self.token = None  # 注册时服务器发放的会话令牌，掉线后凭它恢复
+        self.reconnect_grace = 0
+        self.reconnect_deadline = None  # 本次掉线的重连截止时刻，收到恢复确认后清除
+        self.reconnect_delay = 0.1
+        self.log = get_logger("client", team=player_id, **({"match": match_id} if match_id else {}))
 
     def connect(self):
         try:
             self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.client_socket.connect((self.server_host, self.server_port))
             self.running = True
-            print(f"Connected to server at {self.server_host}:{self.server_port}")
+            self.log.info("Connected to server", host=self.server_host, port=self.server_port)
             return True
         except Exception as e:
-            print(f"Connection failed: {e}")
+            self.log.error("Connection failed", error=str(e))
             return False
 
     def register(self):
         if not self.client_socket:
-            print("Not connected to server")
+            self.log.error("Not connected to server")
             return False
 
-        register_msg = json.dumps({
+        register_msg = {
             "msgName": "register",
             "msgData": {
                 "playerId": self.player_id,
                 "playerName": self.player_id,
                 "team_name": self.team_name
             }
-        })
+        }
+        if self.match_id:
+            register_msg["msgData"]["matchId"] = self.match_id
+        if self.requested_codec is not JSON_CODEC:
+            register_msg["msgData"]["codec"] = self.requested_codec.name
 
         try:
-            self.client_socket.send(register_msg.encode())
-            print(f"Sent registration for team: {self.player_id}")
+            self.send_message(register_msg)
+            self.codec = self.requested_codec
+            self.log.info("Sent registration", codec=self.codec.name)
             self.registered = True
             return True
         except Exception as e:
-            print(f"Registration failed: {e}")
+            self.log.error("Registration failed", error=str(e))
             return False
 
     def start(self):
@@ -77,96 +113,221 @@ class GameClient:
     def receive_messages(self):
         while self.running:
             try:
-                data = self.client_socket.recv(4096)
+                data = self.client_socket.recv(65536)
                 if not data:
-                    print("Server disconnected")
+                    self.log.warning("Server disconnected")
+                    if self.reconnect():
+                        continue
                     self.shutdown()
                     return
 
                 try:
-                    message = json.loads(data.decode())
+                    frames = self.decoder.feed(data)
+                except FrameError as e:
+                    self.log.warning("Invalid frame", error=str(e))
+                    continue
+                for frame in frames:
+                    try:
+                        message = self.codec.decode(frame)
+                    except (json.JSONDecodeError, CodecError):
+                        self.log.warning("Received invalid message")
+                        continue
                     self.handle_message(message)
-                except json.JSONDecodeError:
-                    print("Received invalid JSON")
             except socket.error as e:
-                print(f"Socket error: {e}")
+                self.log.error("Socket error", error=str(e))
+                if self.reconnect():
+                    continue
                 self.shutdown()
                 return
 
+    def reconnect(self):
+        # 比赛进行中掉线时，在服务器的宽限期内反复重连，并凭令牌恢复会话
+        if not (self.running and self.game_active and self.token):
+            return False
+        if self.reconnect_deadline is None:
+            self.reconnect_deadline = time.monotonic() + self.reconnect_grace
+            self.reconnect_delay = 0.1
+        else:
+            # 上次连上后还没恢复就又断开，退避后再试
+            self.backoff()
+        while self.running and time.monotonic() < self.reconnect_deadline:
+            try:
+                sock = socket.create_connection((self.server_host, self.server_port), timeout=self.reconnect_delay)
+                sock.settimeout(None)
+                resume_msg = {
+                    "msgName": "resume",
+                    "msgData": {
+                        "playerId": self.player_id,
+                        "token": self.token,
+                        "seq": self.mirror.seq}
+                }
+                if self.match_id:
+                    resume_msg["msgData"]["matchId"] = self.match_id
+                if self.requested_codec is not JSON_CODEC:
+                    resume_msg["msgData"]["codec"] = self.requested_codec.name
+                with self.send_lock:
+                    # 恢复消息总是JSON，之后切回协商的编解码器
+                    sock.sendall(encode_frame(JSON_CODEC.encode(resume_msg), self.framing))
+                    old_socket = self.client_socket
+                    self.client_socket = sock
+                    self.decoder = FrameDecoder(self.framing)
+                    self.codec = self.requested_codec
+                old_socket.close()
+                self.log.info("Reconnected, resuming session", seq=self.mirror.seq)
+                return True
+            except OSError:
+                self.backoff()
+        self.log.error("Reconnect failed", grace=self.reconnect_grace)
+        return False
+
+    def backoff(self):
+        time.sleep(self.reconnect_delay)
+        self.reconnect_delay = min(self.reconnect_delay * 2, 1.0)
+
+    def send_message(self, message):
+        # 接收线程（补发请求）和决策线程（回合响应）都会发送
+        frame = encode_frame(self.codec.encode(message), self.framing)
+        with self.send_lock:
+            self.client_socket.sendall(frame)
+
     def handle_message(self, message):
         msg_name = message.get('msgName')
         msg_data = message.get('msgData')
-        print(f"Received message: {message}")
+        self.log.debug("Received message", msg=msg_name, data=msg_data)
 
-        if msg_name == "gamestart":
+        if msg_name == "registered":
+            self.token = msg_data.get('token')
+            self.reconnect_grace = msg_data.get('grace', 0)
+        elif msg_name == "resumed":
+            self.handle_resumed(msg_data)
+        elif msg_name == "gamestart":
             self.handle_gamestart(msg_data)
         elif msg_name == "inquiry":
             self.handle_inquiry(msg_data)
+        elif msg_name == "resync":
+            self.state = self.mirror.apply(msg_data)
+            if self.runner:
+                self.runner.update(msg_data)
         elif msg_name == "gameover":
             self.handle_gameover(msg_data)
 
     def handle_gamestart(self, msg_data):
+        self.setup_game(msg_data)
+        self.log.info("Game starting", max_rounds=self.max_rounds, side=self.side, stars=self.star_ids)
+        self.send_ready()
+
+    def setup_game(self, msg_data):
         self.game_active = True
         self.max_rounds = msg_data.get('max_rounds', 500)
-        print(f"Game starting! Max rounds: {self.max_rounds}")
+        self.side = msg_data.get('side')
+        self.star_ids = msg_data.get('stars', [])
+        self.round_timeout = msg_data.get('round_timeout', self.round_timeout)
+        self.mirror = StateMirror(self.player_id, self.star_ids)
+        self.bot.setup(self.player_id, self.side, self.star_ids)
+        if self.runner:
+            self.runner.stop()
+        self.runner = DecisionRunner(self.bot, self.send_response, self.decision_mode, self.log)
+
+    def handle_resumed(self, msg_data):
+        if not msg_data.get('accepted'):
+            self.log.error("Resume rejected by server")
+            self.token = None
+            return
+        self.reconnect_deadline = None
+        self.log.info("Session resumed", round=msg_data.get('round'))
+        if self.runner is None:
+            self.setup_game(msg_data)
+        if not msg_data.get('started'):
+            # 掉线时回合还没开始，准备消息可能丢失，重新发送
+            self.send_ready()
 
+    def send_ready(self):
         # 发送准备消息
-        ready_msg = json.dumps({
+        ready_msg = {
             "msgName": "gameready",
             "msgData": {
                 "playerId": self.player_id,
                 "status": "ready"}
-        })
+        }
 
         try:
-            self.client_socket.send(ready_msg.encode())
-            print("Sent gameready message")
+            self.send_message(ready_msg)
+            self.log.debug("Sent gameready")
         except Exception as e:
-            print(f"Failed to send gameready: {e}")
+            self.log.error("Failed to send gameready", error=str(e))
 
     def handle_inquiry(self, msg_data):
         if not self.game_active:
             return
 
+        received = time.monotonic()
         self.current_round = msg_data.get('round', 0)
-        print(f"Round {self.current_round} inquiry received")
+        self.inquiry_received = {self.current_round: received}
+        self.state = self.mirror.apply(msg_data)
+        if self.state is None:
+            # 丢失了增量，请求服务器补发完整状态；本回合没有可用状态，直接按兜底答案响应
+            self.request_resync()
+            self.runner.update(msg_data)
+            self.send_response(self.current_round, self.bot.fallback(None))
+            return
 
-        # 模拟游戏逻辑：生成随机响应
-        response_data = {
-            "move": random.choice(["up", "down", "left", "right"]),
-            "score": random.randint(1, 100)
-        }
+        # 机器人在后台按同一条消息更新自己的镜像再思考，截止时间按服务器的回合超时减去余量计算；
+        # 接收线程继续读socket
+        deadline = received + max(self.round_timeout - self.margin, 0)
+        self.runner.submit(self.current_round, msg_data, deadline, self.state)
 
-        # 发送响应消息
-        response_msg = json.dumps({
+    def send_response(self, round_no, actions):
+        received = self.inquiry_received.get(round_no)
+        response_msg = {
             "msgName": "response",
             "msgData": {
                 "playerId": self.player_id,
-                "round": self.current_round,
-                "data": response_data}
-        })
+                "round": round_no,
+                "data": {"actions": actions}}
+        }
+        if received is not None:
+            # 收到查询到发出响应的耗时，服务器据此区分思考时间和网络耗时
+            response_msg["msgData"]["thinkTime"] = round(time.monotonic() - received, 6)
+
+        try:
+            self.send_message(response_msg)
+            self.log.debug("Sent response", round=round_no, actions=len(actions))
+        except Exception as e:
+            self.log.error("Failed to send response", round=round_no, error=str(e))
 
+    def request_resync(self):
         try:
-            self.client_socket.send(response_msg.encode())
-            print(f"Sent response for round {self.current_round}")
+            self.send_message({
+                "msgName": "resync",
+                "msgData": {
+                    "playerId": self.player_id,
+                    "seq": self.mirror.seq}
+            })
         except Exception as e:
-            print(f"Failed to send response: {e}")
+            self.log.error("Failed to request resync", error=str(e))
 
     def handle_gameover(self, msg_data):
         reason = msg_data.get('reason', "unknown")
         total_rounds = msg_data.get('total_rounds', 0)
-        print(f"Game over: {reason}. Total rounds: {total_rounds}")
+        self.log.info("Game over", reason=reason, rounds=total_rounds, score=msg_data.get('score', {}))
+        if msg_data.get('rematch'):
+            # 服务器原地重置后会重新发送gamestart，保持连接等待重赛
+            self.game_active = False
+            self.reconnect_deadline = None
+            return
         self.shutdown()
 
     def shutdown(self):
         self.running = False
         self.game_active = False
+        if self.runner:
+            self.runner.stop()
         if self.client_socket:
             try:
                 self.client_socket.close()
             finally:
                 pass
-        print("Client shutdown")
+        self.log.info("Client shutdown")
         sys.exit(0)
 
 
@@ -175,13 +336,39 @@ if __name__ == "__main__":
     parser.add_argument('-s', '--server', default='127.0.0.1', help='Server IP (default: 127.0.0.1)')
     parser.add_argument('-p', '--port', type=int, default=6001, help='Server port (default: 6001)')
     parser.add_argument('-i', '--id', required=True, help='Team ID')
+    parser.add_argument('-f', '--framing', choices=FRAMING_MODES, default='length',
+                        help='Wire framing: length, line or raw (default: length)')
+    parser.add_argument('-m', '--match', help='Match ID when connecting to a multi-match server')
+    parser.add_argument('-b', '--bot', default='bots:RandomBot',
+                        help='Bot class as module:Class (default: bots:RandomBot)')
+    parser.add_argument('-d', '--decision-mode', choices=DECISION_MODES, default='thread',
+                        help='Run the bot in a worker thread or process (default: thread)')
+    parser.add_argument('--margin', type=float, default=0.1,
+                        help='Seconds before the server deadline to send the best answer (default: 0.1)')
+    parser.add_argument('-t', '--team', default='A', help='Roster to play with (default: A)')
+    add_log_arguments(parser)
+    parser.add_argument('-e', '--codec', choices=sorted(CODECS), default='json',
+                        help='Message codec negotiated at registration (default: json)')
 
     args = parser.parse_args()
 
+    if args.framing not in CODECS[args.codec].framings:
+        print(f"Error: the {args.codec} codec only supports {', '.join(CODECS[args.codec].framings)} framing")
+        sys.exit(1)
+
+    setup_logging_from_args(args)
+
     client = GameClient(
         server_host=args.server,
         server_port=args.port,
-        player_id=args.id
+        player_id=args.id,
+        framing=args.framing,
+        match_id=args.match,
+        codec=args.codec,
+        bot=load_bot(args.bot),
+        decision_mode=args.decision_mode,
+        margin=args.margin,
+        team_name=args.team
     )
 
     client.start()
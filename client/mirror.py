@@ -0,0 +1,151 @@
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.delta import DeltaDecoder
+from common.spatial import SpatialIndex
+from config.game_config import GameConfig
+
+# 动作 -> 目标是否为队友；传球找队友，抢断/铲球找对手
+TARGET_TEAMMATES = {"shortPass": True, "longPass": True, "steal": False, "slide": False}
+
+
+def distance(x1, y1, x2, y2):
+    return max(abs(x1 - x2), abs(y1 - y2))
+
+
+class StateMirror(DeltaDecoder):
+    # 客户端本地的比赛状态：按服务器的关键帧/增量逐条更新，并缓存机器人常用的派生查询。
+    # 每次更新只让移动过的球员（及受其影响的查询）失效，没动的球员直接复用上回合的结果
+    def __init__(self, player_id, star_ids=()):
+        super().__init__()
+        self.player_id = player_id
+        self.own = frozenset(star_ids)
+        self.index = SpatialIndex()
+        self.ball_pos = None
+        self.moved = frozenset()  # 最近一次更新中位置变化的球员
+        self.ball_distances = {}  # star_id -> 到球的距离
+        self.targets_cache = {}  # (star_id, 动作) -> [(star_id, 距离)]
+        self.nearest_cache = {}  # 是否己方 -> (star_id, 距离)
+
+    def apply(self, message):
+        state = super().apply(message)
+        if state is None:
+            return None
+        keyframe = message.get("keyframe")
+        self.refresh(state, state["stars"] if keyframe else message["delta"].get("stars", {}), keyframe)
+        return state
+
+    def refresh(self, state, changed, keyframe=False):
+        moved = {}  # star_id -> 移动前的位置
+        index = self.index
+        stars = state["stars"]
+        for key in changed:
+            fields = stars[key]
+            star_id = int(key)
+            old = index.position(star_id)
+            if old != (fields["x"], fields["y"]):
+                moved[star_id] = old
+                index.update(star_id, fields["x"], fields["y"], self.player_id if star_id in self.own else None)
+        if keyframe:
+            for star_id in [star_id for star_id in index.positions if str(star_id) not in stars]:
+                moved[star_id] = index.position(star_id)
+                index.remove(star_id)
+        ball = state["ball"]
+        ball_pos = (ball["x"], ball["y"])
+        ball_moved = ball_pos != self.ball_pos
+        self.ball_pos = ball_pos
+        self.moved = frozenset(moved)
+        self.invalidate(moved, ball_moved)
+
+    def invalidate(self, moved, ball_moved):
+        if ball_moved:
+            self.ball_distances.clear()
+        else:
+            for star_id in moved:
+                self.ball_distances.pop(star_id, None)
+        if moved or ball_moved:
+            self.nearest_cache.clear()
+        if not moved:
+            return
+        # 没动的球员，只有当某个移动的球员移动前或移动后落在其查询半径内时才需要重算
+        for key in list(self.targets_cache):
+            star_id, action = key
+            if star_id in moved:
+                del self.targets_cache[key]
+                continue
+            x, y = self.index.position(star_id)
+            radius = GameConfig.ACTION_RANGE[action][1]
+            for other, old in moved.items():
+                new = self.index.position(other)
+                if (old is not None and distance(x, y, *old) <= radius) or \
+                        (new is not None and distance(x, y, *new) <= radius):
+                    del self.targets_cache[key]
+                    break
+
+    @property
+    def ball(self):
+        return self.state["ball"]
+
+    def star(self, star_id):
+        return self.state["stars"].get(str(star_id))
+
+    def position(self, star_id):
+        return self.index.position(star_id)
+
+    def is_own(self, star_id):
+        return star_id in self.own
+
+    def own_stars(self):
+        return sorted(star_id for star_id in self.own if star_id in self.index.positions)
+
+    def opponent_stars(self):
+        return sorted(star_id for star_id in self.index.positions if star_id not in self.own)
+
+    def holder(self):
+        # 持球球员编号，球在空中或无人持有时为None
+        ball = self.state["ball"]
+        return ball["starId"] if ball["status"] == "hold" else None
+
+    def ball_distance(self, star_id):
+        found = self.ball_distances.get(star_id)
+        if found is None:
+            pos = self.index.position(star_id)
+            if pos is None:
+                return None
+            found = self.ball_distances[star_id] = distance(*pos, *self.ball_pos)
+        return found
+
+    def targets(self, star_id, action):
+        # 该球员做此动作时有效距离内的目标：传球为队友，抢断/铲球为对手，返回 [(star_id, 距离)]，按距离排序
+        key = (star_id, action)
+        found = self.targets_cache.get(key)
+        if found is None:
+            pos = self.index.position(star_id)
+            if pos is None:
+                return []
+            low, high = GameConfig.ACTION_RANGE[action]
+            own = star_id in self.own
+            if TARGET_TEAMMATES[action] == own:
+                found = self.index.within(*pos, high, low, team=self.player_id)
+            else:
+                found = self.index.within(*pos, high, low, exclude_team=self.player_id)
+            found = self.targets_cache[key] = [(other, dist) for other, dist in found if other != star_id]
+        return found
+
+    def pass_targets(self, star_id, action="shortPass"):
+        return self.targets(star_id, action)
+
+    def tackle_targets(self, star_id, action="steal"):
+        return self.targets(star_id, action)
+
+    def nearest_to_ball(self, own=True):
+        # 己方（或对方）离球最近的球员，返回 (star_id, 距离)
+        found = self.nearest_cache.get(own)
+        if found is None and self.ball_pos is not None:
+            if own:
+                found = self.index.nearest(*self.ball_pos, team=self.player_id)
+            else:
+                found = self.index.nearest(*self.ball_pos, exclude_team=self.player_id)
+            self.nearest_cache[own] = found
+        return found
@@ -0,0 +1,313 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bots import load_bot
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.codec import CODECS, JSON_CODEC, CodecError
+from common.framing import FRAMING_MODES, FrameDecoder, FrameError, encode_frame
+from common.log import add_log_arguments, get_logger, setup_logging_from_args
+
+
+def decide_batch(jobs):
+    # 决策线程：先把各会话积压的消息应用到机器人自己的镜像，再按机器人类别分组，每组调用一次decide_batch。
+    # 返回与jobs一一对应的 (回合, 动作)，动作为None表示镜像缺了增量或应用消息出错，需要补发关键帧；以及出错的机器人类别
+    results = [None] * len(jobs)
+    groups = {}
+    errors = []
+    for index, (bot, messages, round_no, deadline) in enumerate(jobs):
+        state = None
+        try:
+            for kind, payload in messages:
+                if kind == "setup":
+                    bot.setup(*payload)
+                    state = None
+                else:
+                    state = bot.observe(payload)
+        except Exception as e:
+            errors.append((type(bot).__name__, repr(e)))
+            state = None
+        if state is None:
+            results[index] = (round_no, None)
+            continue
+        groups.setdefault(type(bot), []).append((index, bot, state, deadline))
+    for bot_class, items in groups.items():
+        bots = [bot for _, bot, _, _ in items]
+        states = [state for _, _, state, _ in items]
+        try:
+            answers = bot_class.decide_batch(bots, states, min(deadline for _, _, _, deadline in items))
+        except Exception as e:
+            errors.append((bot_class.__name__, repr(e)))
+            answers = [bot.fallback(state) for bot, state in zip(bots, states)]
+        for (index, _, _, _), actions in zip(items, answers):
+            results[index] = (jobs[index][2], actions)
+    return results, errors
+
+
+class Session:
+    # 多路客户端中的一个队伍：一条连接、一个机器人实例。
+    # 机器人的镜像只在决策线程里更新，事件循环只负责收发和截止时间
+    def __init__(self, client, player_id, match_id, bot):
+        self.client = client
+        self.player_id = player_id
+        self.match_id = match_id
+        self.bot = bot
+        self.codec = JSON_CODEC  # 注册消息总是JSON，之后切换到协商的编解码器
+        self.writer = None
+        self.messages = []  # 尚未交给机器人的 (类别, 数据)，下一批决策时统一应用
+        self.round_no = None  # 等待作答的回合
+        self.received = None
+        self.deadline = None
+        self.answered = True
+        self.timer = None
+        self.round_timeout = 0.5
+        self.completed = 0
+        self.log = get_logger("client", team=player_id, **({"match": match_id} if match_id else {}))
+
+    async def run(self):
+        client = self.client
+        try:
+            reader, self.writer = await asyncio.open_connection(client.server_host, client.server_port)
+        except OSError as e:
+            self.log.error("Connection failed", error=str(e))
+            return
+        msg_data = {"playerId": self.player_id, "playerName": self.player_id, "team_name": client.team_name}
+        if self.match_id:
+            msg_data["matchId"] = self.match_id
+        if client.codec is not JSON_CODEC:
+            msg_data["codec"] = client.codec.name
+        self.send({"msgName": "register", "msgData": msg_data})
+        self.codec = client.codec
+        decoder = FrameDecoder(client.framing)
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    self.log.warning("Server disconnected")
+                    return
+                try:
+                    frames = decoder.feed(data)
+                except FrameError as e:
+                    self.log.warning("Invalid frame", error=str(e))
+                    continue
+                for frame in frames:
+                    try:
+                        message = self.codec.decode(frame)
+                    except (json.JSONDecodeError, CodecError):
+                        self.log.warning("Received invalid message")
+                        continue
+                    if not self.handle_message(message):
+                        return
+        except ConnectionError as e:
+            self.log.error("Socket error", error=str(e))
+        finally:
+            if self.timer:
+                self.timer.cancel()
+            self.writer.close()
+
+    def send(self, message):
+        self.writer.write(encode_frame(self.codec.encode(message), self.client.framing))
+
+    def handle_message(self, message):
+        msg_name = message.get('msgName')
+        msg_data = message.get('msgData') or {}
+        self.log.debug("Received message", msg=msg_name)
+
+        if msg_name == "gamestart":
+            self.round_timeout = msg_data.get('round_timeout', self.round_timeout)
+            self.messages.append(("setup", (self.player_id, msg_data.get('side'), msg_data.get('stars', []))))
+            self.log.info("Game starting", side=msg_data.get('side'), stars=msg_data.get('stars'))
+            self.send({"msgName": "gameready", "msgData": {"playerId": self.player_id, "status": "ready"}})
+        elif msg_name == "inquiry":
+            self.handle_inquiry(msg_data)
+        elif msg_name == "resync":
+            self.messages.append(("observe", msg_data))
+        elif msg_name == "gameover":
+            self.log.info("Game over", reason=msg_data.get('reason'), rounds=msg_data.get('total_rounds'),
+                          score=msg_data.get('score', {}))
+            self.completed += 1
+            # 重赛时保持连接，等待新的gamestart
+            return bool(msg_data.get('rematch'))
+        return True
+
+    def handle_inquiry(self, msg_data):
+        if not self.answered:
+            # 新回合取代还没答完的旧回合，旧回合按兜底答案发出
+            self.respond(self.round_no, [])
+        self.round_no = msg_data.get('round', 0)
+        self.received = time.monotonic()
+        self.deadline = self.received + max(self.round_timeout - self.client.margin, 0)
+        self.answered = False
+        self.messages.append(("observe", msg_data))
+        # 机器人按deadline作答，批次结果回到事件循环还要一点时间；兜底计时器推迟到余量的一半，只处理超时的批次
+        expires = self.received + max(self.round_timeout - self.client.margin / 2, 0)
+        self.timer = self.client.loop.call_at(expires, self.expire, self.round_no)
+        self.client.request_decision(self)
+
+    def take_messages(self):
+        messages, self.messages = self.messages, []
+        return messages
+
+    def expire(self, round_no):
+        # 批次超时还没算完，先发全员nope，之后算出的结果丢弃。
+        # 事件循环里不调用机器人的方法：决策线程可能正在修改它
+        self.timer = None
+        if round_no == self.round_no and not self.answered:
+            self.client.expired += 1
+            self.log.debug("Deadline reached before the batch finished", round=round_no)
+            self.respond(round_no, [])
+
+    def respond(self, round_no, actions):
+        if round_no != self.round_no or self.answered or self.writer.is_closing():
+            return
+        self.answered = True
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+        self.send({
+            "msgName": "response",
+            "msgData": {
+                "playerId": self.player_id,
+                "round": round_no,
+                "data": {"actions": actions},
+                "thinkTime": round(time.monotonic() - self.received, 6)}
+        })
+
+    def request_resync(self):
+        # 服务器总是回复关键帧，不需要序号；镜像归决策线程所有，事件循环不读取它
+        if not self.writer.is_closing():
+            self.send({"msgName": "resync", "msgData": {"playerId": self.player_id}})
+
+
+class MultiClient:
+    # 单进程驱动多支队伍：所有连接由一个事件循环处理，所有待答的查询合并成批交给一个决策线程。
+    # 上一批还在计算时到达的查询排队，下一批一次取走，因此负载越高批次越大
+    def __init__(self, server_host, server_port, team_ids, matches=0, match_prefix="match", framing="length",
+                 codec="json", bot="bots:RandomBot", margin=0.1, team_name="A"):
+        self.server_host = server_host
+        self.server_port = server_port
+        self.team_ids = team_ids
+        self.matches = matches  # 0表示连接单场比赛的服务器，否则在多比赛服务器上开这么多场
+        self.match_prefix = match_prefix
+        self.framing = framing
+        self.codec = CODECS[codec]
+        self.bot_spec = bot
+        self.margin = margin
+        self.team_name = team_name
+        self.loop = None
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.waiting = {}  # 等待决策的会话，按到达顺序
+        self.wakeup = None
+        self.batches = 0
+        self.decisions = 0
+        self.largest_batch = 0
+        self.expired = 0
+        self.log = get_logger("multi")
+
+    def sessions(self):
+        if not self.matches:
+            return [Session(self, player_id, None, load_bot(self.bot_spec)) for player_id in self.team_ids]
+        return [Session(self, player_id, f"{self.match_prefix}{i}", load_bot(self.bot_spec))
+                for i in range(self.matches) for player_id in self.team_ids]
+
+    def start(self):
+        try:
+            asyncio.run(self.run())
+        except KeyboardInterrupt:
+            self.log.info("Client shutdown")
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+        sessions = self.sessions()
+        self.log.info("Starting sessions", sessions=len(sessions), matches=self.matches or 1, bot=self.bot_spec)
+        batcher = self.loop.create_task(self.batch_loop())
+        started = time.perf_counter()
+        try:
+            await asyncio.gather(*(session.run() for session in sessions))
+        finally:
+            batcher.cancel()
+            self.executor.shutdown(wait=False)
+        self.log.info("All sessions finished", sessions=len(sessions),
+                      completed=sum(session.completed for session in sessions),
+                      seconds=round(time.perf_counter() - started, 2), batches=self.batches,
+                      mean_batch=round(self.decisions / self.batches, 1) if self.batches else 0,
+                      largest_batch=self.largest_batch, expired=self.expired)
+
+    def request_decision(self, session):
+        self.waiting[session] = None
+        self.wakeup.set()
+
+    async def batch_loop(self):
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            if not self.waiting:
+                continue
+            sessions = list(self.waiting)
+            self.waiting.clear()
+            jobs = [(session.bot, session.take_messages(), session.round_no, session.deadline) for session in sessions]
+            try:
+                results, errors = await self.loop.run_in_executor(self.executor, decide_batch, jobs)
+            except Exception as e:
+                # 批次整体失败也不能让循环退出，否则之后所有回合都只剩兜底答案
+                self.log.error("Decision batch failed", sessions=len(jobs), error=repr(e))
+                results, errors = [(session.round_no, None) for session in sessions], []
+            self.batches += 1
+            self.decisions += len(jobs)
+            self.largest_batch = max(self.largest_batch, len(jobs))
+            for bot_class, error in errors:
+                self.log.warning("Bot raised an error", bot=bot_class, error=error)
+            for session, (round_no, actions) in zip(sessions, results):
+                if actions is None:
+                    # 机器人的镜像缺了增量或应用消息出错，请求补发关键帧；本回合全员nope
+                    session.request_resync()
+                    actions = []
+                session.respond(round_no, actions)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Multiplexed Game Client: many bot sessions in one process')
+    parser.add_argument('-s', '--server', default='127.0.0.1', help='Server IP (default: 127.0.0.1)')
+    parser.add_argument('-p', '--port', type=int, default=6001, help='Server port (default: 6001)')
+    parser.add_argument('-i', '--ids', required=True, help='Comma-separated team IDs to play in each match')
+    parser.add_argument('-n', '--matches', type=int, default=0,
+                        help='Matches to open on a multi-match server (default: 0, join the single-match server)')
+    parser.add_argument('-m', '--match-prefix', default='match',
+                        help='Match ID prefix; matches are named PREFIX0, PREFIX1, ... (default: match)')
+    parser.add_argument('-f', '--framing', choices=FRAMING_MODES, default='length',
+                        help='Wire framing: length, line or raw (default: length)')
+    parser.add_argument('-b', '--bot', default='bots:RandomBot',
+                        help='Bot class as module:Class, one instance per team (default: bots:RandomBot)')
+    parser.add_argument('--margin', type=float, default=0.1,
+                        help='Seconds before the server deadline to send the best answer (default: 0.1)')
+    parser.add_argument('-t', '--team', default='A', help='Roster to play with (default: A)')
+    add_log_arguments(parser)
+    parser.add_argument('-e', '--codec', choices=sorted(CODECS), default='json',
+                        help='Message codec negotiated at registration (default: json)')
+
+    args = parser.parse_args()
+
+    if args.framing not in CODECS[args.codec].framings:
+        print(f"Error: the {args.codec} codec only supports {', '.join(CODECS[args.codec].framings)} framing")
+        sys.exit(1)
+
+    setup_logging_from_args(args)
+
+    MultiClient(
+        server_host=args.server,
+        server_port=args.port,
+        team_ids=args.ids.split(','),
+        matches=args.matches,
+        match_prefix=args.match_prefix,
+        framing=args.framing,
+        codec=args.codec,
+        bot=args.bot,
+        margin=args.margin,
+        team_name=args.team
+    ).start()
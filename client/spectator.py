@@ -0,0 +1,112 @@
+import argparse
+import json
+import os
+import socket
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.codec import CODECS, JSON_CODEC, CodecError
+from common.delta import DeltaDecoder
+from common.framing import FRAMING_MODES, FrameDecoder, FrameError, encode_frame
+from common.log import add_log_arguments, get_logger, setup_logging_from_args
+
+
+class Spectator:
+    # 观战客户端：订阅一场比赛的状态流，按关键帧/增量重建状态，输出比分变化
+    def __init__(self, server_host, server_port, name="spectator", framing="length", match_id=None, codec="json"):
+        self.server_host = server_host
+        self.server_port = server_port
+        self.name = name
+        self.match_id = match_id
+        self.framing = framing
+        self.decoder = FrameDecoder(framing)
+        self.codec = CODECS[codec]  # 在收到spectating回复之前按请求的编解码器解码，之后换成服务器实际采用的
+        self.delta = DeltaDecoder()
+        self.state = None
+        self.rounds_seen = 0
+        self.skipped = 0  # 服务器因本端落后而跳过的回合数
+        self.log = get_logger("spectator", spectator=name, **({"match": match_id} if match_id else {}))
+
+    def run(self):
+        sock = socket.create_connection((self.server_host, self.server_port))
+        msg_data = {"spectatorId": self.name}
+        if self.match_id:
+            msg_data["matchId"] = self.match_id
+        if self.codec is not JSON_CODEC:
+            msg_data["codec"] = self.codec.name
+        sock.sendall(encode_frame(JSON_CODEC.encode({"msgName": "spectate", "msgData": msg_data}), self.framing))
+        try:
+            while True:
+                data = sock.recv(65536)
+                if not data:
+                    self.log.warning("Server disconnected")
+                    return
+                try:
+                    frames = self.decoder.feed(data)
+                except FrameError as e:
+                    self.log.warning("Invalid frame", error=str(e))
+                    continue
+                for frame in frames:
+                    try:
+                        message = self.codec.decode(frame)
+                    except (json.JSONDecodeError, CodecError):
+                        self.log.warning("Received invalid message")
+                        continue
+                    if not self.handle_message(message):
+                        return
+        finally:
+            sock.close()
+
+    def handle_message(self, message):
+        msg_name = message.get('msgName')
+        msg_data = message.get('msgData') or {}
+        if msg_name == "spectating":
+            # 之后的状态流按回复中服务器采用的编解码器解码（不支持的组合服务器会直接断开）
+            codec = CODECS.get(msg_data.get('codec'))
+            if codec is not None:
+                self.codec = codec
+            self.log.info("Spectating", teams=msg_data.get('teams'), round=msg_data.get('round'), codec=self.codec.name)
+        elif msg_name == "watch":
+            prev = self.state["round"] if self.state else None
+            prev_score = dict(self.state["score"]) if self.state else None
+            self.state = self.delta.apply(msg_data)
+            if self.state is None:
+                return True
+            self.rounds_seen += 1
+            if prev is not None and self.state["round"] > prev + 1:
+                self.skipped += self.state["round"] - prev - 1
+            if prev_score is not None and self.state["score"] != prev_score:
+                self.log.info("Goal", round=self.state["round"], score=self.state["score"])
+            self.log.debug("Round", round=self.state["round"], ball=self.state["ball"])
+        elif msg_name == "gameover":
+            self.log.info("Game over", reason=msg_data.get('reason'), rounds=msg_data.get('total_rounds'),
+                          score=msg_data.get('score'), seen=self.rounds_seen, skipped=self.skipped)
+            # 重赛时服务器会接着推送新一场的关键帧
+            return bool(msg_data.get('rematch'))
+        return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Game Spectator')
+    parser.add_argument('-s', '--server', default='127.0.0.1', help='Server IP (default: 127.0.0.1)')
+    parser.add_argument('-p', '--port', type=int, default=6001, help='Server port (default: 6001)')
+    parser.add_argument('-n', '--name', default='spectator', help='Spectator name shown in server logs')
+    parser.add_argument('-f', '--framing', choices=FRAMING_MODES, default='length',
+                        help='Wire framing: length, line or raw (default: length)')
+    parser.add_argument('-m', '--match', help='Match ID when watching a multi-match server')
+    parser.add_argument('-e', '--codec', choices=sorted(CODECS), default='json',
+                        help='Message codec for the state stream (default: json)')
+    add_log_arguments(parser)
+
+    args = parser.parse_args()
+
+    if args.framing not in CODECS[args.codec].framings:
+        print(f"Error: the {args.codec} codec only supports {', '.join(CODECS[args.codec].framings)} framing")
+        sys.exit(1)
+
+    setup_logging_from_args(args)
+
+    try:
+        Spectator(args.server, args.port, args.name, args.framing, args.match, args.codec).run()
+    except KeyboardInterrupt:
+        pass
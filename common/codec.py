@@ -0,0 +1,212 @@
+import json
+import struct
+
+from config.game_config import GameConfig
+
+# 二进制编码：首字节为消息类型
+#   0 - 其他消息，后接JSON
+#   1 - inquiry，2 - response，3 - resync，4 - watch（观战状态，与inquiry同布局）
+TAG_JSON = 0
+TAG_INQUIRY = 1
+TAG_RESPONSE = 2
+TAG_RESYNC = 3
+TAG_WATCH = 4
+STATE_TAGS = {"inquiry": TAG_INQUIRY, "resync": TAG_RESYNC, "watch": TAG_WATCH}
+STATE_NAMES = {tag: name for name, tag in STATE_TAGS.items()}
+
+# 状态消息头：回合、序号、标志位（bit0关键帧）、包含的部分（bit0球、bit1比分）
+STATE_HEADER = struct.Struct("!HIBB")
+BALL = struct.Struct("!BhhbB")
+PASS = struct.Struct("!hhhhHH")
+STAR_HEADER = struct.Struct("!BB")
+STAR_FIELDS = (("x", struct.Struct("!h")), ("y", struct.Struct("!h")), ("stamina", struct.Struct("!i")),
+               ("state", struct.Struct("!B")), ("cd", struct.Struct("!B")))
+RESPONSE_HEADER = struct.Struct("!HB")
+ACTION = struct.Struct("!BBhh")
+U8 = struct.Struct("!B")
+U16 = struct.Struct("!H")
+THINK_TIME = struct.Struct("!I")  # 可选的响应尾部：客户端思考时间（微秒）
+
+BALL_STATUS = ("stand", "hold", "pass")
+STAR_STATES = ("normal", "stun")
+ACTIONS = GameConfig.ACTION_TYPES
+
+
+class CodecError(Exception):
+    pass
+
+
+class JsonCodec:
+    name = "json"
+    framings = ("length", "line", "raw")  # 可搭配的分帧模式
+
+    def encode(self, message):
+        return json.dumps(message).encode()
+
+    def decode(self, payload):
+        return json.loads(payload)
+
+
+class BinaryCodec:
+    name = "binary"
+    framings = ("length",)  # 负载可能含换行符，也不是JSON，只能按长度前缀分帧
+
+    def encode(self, message):
+        msg_name = message.get("msgName")
+        msg_data = message.get("msgData") or {}
+        try:
+            if msg_name in STATE_TAGS and ("state" in msg_data or "delta" in msg_data):
+                return U8.pack(STATE_TAGS[msg_name]) + self.encode_state_message(msg_data)
+            if msg_name == "response" and set(msg_data.get("data") or {}) <= {"actions"}:
+                return U8.pack(TAG_RESPONSE) + self.encode_response(msg_data)
+        except (struct.error, KeyError, ValueError, TypeError):
+            # 超出固定布局的消息退回JSON
+            pass
+        return U8.pack(TAG_JSON) + json.dumps(message).encode()
+
+    def decode(self, payload):
+        if payload[:1] == b"{":
+            # 握手阶段的消息仍是纯JSON
+            return json.loads(payload)
+        if not payload:
+            raise CodecError("Empty payload")
+        tag = payload[0]
+        try:
+            if tag == TAG_JSON:
+                return json.loads(payload[1:])
+            if tag in STATE_NAMES:
+                return {"msgName": STATE_NAMES[tag], "msgData": self.decode_state_message(payload, 1)}
+            if tag == TAG_RESPONSE:
+                return {"msgName": "response", "msgData": self.decode_response(payload, 1)}
+        except (struct.error, IndexError, UnicodeDecodeError) as e:
+            raise CodecError(f"Malformed binary message: {e}")
+        raise CodecError(f"Unknown message tag: {tag}")
+
+    # ---- 状态消息 ----
+
+    def encode_state_message(self, msg_data):
+        keyframe = bool(msg_data.get("keyframe"))
+        state = msg_data["state"] if keyframe else msg_data["delta"]
+        sections = ("ball" in state) | (("score" in state) << 1)
+        parts = [STATE_HEADER.pack(msg_data.get("round", state["round"]), msg_data.get("seq", 0), keyframe,
+                                   sections)]
+        if "ball" in state:
+            parts.append(self.encode_ball(state["ball"]))
+        if "score" in state:
+            score = state["score"]
+            parts.append(U8.pack(len(score)))
+            for player_id, goals in score.items():
+                parts.append(pack_str(player_id) + U16.pack(goals))
+        stars = state.get("stars", {})
+        parts.append(U8.pack(len(stars)))
+        for star_id, fields in stars.items():
+            mask = 0
+            body = []
+            for bit, (key, fmt) in enumerate(STAR_FIELDS):
+                if key in fields:
+                    mask |= 1 << bit
+                    value = fields[key]
+                    if key == "state":
+                        value = STAR_STATES.index(value)
+                    body.append(fmt.pack(value))
+            parts.append(STAR_HEADER.pack(int(star_id), mask))
+            parts.extend(body)
+        return b"".join(parts)
+
+    def decode_state_message(self, payload, offset):
+        round_no, seq, keyframe, sections = STATE_HEADER.unpack_from(payload, offset)
+        offset += STATE_HEADER.size
+        state = {"round": round_no}
+        if sections & 1:
+            state["ball"], offset = self.decode_ball(payload, offset)
+        if sections & 2:
+            (count,) = U8.unpack_from(payload, offset)
+            offset += 1
+            score = {}
+            for _ in range(count):
+                player_id, offset = unpack_str(payload, offset)
+                (score[player_id],) = U16.unpack_from(payload, offset)
+                offset += U16.size
+            state["score"] = score
+        (count,) = U8.unpack_from(payload, offset)
+        offset += 1
+        stars = {}
+        for _ in range(count):
+            star_id, mask = STAR_HEADER.unpack_from(payload, offset)
+            offset += STAR_HEADER.size
+            fields = {}
+            for bit, (key, fmt) in enumerate(STAR_FIELDS):
+                if mask & (1 << bit):
+                    (value,) = fmt.unpack_from(payload, offset)
+                    offset += fmt.size
+                    fields[key] = STAR_STATES[value] if key == "state" else value
+            stars[str(star_id)] = fields
+        if stars or keyframe:
+            state["stars"] = stars
+        msg_data = {"round": round_no, "seq": seq, "keyframe": bool(keyframe)}
+        msg_data["state" if keyframe else "delta"] = state
+        return msg_data
+
+    def encode_ball(self, ball):
+        pass_info = ball.get("pass")
+        data = BALL.pack(BALL_STATUS.index(ball["status"]), ball["x"], ball["y"], ball["starId"],
+                         pass_info is not None)
+        data += pack_str("" if ball["playerId"] == -1 else ball["playerId"])
+        if pass_info is not None:
+            data += PASS.pack(pass_info["sx"], pass_info["sy"], pass_info["tx"], pass_info["ty"],
+                              pass_info["begin"], pass_info["end"])
+        return data
+
+    def decode_ball(self, payload, offset):
+        status, x, y, star_id, has_pass = BALL.unpack_from(payload, offset)
+        offset += BALL.size
+        player_id, offset = unpack_str(payload, offset)
+        ball = {"status": BALL_STATUS[status], "x": x, "y": y, "playerId": player_id or -1, "starId": star_id,
+                "pass": None}
+        if has_pass:
+            sx, sy, tx, ty, begin, end = PASS.unpack_from(payload, offset)
+            offset += PASS.size
+            ball["pass"] = {"sx": sx, "sy": sy, "tx": tx, "ty": ty, "begin": begin, "end": end}
+        return ball, offset
+
+    # ---- 回合响应 ----
+
+    def encode_response(self, msg_data):
+        actions = (msg_data.get("data") or {}).get("actions") or []
+        parts = [pack_str(msg_data["playerId"]), RESPONSE_HEADER.pack(msg_data.get("round", 0), len(actions))]
+        for action in actions:
+            parts.append(ACTION.pack(action["starId"], ACTIONS.index(action["action"]), action.get("x", -1),
+                                     action.get("y", -1)))
+        think_time = msg_data.get("thinkTime")
+        if think_time is not None:
+            parts.append(THINK_TIME.pack(min(max(int(think_time * 1e6), 0), 0xFFFFFFFF)))
+        return b"".join(parts)
+
+    def decode_response(self, payload, offset):
+        player_id, offset = unpack_str(payload, offset)
+        round_no, count = RESPONSE_HEADER.unpack_from(payload, offset)
+        offset += RESPONSE_HEADER.size
+        actions = []
+        for _ in range(count):
+            star_id, action, x, y = ACTION.unpack_from(payload, offset)
+            offset += ACTION.size
+            actions.append({"starId": star_id, "action": ACTIONS[action], "x": x, "y": y})
+        msg_data = {"playerId": player_id, "round": round_no, "data": {"actions": actions}}
+        if offset + THINK_TIME.size <= len(payload):
+            msg_data["thinkTime"] = THINK_TIME.unpack_from(payload, offset)[0] / 1e6
+        return msg_data
+
+
+def pack_str(value):
+    data = str(value).encode()
+    return U8.pack(len(data)) + data
+
+
+def unpack_str(payload, offset):
+    (size,) = U8.unpack_from(payload, offset)
+    offset += 1
+    return bytes(payload[offset:offset + size]).decode(), offset + size
+
+
+JSON_CODEC = JsonCodec()
+CODECS = {codec.name: codec for codec in (JSON_CODEC, BinaryCodec())}
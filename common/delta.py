@@ -0,0 +1,117 @@
+import copy
+
+# 广播给客户端的状态是普通字典：
+#   {"round": n,
+#    "ball": {"status", "x", "y", "playerId", "starId", "pass": None或{"sx", "sy", "tx", "ty", "begin", "end"}},
+#    "stars": {"1": {"x", "y", "stamina", "state", "cd"}, ...},
+#    "score": {playerId: goals}}
+# 增量消息只带变化的部分，球员按字段比较，球和比分整体替换
+
+
+def state_from_round_info(round_info, round_no):
+    ball = round_info.ball_info
+    pass_info = ball.pass_info
+    stars = {}
+    for player in round_info.player_info:
+        for star in player.stars:
+            stars[str(star.star_id)] = {
+                "x": star.pos.x,
+                "y": star.pos.y,
+                "stamina": star.stamina,
+                "state": star.star_state.state,
+                "cd": star.star_state.cd_remain}
+    return {
+        "round": round_no,
+        "ball": {
+            "status": ball.status,
+            "x": ball.pos.x,
+            "y": ball.pos.y,
+            "playerId": ball.player_id,
+            "starId": ball.star_id,
+            "pass": None if pass_info is None else {
+                "sx": pass_info.start_pos.x,
+                "sy": pass_info.start_pos.y,
+                "tx": pass_info.target_pos.x,
+                "ty": pass_info.target_pos.y,
+                "begin": pass_info.round_begin,
+                "end": pass_info.round_end}},
+        "stars": stars,
+        "score": dict(round_info.score)}
+
+
+def diff_state(prev, cur):
+    delta = {"round": cur["round"]}
+    if cur["ball"] != prev["ball"]:
+        delta["ball"] = cur["ball"]
+    if cur["score"] != prev["score"]:
+        delta["score"] = cur["score"]
+    stars = {}
+    prev_stars = prev["stars"]
+    for star_id, fields in cur["stars"].items():
+        old = prev_stars.get(star_id)
+        if old is None:
+            stars[star_id] = fields
+            continue
+        changed = {key: value for key, value in fields.items() if old.get(key) != value}
+        if changed:
+            stars[star_id] = changed
+    if stars:
+        delta["stars"] = stars
+    return delta
+
+
+def apply_delta(state, delta):
+    state["round"] = delta["round"]
+    if "ball" in delta:
+        state["ball"] = delta["ball"]
+    if "score" in delta:
+        state["score"] = delta["score"]
+    for star_id, fields in delta.get("stars", {}).items():
+        state["stars"].setdefault(star_id, {}).update(fields)
+    return state
+
+
+class DeltaEncoder:
+    # keyframe_interval为0时每回合都发送完整快照
+    def __init__(self, keyframe_interval=0):
+        self.keyframe_interval = keyframe_interval
+        self.seq = 0
+        self.prev = None
+
+    def encode(self, state):
+        self.seq += 1
+        if self.prev is None or self.keyframe_interval <= 1 or self.seq % self.keyframe_interval == 1:
+            message = {"seq": self.seq, "keyframe": True, "state": state}
+        else:
+            message = {"seq": self.seq, "keyframe": False, "delta": diff_state(self.prev, state)}
+        self.prev = state
+        return message
+
+    def keyframe(self):
+        # 客户端请求重同步时，用当前序号补发一帧完整状态
+        return {"seq": self.seq, "keyframe": True, "state": self.prev}
+
+
+class DeltaDecoder:
+    def __init__(self):
+        self.seq = 0
+        self.state = None
+
+    def apply(self, message):
+        # 返回重建后的完整状态；序号不连续时返回None，调用方应请求重同步
+        if "seq" not in message:
+            return None
+        if message.get("keyframe"):
+            if message.get("state") is None:
+                return None
+            self.state = copy.deepcopy(message["state"])
+            self.seq = message["seq"]
+            return self.state
+        if self.state is not None and message["seq"] == self.seq:
+            # 重连后服务器会重发当前回合的增量，重复的消息不再应用
+            return self.state
+        if self.state is None or message["seq"] != self.seq + 1:
+            return None
+        apply_delta(self.state, message["delta"])
+        self.seq = message["seq"]
+        return self.state
@@ -0,0 +1,145 @@
+import json
+import re
+import struct
+
+# 帧模式：
+#   length - 4字节大端长度前缀 + 负载
+#   line   - 每条消息以换行结尾
+#   raw    - 旧的无分帧模式，按JSON对象边界切分
+FRAMING_MODES = ("length", "line", "raw")
+
+LENGTH_HEADER = struct.Struct("!I")
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+# 无分帧模式扫描时关心的字节：对象的开闭、字符串的引号和转义
+_RAW_TOKENS = re.compile(rb'[{}"\\]')
+
+
+class FrameError(Exception):
+    pass
+
+
+def encode_frame(payload, mode="length"):
+    if mode == "length":
+        return LENGTH_HEADER.pack(len(payload)) + payload
+    if mode == "line":
+        return payload + b"\n"
+    return payload
+
+
+class FrameDecoder:
+    def __init__(self, mode="length", max_frame_size=MAX_FRAME_SIZE):
+        if mode not in FRAMING_MODES:
+            raise ValueError(f"Unknown framing mode: {mode}")
+        self.mode = mode
+        self.max_frame_size = max_frame_size
+        self.buffer = bytearray()
+        # 无分帧模式的扫描状态，跨feed保留：已扫描到的位置、花括号深度、是否在字符串内
+        self.raw_pos = 0
+        self.raw_depth = 0
+        self.raw_in_string = False
+
+    def feed(self, data):
+        # 追加本次读到的数据，返回其中所有完整帧的负载
+        self.buffer += data
+        if self.mode == "length":
+            return self._split_length()
+        if self.mode == "line":
+            return self._split_line()
+        return self._split_raw()
+
+    def _split_length(self):
+        frames = []
+        buf = self.buffer
+        offset = 0
+        header_size = LENGTH_HEADER.size
+        while len(buf) - offset >= header_size:
+            (size,) = LENGTH_HEADER.unpack_from(buf, offset)
+            if size > self.max_frame_size:
+                self.buffer.clear()
+                raise FrameError(f"Frame too large: {size} bytes")
+            end = offset + header_size + size
+            if end > len(buf):
+                break
+            frames.append(bytes(buf[offset + header_size:end]))
+            offset = end
+        if offset:
+            del buf[:offset]
+        return frames
+
+    def _split_line(self):
+        frames = []
+        buf = self.buffer
+        offset = 0
+        while True:
+            end = buf.find(b"\n", offset)
+            if end < 0:
+                break
+            if end > offset:
+                frames.append(bytes(buf[offset:end]))
+            offset = end + 1
+        if offset:
+            del buf[:offset]
+        if len(buf) > self.max_frame_size:
+            self.buffer.clear()
+            raise FrameError(f"Frame too large: {len(buf)} bytes")
+        return frames
+
+    def _split_raw(self):
+        # 无分帧：按花括号配对（跳过字符串内部）切出首尾相接的JSON对象，每个字节只扫描一次。
+        # 对象之间的杂散数据跳到下一个'{'，配对完整但不是合法JSON（含非UTF-8）的对象整段丢弃
+        buf = self.buffer
+        frames = []
+        start = 0  # 当前对象在缓冲区中的起点
+        pos = self.raw_pos
+        depth = self.raw_depth
+        in_string = self.raw_in_string
+        while True:
+            if depth == 0:
+                brace = buf.find(b"{", pos)
+                if brace < 0:
+                    start = pos = len(buf)
+                    break
+                start = brace
+                pos = brace + 1
+                depth = 1
+                in_string = False
+                continue
+            match = _RAW_TOKENS.search(buf, pos)
+            if match is None:
+                pos = max(pos, len(buf))
+                break
+            token = match.group()
+            pos = match.end()
+            if in_string:
+                if token == b"\\":
+                    pos += 1  # 跳过被转义的字符，它可能还没收到
+                elif token == b'"':
+                    in_string = False
+            elif token == b'"':
+                in_string = True
+            elif token == b"{":
+                depth += 1
+            elif token == b"}":
+                depth -= 1
+                if depth == 0:
+                    payload = bytes(buf[start:pos])
+                    try:
+                        json.loads(payload)
+                    except ValueError:
+                        pass
+                    else:
+                        frames.append(payload)
+                    start = pos
+        del buf[:start]
+        self.raw_pos = pos - start
+        self.raw_depth = depth
+        self.raw_in_string = in_string
+        size = len(buf)
+        if size > self.max_frame_size:
+            buf.clear()
+            self.raw_pos = 0
+            self.raw_depth = 0
+            self.raw_in_string = False
+            raise FrameError(f"Frame too large: {size} bytes")
+        return frames
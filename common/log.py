@@ -0,0 +1,153 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import time
+
+LOG_LEVELS = ("debug", "info", "warning", "error")
+LOG_FORMATS = ("text", "json")
+ROOT_LOGGER = "game"
+
+# 采样调试：只有被选中的比赛/队伍输出debug日志，其余的debug调用只做一次属性判断
+_debug_all = False
+_debug_sample = 0.0
+_trace = frozenset()
+_listener = None
+_options = None
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    # 调用线程只把记录放入队列，消息和字段的格式化留给监听线程
+    def prepare(self, record):
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _format_value(value):
+    if isinstance(value, str):
+        return value if value and " " not in value and "=" not in value else json.dumps(value)
+    if isinstance(value, (dict, list, tuple)):
+        return json.dumps(value, default=str)
+    return str(value)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        created = time.strftime("%H:%M:%S", time.localtime(record.created))
+        name = record.name[len(ROOT_LOGGER) + 1:]
+        line = f"{created}.{int(record.msecs):03d} {record.levelname:<7} {name}: {record.msg}"
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join(f"{key}={_format_value(value)}" for key, value in fields.items())
+        if record.exc_text:
+            line += "\n" + record.exc_text
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {"ts": round(record.created, 3), "level": record.levelname.lower(),
+                 "logger": record.name[len(ROOT_LOGGER) + 1:], "event": record.msg}
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+def setup_logging(level="info", fmt="text", debug_sample=0.0, trace=(), stream=None):
+    # 日志记录经队列交给后台线程写出，热路径上不做字符串格式化和同步IO
+    global _debug_all, _debug_sample, _trace, _listener, _options
+    _options = dict(level=level, fmt=fmt, debug_sample=debug_sample, trace=tuple(trace))
+    _debug_all = level == "debug"
+    _debug_sample = debug_sample
+    _trace = frozenset(str(value) for value in trace)
+
+    if _listener is not None:
+        _listener.stop()
+    else:
+        atexit.register(lambda: _listener.stop())
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+    log_queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(log_queue, handler)
+    _listener.start()
+
+    root = logging.getLogger(ROOT_LOGGER)
+    root.handlers = [_DeferredQueueHandler(log_queue)]
+    root.propagate = False
+    root.setLevel(getattr(logging, level.upper()))
+
+
+def logging_options():
+    # 当前的日志配置，子进程用它重新建立自己的后台写出线程
+    return _options
+
+
+def _debug_wanted(context):
+    if _debug_all:
+        return True
+    if _trace and any(str(value) in _trace for value in context.values()):
+        return True
+    return _debug_sample > 0 and random.random() < _debug_sample
+
+
+class Logger:
+    # 结构化日志：事件名加键值字段，字段在写出时才格式化。
+    # 绑定的上下文（如比赛编号）决定这个Logger是否被抽中输出debug
+    __slots__ = ('logger', 'context', 'debug_enabled')
+
+    def __init__(self, name, context=None):
+        self.logger = logging.getLogger(f"{ROOT_LOGGER}.{name}")
+        self.context = context or {}
+        self.debug_enabled = _debug_wanted(self.context)
+
+    def bind(self, **context):
+        return Logger(self.logger.name[len(ROOT_LOGGER) + 1:], {**self.context, **context})
+
+    def _log(self, level, event, fields, exc_info=False):
+        if self.context:
+            fields = {**self.context, **fields}
+        self.logger.log(level, event, extra={"fields": fields}, exc_info=exc_info)
+
+    def debug(self, event, **fields):
+        # 被抽中的Logger绕过级别检查直接交给处理器，未抽中的不构造任何记录
+        if self.debug_enabled:
+            if self.context:
+                fields = {**self.context, **fields}
+            self.logger.handle(self.logger.makeRecord(self.logger.name, logging.DEBUG, "", 0, event, (), None,
+                                                      extra={"fields": fields}))
+
+    def info(self, event, **fields):
+        if self.logger.isEnabledFor(logging.INFO):
+            self._log(logging.INFO, event, fields)
+
+    def warning(self, event, **fields):
+        if self.logger.isEnabledFor(logging.WARNING):
+            self._log(logging.WARNING, event, fields)
+
+    def error(self, event, exc_info=False, **fields):
+        self._log(logging.ERROR, event, fields, exc_info)
+
+
+def get_logger(name, **context):
+    return Logger(name, context)
+
+
+def add_log_arguments(parser):
+    parser.add_argument('--log-level', choices=LOG_LEVELS, default='info',
+                        help='Minimum log level; per-round events are debug (default: info)')
+    parser.add_argument('--log-format', choices=LOG_FORMATS, default='text',
+                        help='Log line format: text or json (default: text)')
+    parser.add_argument('--debug-sample', type=float, default=0.0,
+                        help='Fraction of matches/clients that log at debug level (default: 0)')
+    parser.add_argument('--trace', action='append', default=[],
+                        help='Log this match or team ID at debug level (repeatable)')
+
+
+def setup_logging_from_args(args):
+    setup_logging(args.log_level, args.log_format, args.debug_sample, args.trace)
@@ -0,0 +1,126 @@
+from config.game_config import GameConfig
+
+DEFAULT_BUCKET_SIZE = 8
+
+
+class SpatialIndex:
+    # 均匀分桶的占位索引，按棋盘距离查询；球员移动时增量更新
+    def __init__(self, width=GameConfig.FIELD_WIDTH, height=GameConfig.FIELD_HEIGHT, bucket_size=DEFAULT_BUCKET_SIZE):
+        self.width = width
+        self.height = height
+        self.bucket_size = bucket_size
+        self.columns = -(-width // bucket_size)
+        self.rows = -(-height // bucket_size)
+        # 桶按需创建，空场地只占一个列表；清空后保留以免反复分配
+        self.buckets = [None] * (self.columns * self.rows)
+        self.positions = {}  # star_id -> (x, y)
+        self.teams = {}  # star_id -> player_id
+
+    def bucket_of(self, x, y):
+        return (x // self.bucket_size) * self.rows + y // self.bucket_size
+
+    def update(self, star_id, x, y, team=None):
+        old = self.positions.get(star_id)
+        if old is not None:
+            if old == (x, y):
+                return
+            old_bucket = self.bucket_of(*old)
+            new_bucket = self.bucket_of(x, y)
+            if old_bucket != new_bucket:
+                self.buckets[old_bucket].discard(star_id)
+                self._bucket(new_bucket).add(star_id)
+        else:
+            self._bucket(self.bucket_of(x, y)).add(star_id)
+        self.positions[star_id] = (x, y)
+        if team is not None:
+            self.teams[star_id] = team
+
+    def _bucket(self, bucket):
+        found = self.buckets[bucket]
+        if found is None:
+            found = self.buckets[bucket] = set()
+        return found
+
+    def remove(self, star_id):
+        pos = self.positions.pop(star_id, None)
+        if pos is not None:
+            self.buckets[self.bucket_of(*pos)].discard(star_id)
+        self.teams.pop(star_id, None)
+
+    def clear(self):
+        for bucket in self.buckets:
+            if bucket:
+                bucket.clear()
+        self.positions.clear()
+        self.teams.clear()
+
+    def position(self, star_id):
+        return self.positions.get(star_id)
+
+    def _match_team(self, star_id, team, exclude_team):
+        star_team = self.teams.get(star_id)
+        if team is not None and star_team != team:
+            return False
+        return exclude_team is None or star_team != exclude_team
+
+    def _buckets_in(self, x, y, radius):
+        size = self.bucket_size
+        min_column = max((x - radius) // size, 0)
+        max_column = min((x + radius) // size, self.columns - 1)
+        min_row = max((y - radius) // size, 0)
+        max_row = min((y + radius) // size, self.rows - 1)
+        for column in range(min_column, max_column + 1):
+            base = column * self.rows
+            for row in range(min_row, max_row + 1):
+                bucket = self.buckets[base + row]
+                if bucket:
+                    yield bucket
+
+    def at(self, x, y):
+        bucket = self.buckets[self.bucket_of(x, y)]
+        if not bucket:
+            return []
+        return [star_id for star_id in bucket if self.positions[star_id] == (x, y)]
+
+    def within(self, x, y, radius, low=0, team=None, exclude_team=None):
+        # 返回距离在[low, radius]之间的 (star_id, 距离)，按距离、编号排序
+        found = []
+        for bucket in self._buckets_in(x, y, radius):
+            for star_id in bucket:
+                sx, sy = self.positions[star_id]
+                dist = max(abs(sx - x), abs(sy - y))
+                if low <= dist <= radius and self._match_team(star_id, team, exclude_team):
+                    found.append((dist, star_id))
+        found.sort()
+        return [(star_id, dist) for dist, star_id in found]
+
+    def nearest(self, x, y, team=None, exclude_team=None, max_radius=None):
+        # 按桶一圈圈向外搜索，找到的距离不大于下一圈的下界即可停止
+        size = self.bucket_size
+        bucket_x = x // size
+        bucket_y = y // size
+        best = None
+        max_ring = max(self.columns, self.rows)
+        for ring in range(max_ring + 1):
+            for column in range(bucket_x - ring, bucket_x + ring + 1):
+                if column < 0 or column >= self.columns:
+                    continue
+                edge = column in (bucket_x - ring, bucket_x + ring)
+                rows = range(bucket_y - ring, bucket_y + ring + 1) if edge else (bucket_y - ring, bucket_y + ring)
+                for row in rows:
+                    if row < 0 or row >= self.rows:
+                        continue
+                    for star_id in self.buckets[column * self.rows + row] or ():
+                        if not self._match_team(star_id, team, exclude_team):
+                            continue
+                        sx, sy = self.positions[star_id]
+                        dist = max(abs(sx - x), abs(sy - y))
+                        if best is None or (dist, star_id) < best:
+                            best = (dist, star_id)
+            if best is not None and best[0] <= ring * size:
+                break
+            if max_radius is not None and ring * size > max_radius:
+                break
+        if best is None or (max_radius is not None and best[0] > max_radius):
+            return None
+        return best[1], best[0]
@@ -43,3 +43,30 @@ class GameConfig:
     SHORT_PASS_MAX_DISTANCE = 35
     LONG_PASS_MIN_DISTANCE = 5
     LONG_PASS_MAX_DISTANCE = 45
+
+    # 球在空中每回合飞行的格数
+    PASS_SPEED = {
+        "shortPass": 5,
+        "longPass": 9
+    }
+
+    # 各动作的有效距离（含两端）
+    ACTION_RANGE = {
+        "steal": (0, 1),
+        "slide": (2, 2),
+        "shortPass": (1, SHORT_PASS_MAX_DISTANCE),
+        "longPass": (LONG_PASS_MIN_DISTANCE, LONG_PASS_MAX_DISTANCE)
+    }
+
+    # 抢断/铲球成功率，铲球失败的一方僵直
+    STEAL_SUCCESS_RATE = 0.5
+    SLIDE_SUCCESS_RATE = 0.7
+
+    # 球门宽度（位于左右底线中央）
+    GOAL_WIDTH = 9
+
+    # 开球阵型（左半场坐标，右队按中线镜像）
+    KICKOFF_FORMATION = [(10, 30), (25, 15), (25, 45), (40, 22), (40, 38)]
+
+    # 球员编号上限（编号从1开始，双方共用），每队人数不超过开球阵型的位置数
+    MAX_STAR_ID = 10
@@ -0,0 +1,172 @@
+import asyncio
+import time
+
+from main import MAX_WRITE_BUFFER, GameServer
+from common.framing import FrameDecoder
+
+# send()的高水位：传输层缓冲超过它时不再写入，数据留在调用方（观众的发送队列）
+SEND_HIGH_WATER = 64 * 1024
+
+
+class Connection:
+    def __init__(self, writer):
+        self.writer = writer
+        self.peer = writer.get_extra_info('peername')
+        self.closed = False
+        self.pending = asyncio.Event()
+        self.on_drained = None  # 缓冲写出后回调，观众连接用它继续发送积压的数据
+        self.writer_task = asyncio.get_running_loop().create_task(self.write_loop())
+
+    def sendall(self, data):
+        # 与socket.sendall同名：写入传输层缓冲即返回，由write_loop统一drain
+        if self.closed:
+            raise ConnectionResetError(f"Connection to {self.peer} is closed")
+        transport = self.writer.transport
+        if transport.get_write_buffer_size() + len(data) > MAX_WRITE_BUFFER:
+            self.close()
+            raise ConnectionResetError(f"Write buffer overflow for {self.peer}")
+        self.writer.write(data)
+        self.pending.set()
+
+    def send(self, data):
+        # 与非阻塞socket.send同名：缓冲已过高水位时抛出BlockingIOError，由调用方保留数据等on_drained再写
+        if self.closed:
+            raise ConnectionResetError(f"Connection to {self.peer} is closed")
+        if self.writer.transport.get_write_buffer_size() >= SEND_HIGH_WATER:
+            raise BlockingIOError
+        self.writer.write(data)
+        self.pending.set()
+        return len(data)
+
+    async def write_loop(self):
+        # 写入只进入传输层缓冲，由本任务统一drain，发送方从不阻塞
+        try:
+            while not self.closed:
+                await self.pending.wait()
+                self.pending.clear()
+                await self.writer.drain()
+                if self.on_drained:
+                    self.on_drained()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.writer_task.cancel()
+        self.writer.close()
+
+
+class AsyncGameServer(GameServer):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.loop = None
+        self.stopped = None
+        self.round_timer = None
+        self.session_timer = None
+
+    def start(self):
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            self.running = False
+            self.log.info("Shutting down server")
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        self.server_socket = await asyncio.start_server(
+            self.handle_connection, self.host, self.port, reuse_address=True, backlog=1024)
+        self.running = True
+
+        self.log.info("Server started", host=self.host, port=self.port, core="asyncio", teams=self.required_teams,
+                      registration_timeout=self.register_timeout)
+
+        if self.restore:
+            self.restore_checkpoint()
+        else:
+            # 注册超时由事件循环定时器触发，不再占用线程
+            self.loop.call_later(self.register_timeout, self.check_registration)
+
+        await self.stopped.wait()
+
+    async def handle_connection(self, reader, writer):
+        conn = Connection(writer)
+        self.all_sockets.append(conn)
+        self.decoders[conn] = FrameDecoder(self.framing)
+        self.log.info("New connection", peer=conn.peer)
+        try:
+            while self.running and not conn.closed:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                self.handle_data(conn, data)
+        except ConnectionError:
+            pass
+        finally:
+            if self.running:
+                self.remove_client(conn)
+
+    def write(self, sock, data):
+        # Connection自带写缓冲和后台drain，不需要GameServer按连接维护的发送缓冲
+        sock.sendall(data)
+
+    def set_round_deadline(self, deadline):
+        # 截止时间由事件循环定时器触发，不依赖下一次读事件
+        if self.round_timer:
+            self.round_timer.cancel()
+            self.round_timer = None
+        super().set_round_deadline(deadline)
+        if self.running and deadline is not None:
+            self.round_timer = self.loop.call_later(max(deadline - time.time(), 0),
+                                                    self.on_round_timeout, self.round_count)
+
+    def on_round_timeout(self, round_no):
+        self.round_timer = None
+        super().on_round_timeout(round_no)
+
+    def add_spectator(self, client_socket, msg_data):
+        super().add_spectator(client_socket, msg_data)
+        spectator = self.spectators.get(client_socket)
+        if spectator is not None:
+            client_socket.on_drained = lambda: self.flush_spectator(spectator)
+
+    def hold_session(self, player_id):
+        super().hold_session(player_id)
+        self.arm_session_timer()
+
+    def arm_session_timer(self):
+        # 一个定时器对准最早过期的会话；事件循环时钟与time.time()可能有微小偏差，未到期时重新计时
+        if self.session_timer:
+            self.session_timer.cancel()
+            self.session_timer = None
+        if self.running and self.disconnected:
+            self.session_timer = self.loop.call_later(max(min(self.disconnected.values()) - time.time(), 0.01),
+                                                      self.check_sessions)
+
+    def check_sessions(self):
+        self.session_timer = None
+        super().check_sessions()
+        self.arm_session_timer()
+
+    def shutdown(self):
+        if not self.running:
+            return
+        self.log.info("Shutting down server")
+        self.running = False
+        if self.round_timer:
+            self.round_timer.cancel()
+            self.round_timer = None
+        if self.session_timer:
+            self.session_timer.cancel()
+            self.session_timer = None
+        if self.checkpoint:
+            self.checkpoint.close()
+        for conn in self.all_sockets:
+            conn.close()
+        self.all_sockets = []
+        if self.server_socket:
+            self.server_socket.close()
+        if self.stopped:
+            self.stopped.set()
@@ -0,0 +1,421 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import resource
+import socket
+import subprocess
+import sys
+import time
+
+from metrics import Histogram
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.codec import CODECS, JSON_CODEC, STATE_HEADER, TAG_INQUIRY
+from common.framing import FRAMING_MODES, FrameDecoder, FrameError, encode_frame
+from config.game_config import GameConfig
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+THINK_DISTRIBUTIONS = ("none", "const", "uniform", "exp", "lognormal")
+ACTION_POOL_SIZE = 16
+INQUIRY_TAG = bytes((TAG_INQUIRY,))
+
+# 与基线比较的指标：名称、取值路径、越大越好还是越小越好
+COMPARED_METRICS = (
+    ("rounds_per_sec", ("rounds_per_sec",), "higher"),
+    ("round_period_p50_ms", ("round_period", "p50_ms"), "lower"),
+    ("round_period_p99_ms", ("round_period", "p99_ms"), "lower"),
+    ("turnaround_p99_ms", ("turnaround", "p99_ms"), "lower"),
+    ("server_cpu_us_per_round", ("server", "cpu_us_per_round"), "lower"),
+    ("server_rss_peak_mb", ("server", "rss_peak_mb"), "lower"),
+)
+
+
+def think_sampler(kind, mean, rng):
+    # 返回生成单次思考时间（秒）的函数，mean为平均值
+    if kind == "none" or mean <= 0:
+        return lambda: 0.0
+    if kind == "const":
+        return lambda: mean
+    if kind == "uniform":
+        return lambda: rng.uniform(0, 2 * mean)
+    if kind == "exp":
+        return lambda: rng.expovariate(1 / mean)
+    # 对数正态：sigma=1时中位数约为均值的0.6倍，尾部较长，接近真实机器人的耗时分布
+    mu = math.log(mean) - 0.5
+    return lambda: rng.lognormvariate(mu, 1.0)
+
+
+class LoadStats:
+    def __init__(self):
+        self.round_period = Histogram()  # 客户端看到的相邻两次查询的间隔
+        self.turnaround = Histogram()  # 发出响应到收到下一次查询，即服务器处理加等待对手
+        self.rounds = 0
+        self.responses = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.completed_matches = set()
+        self.errors = 0
+
+
+class SyntheticClient:
+    # 轻量的协议客户端：不重建状态，只取回合号，按设定的思考时间回复
+    def __init__(self, host, port, player_id, match_id, framing, codec, think, actions, rng, stats):
+        self.host = host
+        self.port = port
+        self.player_id = player_id
+        self.match_id = match_id
+        self.framing = framing
+        self.requested_codec = CODECS[codec]
+        self.codec = JSON_CODEC
+        self.think = think
+        self.actions = actions
+        self.rng = rng
+        self.stats = stats
+        self.writer = None
+        self.star_ids = []
+        self.action_pool = []
+        self.last_inquiry = None
+        self.last_response = None
+        self.done = asyncio.Event()
+
+    def send(self, message):
+        frame = encode_frame(self.codec.encode(message), self.framing)
+        self.stats.bytes_sent += len(frame)
+        self.writer.write(frame)
+
+    async def run(self):
+        try:
+            reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        except OSError:
+            self.stats.errors += 1
+            return
+        msg_data = {"playerId": self.player_id, "playerName": self.player_id, "team_name": "A",
+                    "matchId": self.match_id}
+        if self.requested_codec is not JSON_CODEC:
+            msg_data["codec"] = self.requested_codec.name
+        self.send({"msgName": "register", "msgData": msg_data})
+        self.codec = self.requested_codec
+        decoder = FrameDecoder(self.framing)
+        try:
+            while not self.done.is_set():
+                data = await reader.read(65536)
+                if not data:
+                    break
+                self.stats.bytes_received += len(data)
+                for frame in decoder.feed(data):
+                    self.handle(frame)
+        except (ConnectionError, FrameError):
+            self.stats.errors += 1
+        finally:
+            self.writer.close()
+
+    def handle(self, payload):
+        now = time.perf_counter()
+        # 二进制查询直接读状态头里的回合号，省去完整解码
+        if self.codec is not JSON_CODEC and payload[:1] == INQUIRY_TAG:
+            self.on_inquiry(STATE_HEADER.unpack_from(payload, 1)[0], now)
+            return
+        message = self.codec.decode(payload)
+        msg_name = message.get("msgName")
+        msg_data = message.get("msgData") or {}
+        if msg_name == "inquiry":
+            self.on_inquiry(msg_data.get("round", 0), now)
+        elif msg_name == "gamestart":
+            self.star_ids = msg_data.get("stars", [])
+            self.build_action_pool()
+            self.send({"msgName": "gameready", "msgData": {"playerId": self.player_id, "status": "ready"}})
+        elif msg_name == "gameover":
+            self.stats.completed_matches.add(self.match_id)
+            self.done.set()
+
+    def build_action_pool(self):
+        # 预先生成若干组动作轮流使用，压测机本身的开销不随回合增长
+        for _ in range(ACTION_POOL_SIZE):
+            self.action_pool.append([{
+                "starId": self.star_ids[i % len(self.star_ids)] if self.star_ids else 0,
+                "action": self.rng.choice(GameConfig.ACTION_TYPES),
+                "x": self.rng.randrange(GameConfig.FIELD_WIDTH),
+                "y": self.rng.randrange(GameConfig.FIELD_HEIGHT)} for i in range(self.actions)])
+
+    def on_inquiry(self, round_no, now):
+        stats = self.stats
+        stats.rounds += 1
+        if self.last_inquiry is not None:
+            stats.round_period.record(now - self.last_inquiry)
+        if self.last_response is not None:
+            stats.turnaround.record(now - self.last_response)
+        self.last_inquiry = now
+        delay = self.think()
+        if delay > 0:
+            asyncio.get_running_loop().call_later(delay, self.respond, round_no)
+        else:
+            self.respond(round_no)
+
+    def respond(self, round_no):
+        if self.done.is_set() or self.writer.is_closing():
+            return
+        actions = self.action_pool[round_no % len(self.action_pool)] if self.action_pool else []
+        self.send({"msgName": "response", "msgData": {
+            "playerId": self.player_id, "round": round_no, "data": {"actions": actions}}})
+        self.last_response = time.perf_counter()
+        self.stats.responses += 1
+
+
+def process_tree(pid):
+    # 进程及其所有子孙进程（分片工作进程也计入服务器开销）
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        children.setdefault(int(fields[1]), []).append(int(entry))
+    found = []
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        found.append(current)
+        pending.extend(children.get(current, ()))
+    return found
+
+
+def process_usage(pids):
+    # 返回 {pid: (CPU秒数, 常驻内存字节)}，只支持Linux的/proc
+    ticks = os.sysconf('SC_CLK_TCK')
+    page_size = os.sysconf('SC_PAGE_SIZE')
+    usage = {}
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        usage[pid] = ((int(fields[11]) + int(fields[12])) / ticks, int(fields[21]) * page_size)
+    return usage
+
+
+class ServerProcesses:
+    # 按需启动被测服务器：每场比赛一个main.py，或一个match_manager.py承载所有比赛
+    def __init__(self, target, host, base_port, matches, framing, workers):
+        self.target = target
+        self.host = host
+        self.base_port = base_port
+        self.matches = matches
+        self.framing = framing
+        self.workers = workers
+        self.processes = []
+        self.rss_peak = 0
+        # 每个进程首次采样时的CPU作为起点，最后一次采样值作为终点；已退出的进程保留最后的读数
+        self.cpu_start = {}
+        self.cpu_last = {}
+
+    def port_of(self, match_index):
+        return self.base_port + match_index if self.target == "main" else self.base_port
+
+    def start(self):
+        common = ['-f', self.framing, '--log-level', 'warning']
+        if self.target == "main":
+            for i in range(self.matches):
+                self.spawn(['main.py', '-p', str(self.base_port + i), '-C', f"bench{i}a,bench{i}b"] + common)
+        elif self.target == "manager":
+            self.spawn(['match_manager.py', '-p', str(self.base_port), '-w', str(self.workers)] + common)
+
+    def spawn(self, args):
+        self.processes.append(subprocess.Popen([sys.executable] + args, cwd=SERVER_DIR,
+                                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+
+    def wait_ready(self, timeout=10):
+        ports = {self.port_of(i) for i in range(self.matches)}
+        deadline = time.time() + timeout
+        while ports and time.time() < deadline:
+            for port in list(ports):
+                try:
+                    socket.create_connection((self.host, port), timeout=0.2).close()
+                    ports.discard(port)
+                except OSError:
+                    pass
+            if ports:
+                time.sleep(0.05)
+        return not ports
+
+    def pids(self):
+        pids = []
+        for process in self.processes:
+            pids.extend(process_tree(process.pid))
+        return pids
+
+    def sample(self):
+        usage = process_usage(self.pids())
+        for pid, (cpu, _) in usage.items():
+            self.cpu_start.setdefault(pid, cpu)
+            self.cpu_last[pid] = cpu
+        self.rss_peak = max(self.rss_peak, sum(rss for _, rss in usage.values()))
+
+    @property
+    def cpu_seconds(self):
+        return sum(self.cpu_last[pid] - self.cpu_start[pid] for pid in self.cpu_last)
+
+    def stop(self):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+async def sample_loop(servers, interval):
+    while True:
+        servers.sample()
+        await asyncio.sleep(interval)
+
+
+async def run_load(args, servers):
+    stats = LoadStats()
+    rng = random.Random(args.seed)
+    clients = []
+    for i in range(args.matches):
+        for side in "ab":
+            player_id = f"bench{i}{side}"
+            client_rng = random.Random(rng.random())
+            think = think_sampler(args.think, args.think_ms / 1000, client_rng)
+            clients.append(SyntheticClient(args.host, servers.port_of(i), player_id, f"bench{i}", args.framing,
+                                           args.codec, think, args.actions, client_rng, stats))
+
+    sampler = asyncio.get_running_loop().create_task(sample_loop(servers, 0.25)) if servers.processes else None
+    started = time.perf_counter()
+    cpu_before = resource.getrusage(resource.RUSAGE_SELF)
+    try:
+        await asyncio.wait_for(asyncio.gather(*(client.run() for client in clients)), args.timeout)
+    except asyncio.TimeoutError:
+        stats.errors += 1
+    elapsed = time.perf_counter() - started
+    cpu_after = resource.getrusage(resource.RUSAGE_SELF)
+    if sampler:
+        sampler.cancel()
+        servers.sample()
+    client_cpu = (cpu_after.ru_utime - cpu_before.ru_utime) + (cpu_after.ru_stime - cpu_before.ru_stime)
+    # 每场比赛两支队伍都计入了回合数，按比赛回合折算
+    match_rounds = stats.rounds / 2
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "matches": args.matches,
+        "completed_matches": len(stats.completed_matches),
+        "rounds": int(match_rounds),
+        "rounds_per_sec": round(match_rounds / elapsed, 1) if elapsed else 0.0,
+        "matches_per_sec": round(len(stats.completed_matches) / elapsed, 3) if elapsed else 0.0,
+        "round_period": stats.round_period.snapshot(),
+        "turnaround": stats.turnaround.snapshot(),
+        "bytes_sent": stats.bytes_sent,
+        "bytes_received": stats.bytes_received,
+        "errors": stats.errors,
+        "client_cpu_s": round(client_cpu, 3),
+        "server": {
+            "cpu_s": round(servers.cpu_seconds, 3),
+            "cpu_us_per_round": round(servers.cpu_seconds / match_rounds * 1e6, 1) if match_rounds else None,
+            "rss_peak_mb": round(servers.rss_peak / 2 ** 20, 1),
+        } if servers.processes else None,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SERVER_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def metric_value(result, path):
+    value = result
+    for key in path:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def compare(result, baseline, tolerance):
+    # 返回 (指标, 基线值, 当前值, 变化比例, 是否退化)
+    rows = []
+    for name, path, better in COMPARED_METRICS:
+        old = metric_value(baseline, path)
+        new = metric_value(result, path)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        worse = change < -tolerance if better == "higher" else change > tolerance
+        rows.append((name, old, new, change, worse))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Load generator and protocol benchmark for the game server')
+    parser.add_argument('-n', '--matches', type=int, default=10, help='Concurrent matches (default: 10)')
+    parser.add_argument('-t', '--target', choices=('main', 'manager', 'external'), default='main',
+                        help='Spawn one main.py per match, one match_manager.py, or use a running server '
+                             '(default: main)')
+    parser.add_argument('-w', '--workers', type=int, default=0, help='Worker shards for the manager target')
+    parser.add_argument('-l', '--host', default='127.0.0.1', help='Server host (default: 127.0.0.1)')
+    parser.add_argument('-p', '--port', type=int, default=7100,
+                        help='Base port; main.py targets use port+i for match i (default: 7100)')
+    parser.add_argument('-f', '--framing', choices=FRAMING_MODES, default='length',
+                        help='Wire framing (default: length)')
+    parser.add_argument('-e', '--codec', choices=sorted(CODECS), default='json', help='Message codec (default: json)')
+    parser.add_argument('--think', choices=THINK_DISTRIBUTIONS, default='none',
+                        help='Think-time distribution of the synthetic bots (default: none)')
+    parser.add_argument('--think-ms', type=float, default=0.0, help='Mean think time in milliseconds (default: 0)')
+    parser.add_argument('--actions', type=int, default=5, help='Actions per response message (default: 5)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for bot actions and think times (default: 0)')
+    parser.add_argument('--timeout', type=float, default=600, help='Give up after this many seconds (default: 600)')
+    parser.add_argument('-o', '--output', help='Write the result as JSON to this file')
+    parser.add_argument('-b', '--baseline', help='Compare against a result file written earlier with -o')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='Relative change counted as a regression (default: 0.1)')
+
+    args = parser.parse_args()
+
+    servers = ServerProcesses(args.target, args.host, args.port, args.matches, args.framing, args.workers)
+    servers.start()
+    try:
+        if not servers.wait_ready():
+            print("Error: server did not start listening")
+            sys.exit(1)
+        result = asyncio.run(run_load(args, servers))
+    finally:
+        servers.stop()
+
+    result = {"commit": git_commit(), "time": time.time(),
+              "config": {key: getattr(args, key) for key in ("matches", "target", "workers", "framing", "codec",
+                                                             "think", "think_ms", "actions", "seed")},
+              **result}
+    print(f"{result['completed_matches']}/{args.matches} matches, {result['rounds']} rounds in "
+          f"{result['elapsed_s']}s: {result['rounds_per_sec']} rounds/sec, {result['errors']} errors")
+    print(f"Round period p50 {result['round_period']['p50_ms']} ms, p99 {result['round_period']['p99_ms']} ms; "
+          f"turnaround p50 {result['turnaround']['p50_ms']} ms, p99 {result['turnaround']['p99_ms']} ms")
+    if result["server"]:
+        print(f"Server CPU {result['server']['cpu_s']}s ({result['server']['cpu_us_per_round']} us/round), "
+              f"peak RSS {result['server']['rss_peak_mb']} MB; load generator CPU {result['client_cpu_s']}s")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+    regressed = False
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("config") != result["config"]:
+            print("Warning: baseline was recorded with a different configuration")
+        print(f"Compared with {args.baseline} (commit {baseline.get('commit')}):")
+        for name, old, new, change, worse in compare(result, baseline, args.tolerance):
+            regressed = regressed or worse
+            print(f"  {name:<24} {old:>10} -> {new:>10} ({change:+.1%}){'  REGRESSION' if worse else ''}")
+    sys.exit(1 if regressed or result["errors"] else 0)
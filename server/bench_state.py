@@ -0,0 +1,72 @@
+import argparse
+import gc
+import sys
+import time
+import tracemalloc
+
+from engine import Match
+
+
+def fixed_actions(star_ids, targets):
+    # 预先构造好的动作列表，机器人本身不产生分配
+    return [{"starId": star_id, "action": "run", "x": x, "y": y} for star_id, (x, y) in zip(star_ids, targets)]
+
+
+def bench_memory(n_matches):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    matches = [Match() for _ in range(n_matches)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / n_matches, matches
+
+
+def bench_rounds(match, rounds):
+    left = [star.star_id for star in match.game_state.round_info.player_info[0].stars]
+    right = [star.star_id for star in match.game_state.round_info.player_info[1].stars]
+    # 两组目标来回跑动，只涉及移动、体力和空间索引更新
+    plans = [(fixed_actions(left, [(30, 10)] * 5), fixed_actions(right, [(60, 50)] * 5)),
+             (fixed_actions(left, [(10, 50)] * 5), fixed_actions(right, [(80, 10)] * 5))]
+    match.max_rounds = rounds * 2 + 10
+    for i in range(10):
+        match.step(*plans[i % 2])
+
+    gc.collect()
+    gc.disable()
+    blocks_before = sys.getallocatedblocks()
+    tracemalloc.start()
+    start_bytes = tracemalloc.get_traced_memory()[0]
+    for i in range(rounds):
+        match.step(*plans[i % 2])
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    blocks_after = sys.getallocatedblocks()
+    gc.enable()
+
+    started = time.perf_counter()
+    for i in range(rounds):
+        match.step(*plans[i % 2])
+    elapsed = time.perf_counter() - started
+    return {
+        "retained_bytes_per_round": (current - start_bytes) / rounds,
+        "retained_blocks_per_round": (blocks_after - blocks_before) / rounds,
+        "peak_transient_bytes": peak - start_bytes,
+        "us_per_round": elapsed / rounds * 1e6,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Game state memory and allocation benchmark')
+    parser.add_argument('-m', '--matches', type=int, default=1000, help='Matches to allocate (default: 1000)')
+    parser.add_argument('-r', '--rounds', type=int, default=500, help='Rounds to advance (default: 500)')
+
+    args = parser.parse_args()
+
+    bytes_per_match, matches = bench_memory(args.matches)
+    print(f"Memory: {bytes_per_match:.0f} bytes per match ({args.matches} matches)")
+    result = bench_rounds(matches[0], args.rounds)
+    print(f"Rounds: {result['retained_blocks_per_round']:.2f} retained allocations/round, "
+          f"{result['retained_bytes_per_round']:.1f} retained bytes/round, "
+          f"{result['peak_transient_bytes']} bytes peak transient, "
+          f"{result['us_per_round']:.1f} us/round")
@@ -0,0 +1,142 @@
+import array
+import json
+import os
+import struct
+import sys
+import threading
+
+from game_state import BallInfo, BallPassInfo, PlayerInfo, Pos, RoundInfo, StaticPlayerInfo
+from pass_paths import pass_shape
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.codec import BinaryCodec
+
+# 文件布局：
+#   文件头   MAGIC + 版本(u16) + 元数据JSON长度(u32) + 元数据JSON（回合、队伍、超时次数、会话令牌等）
+#   随机数   状态字数(u16) + 每个字(u32)，即random.Random.getstate()的内部状态
+#   比赛状态 沿用二进制编解码器的关键帧布局，含传球信息
+# 先写临时文件再替换，进程在写入途中退出也不会破坏上一个检查点
+MAGIC = b"IPCK"
+VERSION = 1
+FILE_HEADER = struct.Struct("!4sHI")
+U16 = struct.Struct("!H")
+
+DEFAULT_CHECKPOINT_INTERVAL = 50
+
+_codec = BinaryCodec()
+
+
+def round_info_from_state(state, static_players):
+    # 由状态快照（state_from_round_info的格式）重建RoundInfo，传球路径按起止点和飞行回合数重新生成
+    round_info = RoundInfo()
+    ball_state = state["ball"]
+    ball = BallInfo()
+    ball.status = ball_state["status"]
+    ball.pos = Pos(ball_state["x"], ball_state["y"])
+    ball.player_id = ball_state["playerId"]
+    ball.star_id = ball_state["starId"]
+    pass_state = ball_state["pass"]
+    if pass_state is not None:
+        sx, sy, tx, ty = pass_state["sx"], pass_state["sy"], pass_state["tx"], pass_state["ty"]
+        rounds = pass_state["end"] - pass_state["begin"] + 1
+        ball.pass_info = BallPassInfo(Pos(sx, sy), Pos(tx, ty), pass_state["begin"], pass_state["end"],
+                                      pass_shape(tx - sx, ty - sy, rounds).path_from(sx, sy))
+    round_info.ball_info = ball
+    for static in static_players:
+        player = PlayerInfo(static.player_id, static.side, static.team_name)
+        for star in player.stars:
+            fields = state["stars"][str(star.star_id)]
+            star.move_to(fields["x"], fields["y"])
+            star.stamina = fields["stamina"]
+            star.star_state.state = fields["state"]
+            star.star_state.cd_remain = fields["cd"]
+        round_info.player_info.append(player)
+    round_info.score = dict(state["score"])
+    return round_info
+
+
+def static_players_to_json(static_players):
+    return [{"playerId": p.player_id, "side": p.side, "name": p.player_name, "team": p.team_name}
+            for p in static_players]
+
+
+def static_players_from_json(players):
+    return [StaticPlayerInfo(p["playerId"], p["side"], p["name"], p["team"]) for p in players]
+
+
+def encode_checkpoint(metadata, state, rng_state):
+    version, internal, gauss_next = rng_state
+    header = json.dumps(dict(metadata, rng_version=version, gauss_next=gauss_next)).encode()
+    words = array.array('I', internal)
+    if sys.byteorder == 'little':
+        words.byteswap()
+    return b"".join((FILE_HEADER.pack(MAGIC, VERSION, len(header)), header, U16.pack(len(words)), words.tobytes(),
+                     _codec.encode_state_message({"keyframe": True, "seq": 0, "state": state})))
+
+
+def decode_checkpoint(data):
+    magic, version, header_length = FILE_HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not a checkpoint file or unsupported version")
+    offset = FILE_HEADER.size
+    metadata = json.loads(data[offset:offset + header_length])
+    offset += header_length
+    (count,) = U16.unpack_from(data, offset)
+    offset += U16.size
+    words = array.array('I')
+    words.frombytes(data[offset:offset + count * 4])
+    if sys.byteorder == 'little':
+        words.byteswap()
+    offset += count * 4
+    rng_state = (metadata.pop("rng_version"), tuple(words), metadata.pop("gauss_next"))
+    state = _codec.decode_state_message(data, offset)["state"]
+    return metadata, state, rng_state
+
+
+def load_checkpoint(path):
+    with open(path, 'rb') as f:
+        return decode_checkpoint(f.read())
+
+
+class CheckpointWriter:
+    # 回合线程只交出状态快照的引用（快照生成后不再修改），编码和写文件在后台线程完成；
+    # 写入跟不上时只保留最新的一份
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Condition()
+        self.pending = None
+        self.closed = False
+        self.thread = threading.Thread(target=self.write_loop, daemon=True)
+        self.thread.start()
+
+    def save(self, metadata, state, rng_state):
+        with self.lock:
+            self.pending = (metadata, state, rng_state)
+            self.lock.notify()
+
+    def write_loop(self):
+        while True:
+            with self.lock:
+                while self.pending is None and not self.closed:
+                    self.lock.wait()
+                item, self.pending = self.pending, None
+                if item is None:
+                    return
+            self.write(encode_checkpoint(*item))
+
+    def write(self, data):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+
+    def close(self, remove=False):
+        # 比赛正常结束时删除检查点，避免之后误恢复一场已结束的比赛
+        with self.lock:
+            self.closed = True
+            if remove:
+                self.pending = None
+            self.lock.notify()
+        self.thread.join()
+        if remove and os.path.exists(self.path):
+            os.remove(self.path)
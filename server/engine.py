@@ -0,0 +1,208 @@
+import argparse
+import importlib
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+from game_state import *
+from rules import kickoff, max_score_reached, resolve_round
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.delta import state_from_round_info
+from config.game_config import GameConfig
+
+
+class Match:
+    # 不经过socket的单场比赛，规则与GameServer相同。
+    # 给定seed时所有随机判定都来自该种子，相同的动作序列必然得到相同的结果
+    def __init__(self, left_id='left', right_id='right', left_team='A', right_team='B',
+                 max_rounds=GameConfig.MAX_TURNS, seed=None):
+        self.left_id = left_id
+        self.right_id = right_id
+        self.left_team = left_team
+        self.right_team = right_team
+        self.max_rounds = max_rounds
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.game_state = None
+        self.round_count = 0
+        self.reset()
+
+    def reset(self):
+        self.game_state = GameState()
+        self.game_state.static_player_info = [
+            StaticPlayerInfo(self.left_id, 'left', self.left_id, self.left_team),
+            StaticPlayerInfo(self.right_id, 'right', self.right_id, self.right_team)]
+        round_info = self.game_state.round_info
+        round_info.ball_info = BallInfo()
+        round_info.player_info = [
+            PlayerInfo(self.left_id, 'left', self.left_team),
+            PlayerInfo(self.right_id, 'right', self.right_team)]
+        round_info.score = {self.left_id: 0, self.right_id: 0}
+        kickoff(self.game_state)
+        self.round_count = 0
+        if self.seed is not None:
+            self.rng.seed(self.seed)
+        return self.game_state.round_info
+
+    @property
+    def done(self):
+        return self.round_count >= self.max_rounds or max_score_reached(self.game_state.round_info)
+
+    def step(self, actions_left, actions_right):
+        return self.apply({self.left_id: actions_left, self.right_id: actions_right})
+
+    def apply(self, actions_by_player):
+        # 按队伍编号给出动作，缺席的队伍全员nope，与服务器处理超时的方式一致
+        self.round_count += 1
+        return resolve_round(self.game_state, actions_by_player, self.round_count, self.rng)
+
+
+def random_bot(round_info, player_id, rng=random):
+    # 示例机器人：每名球员随机选择动作和目标位置
+    for player in round_info.player_info:
+        if player.player_id == player_id:
+            return [{"starId": star.star_id,
+                     "action": rng.choice(GameConfig.ACTION_TYPES),
+                     "x": rng.randrange(GameConfig.FIELD_WIDTH),
+                     "y": rng.randrange(GameConfig.FIELD_HEIGHT)} for star in player.stars]
+    return []
+
+
+def chase_bot(round_info, player_id, rng=random):
+    # 所有球员随机选择动作，移动目标都在球附近，传球都传向对方球门，
+    # 抢断、铲球、僵直、传球和进球都经常发生，用于比较两种结算路径
+    ball = round_info.ball_info
+    for player in round_info.player_info:
+        if player.player_id == player_id:
+            goal_x = GameConfig.FIELD_WIDTH - 1 if player.side == 'left' else 0
+            actions = []
+            for star in player.stars:
+                action = rng.choice(GameConfig.ACTION_TYPES)
+                if action in ("shortPass", "longPass"):
+                    x, y = goal_x, GameConfig.FIELD_HEIGHT // 2
+                else:
+                    x, y = ball.pos.x + rng.randint(-3, 3), ball.pos.y + rng.randint(-3, 3)
+                actions.append({"starId": star.star_id, "action": action, "x": x, "y": y})
+            return actions
+    return []
+
+
+def load_bot(spec):
+    # "module:function"形式，便于在工作进程中按名字加载
+    module_name, _, func_name = spec.partition(':')
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+def play_match(left_bot, right_bot, max_rounds=GameConfig.MAX_TURNS, seed=None):
+    match = Match(max_rounds=max_rounds, seed=seed)
+    round_info = match.game_state.round_info
+    while not match.done:
+        round_info = match.step(left_bot(round_info, match.left_id), right_bot(round_info, match.right_id))
+    return match
+
+
+def play_matches(left_bot, right_bot, n_matches, max_rounds=GameConfig.MAX_TURNS, seeds=None):
+    # 多场比赛同步推进，每回合的移动阶段由数组后端一次算完，其余规则与play_match相同。需要numpy
+    from vector_state import VectorState, resolve_rounds
+    matches = [Match(max_rounds=max_rounds, seed=seed) for seed in (seeds or [None] * n_matches)]
+    vector = VectorState(len(matches))
+    active = [match for match in matches if not match.done]
+    while active:
+        actions = [{match.left_id: left_bot(match.game_state.round_info, match.left_id),
+                    match.right_id: right_bot(match.game_state.round_info, match.right_id)} for match in active]
+        for match in active:
+            match.round_count += 1
+        resolve_rounds(vector, [match.game_state for match in active], actions,
+                       [match.round_count for match in active], [match.rng for match in active])
+        active = [match for match in active if not match.done]
+    return matches
+
+
+def check_vector_parity(n_matches=16, max_rounds=GameConfig.MAX_TURNS, seed=0):
+    # 同样的种子和chase_bot动作分别交给resolve_round和数组后端，逐回合比较完整状态。
+    # 返回第一处不一致的 (比赛序号, 回合)，全部一致时返回None
+    from vector_state import VectorState, resolve_rounds
+    scalar = [Match(max_rounds=max_rounds, seed=seed + i) for i in range(n_matches)]
+    batched = [Match(max_rounds=max_rounds, seed=seed + i) for i in range(n_matches)]
+    action_rngs = [random.Random(seed + i) for i in range(n_matches)]
+    vector = VectorState(n_matches)
+    for round_no in range(1, max_rounds + 1):
+        actions = [{match.left_id: chase_bot(match.game_state.round_info, match.left_id, rng),
+                    match.right_id: chase_bot(match.game_state.round_info, match.right_id, rng)}
+                   for match, rng in zip(scalar, action_rngs)]
+        for match, match_actions in zip(scalar, actions):
+            match.apply(match_actions)
+        for match in batched:
+            match.round_count += 1
+        resolve_rounds(vector, [match.game_state for match in batched], actions, [round_no] * n_matches,
+                       [match.rng for match in batched])
+        for i, (expected, actual) in enumerate(zip(scalar, batched)):
+            if state_from_round_info(expected.game_state.round_info, round_no) != \
+                    state_from_round_info(actual.game_state.round_info, round_no):
+                return i, round_no
+    return None
+
+
+def _play_batch_match(args):
+    left_spec, right_spec, max_rounds = args
+    match = play_match(load_bot(left_spec), load_bot(right_spec), max_rounds)
+    return match.round_count
+
+
+def _play_vector_batch(args):
+    left_spec, right_spec, max_rounds, n_matches = args
+    return sum(match.round_count for match in play_matches(load_bot(left_spec), load_bot(right_spec), n_matches,
+                                                           max_rounds))
+
+
+def run_batch(n_matches, left_spec='engine:random_bot', right_spec='engine:random_bot', workers=None,
+              max_rounds=GameConfig.MAX_TURNS, vector_batch=0):
+    # vector_batch > 0 时每个任务用数组后端同步推进这么多场比赛，否则每个任务一场
+    workers = workers or os.cpu_count()
+    if vector_batch:
+        play = _play_vector_batch
+        jobs = [(left_spec, right_spec, max_rounds, min(vector_batch, n_matches - i))
+                for i in range(0, n_matches, vector_batch)]
+    else:
+        play = _play_batch_match
+        jobs = [(left_spec, right_spec, max_rounds)] * n_matches
+    start = time.perf_counter()
+    if workers == 1:
+        total_rounds = sum(map(play, jobs))
+    else:
+        chunksize = max(1, len(jobs) // (workers * 4))
+        with multiprocessing.Pool(workers) as pool:
+            total_rounds = sum(pool.imap_unordered(play, jobs, chunksize=chunksize))
+    elapsed = time.perf_counter() - start
+    return total_rounds, elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Headless batch self-play')
+    parser.add_argument('-n', '--matches', type=int, default=100, help='Number of matches (default: 100)')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='Worker processes (default: CPU count)')
+    parser.add_argument('-r', '--rounds', type=int, default=GameConfig.MAX_TURNS,
+                        help=f'Rounds per match (default: {GameConfig.MAX_TURNS})')
+    parser.add_argument('--left', default='engine:random_bot', help='Left bot as module:function')
+    parser.add_argument('--right', default='engine:random_bot', help='Right bot as module:function')
+    parser.add_argument('--vector', type=int, default=0, metavar='N',
+                        help='Advance N matches in lockstep per task with the NumPy backend (default: 0, off)')
+    parser.add_argument('--check-vector', action='store_true',
+                        help='Compare the NumPy backend with resolve_round round by round, then exit')
+
+    args = parser.parse_args()
+
+    if args.check_vector:
+        mismatch = check_vector_parity(args.matches, args.rounds)
+        if mismatch:
+            print(f"NumPy backend differs from resolve_round: match {mismatch[0]}, round {mismatch[1]}")
+            sys.exit(1)
+        print(f"NumPy backend matches resolve_round: {args.matches} matches, {args.rounds} rounds")
+        sys.exit(0)
+
+    total_rounds, elapsed = run_batch(args.matches, args.left, args.right, args.workers, args.rounds, args.vector)
+    print(f"Played {args.matches} matches, {total_rounds} rounds in {elapsed:.2f}s "
+          f"({total_rounds / elapsed:.0f} rounds/sec)")
@@ -1,62 +1,224 @@
+import json
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from config.game_config import GameConfig
+
+# 阵容表：每队的球员编号和属性，与GameConfig放在一起，首次使用时加载一次
+ROSTER_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'config', 'rosters.json')
+# 阵容表中的属性名 -> (StaticStarInfo的参数名, 最小值, 最大值)，取值须为整数
+STAR_ATTRIBUTES = {
+    "stamina": ("stamina", 1, GameConfig.MAX_STAMINA),
+    "run": ("run", 0, 1000),
+    "rush": ("rush", 0, 1000),
+    "shortPass": ("short_pass", 0, 1000),
+    "longPass": ("long_pass", 0, 1000),
+    "shot": ("shot", 0, 1000),
+    "steal": ("steal", 0, 1000),
+    "slide": ("slide", 0, 1000)
+}
+
+
 class Pos:
-    def __init__(self, x, y):
-        self.x = x
-        self.y = y
+    # 不可变坐标。场内每个格子（以及表示“无位置”的-1）只有一个实例，
+    # Pos(x, y)直接返回驻留的实例，移动球员不会产生新对象
+    __slots__ = ('x', 'y')
+    _interned = []
+    _stride = GameConfig.FIELD_HEIGHT + 1
+
+    def __new__(cls, x, y):
+        if -1 <= x < GameConfig.FIELD_WIDTH and -1 <= y < GameConfig.FIELD_HEIGHT and cls._interned:
+            return cls._interned[(x + 1) * cls._stride + y + 1]
+        pos = object.__new__(cls)
+        object.__setattr__(pos, 'x', x)
+        object.__setattr__(pos, 'y', y)
+        return pos
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Pos is immutable")
+
+    def __reduce__(self):
+        return Pos, (self.x, self.y)
+
+    def __eq__(self, other):
+        return self is other or (isinstance(other, Pos) and self.x == other.x and self.y == other.y)
+
+    def __hash__(self):
+        return hash((self.x, self.y))
+
+    def __repr__(self):
+        return f"Pos({self.x}, {self.y})"
+
+
+Pos._interned = [Pos(x, y) for x in range(-1, GameConfig.FIELD_WIDTH) for y in range(-1, GameConfig.FIELD_HEIGHT)]
 
 
 class StaticStarInfo:
+    # 球员的固定属性。由阵容表创建一次，所有使用该阵容的比赛共享同一个实例，因此不可修改。
+    # 阵容表中没有给出的属性取这里的默认值
+    __slots__ = ('star_id', 'stamina', 'run', 'rush', 'shortPass', 'longPass', 'shot', 'steal', 'slide', 'overall')
+
     def __init__(self, star_id, stamina=7600, run=8, rush=40, short_pass=8, long_pass=40, shot=100, steal=100,
                  slide=200):
-        self.star_id = star_id
-        self.stamina = stamina
-        self.run = run
-        self.rush = rush
-        self.shortPass = short_pass
-        self.longPass = long_pass
-        self.shot = shot
-        self.steal = steal
-        self.slide = slide
-        self.overall = stamina + run + rush + short_pass + long_pass + shot + steal + slide
+        values = (star_id, stamina, run, rush, short_pass, long_pass, shot, steal, slide,
+                  stamina + run + rush + short_pass + long_pass + shot + steal + slide)
+        for name, value in zip(self.__slots__, values):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("StaticStarInfo is read-only")
+
+    def __reduce__(self):
+        return StaticStarInfo, (self.star_id, self.stamina, self.run, self.rush, self.shortPass, self.longPass,
+                                self.shot, self.steal, self.slide)
+
+    def __repr__(self):
+        return f"StaticStarInfo({self.star_id}, overall={self.overall})"
+
+
+class Roster:
+    # 队名 -> 球员属性记录的元组。记录在加载时建好，创建比赛时直接引用，不再逐场构造
+    __slots__ = ('teams', 'star_ids')
+
+    def __init__(self, teams):
+        self.teams = teams
+        self.star_ids = {name: frozenset(star.star_id for star in stars) for name, stars in teams.items()}
+
+    def __contains__(self, team_name):
+        return team_name in self.teams
+
+    @property
+    def default_team(self):
+        return next(iter(self.teams))
+
+    def stars(self, team_name):
+        return self.teams.get(team_name, ())
+
+    def compatible(self, team_name, other):
+        # 同场两队的球员编号不能重复
+        return self.star_ids.get(team_name, frozenset()).isdisjoint(self.star_ids.get(other, ()))
+
+    def opponent_team(self, team_name):
+        # 与给定阵容编号不冲突的第一套阵容，两队选了冲突的阵容时右侧换用它
+        return next((name for name in self.teams if self.compatible(team_name, name)), None)
+
+
+def is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def load_roster(path=ROSTER_FILE):
+    # 文件格式：{"defaults": {属性: 值}, "teams": {队名: [{"id": 球员编号, 属性: 值（可选，覆盖默认值）}]}}。
+    # 开球阵型决定每队人数上限，编号须在1..MAX_STAR_ID之内，属性须是STAR_ATTRIBUTES范围内的整数
+    with open(path) as f:
+        data = json.load(f)
+    defaults = data.get("defaults", {})
+    formation_size = len(GameConfig.KICKOFF_FORMATION)
+    teams = {}
+    for team_name, stars in data["teams"].items():
+        if not stars or len(stars) > formation_size:
+            raise ValueError(f"Team {team_name} needs 1-{formation_size} stars")
+        records = []
+        for star in stars:
+            star_id = star.get("id") if isinstance(star, dict) else None
+            if not is_int(star_id) or not 1 <= star_id <= GameConfig.MAX_STAR_ID:
+                raise ValueError(f"Star id {star_id!r} in team {team_name} is outside 1-{GameConfig.MAX_STAR_ID}")
+            attributes = dict(defaults, **{key: value for key, value in star.items() if key != "id"})
+            for key, value in attributes.items():
+                if key not in STAR_ATTRIBUTES:
+                    raise ValueError(f"Unknown attribute {key} for star {star_id} in team {team_name}")
+                _, low, high = STAR_ATTRIBUTES[key]
+                if not is_int(value) or not low <= value <= high:
+                    raise ValueError(f"Attribute {key}={value!r} for star {star_id} in team {team_name} "
+                                     f"is outside {low}-{high}")
+            records.append(StaticStarInfo(star_id, **{STAR_ATTRIBUTES[key][0]: value
+                                                      for key, value in attributes.items()}))
+        if len({star.star_id for star in records}) != len(records):
+            raise ValueError(f"Team {team_name} has duplicate star ids")
+        teams[team_name] = tuple(records)
+    roster = Roster(teams)
+    for team_name in teams:
+        if roster.opponent_team(team_name) is None:
+            raise ValueError(f"No team in {path} can play against {team_name} without clashing star ids")
+    return roster
+
+
+_roster = None
+
+
+def get_roster():
+    global _roster
+    if _roster is None:
+        _roster = load_roster()
+    return _roster
+
+
+def use_roster(path):
+    # 换用指定的阵容表，须在创建比赛之前调用
+    global _roster
+    _roster = load_roster(path)
+    return _roster
 
 
 class StaticPlayerInfo:
+    __slots__ = ('player_id', 'player_name', 'team_name', 'side', 'stars')
+
     def __init__(self, player_id, side, player_name, team_name):
         self.player_id = player_id
         self.player_name = player_name
         self.team_name = team_name
         self.side = side
-        if team_name == "A":
-            self.stars = [StaticStarInfo(1), StaticStarInfo(2), StaticStarInfo(3), StaticStarInfo(4), StaticStarInfo(5)]
-        elif team_name == "B":
-            self.stars = [StaticStarInfo(6), StaticStarInfo(7), StaticStarInfo(8), StaticStarInfo(9),
-                          StaticStarInfo(10)]
+        self.stars = get_roster().stars(team_name)
 
 
 class StarStatus:
+    __slots__ = ('state', 'cd_remain')
+
     def __init__(self):
         self.state = "normal"
         self.cd_remain = 0
 
+    def reset(self):
+        self.state = "normal"
+        self.cd_remain = 0
+
+    def stun(self, rounds):
+        self.state = "stun"
+        self.cd_remain = rounds
+
+    def tick(self):
+        # 僵直倒计时，结束后恢复正常
+        self.cd_remain -= 1
+        if self.cd_remain <= 0:
+            self.reset()
+
 
 class StarInfo:
+    __slots__ = ('star_id', 'pos', 'stamina', 'star_state')
+
     def __init__(self, star_id):
         self.star_id = star_id
         self.pos = None
         self.stamina = 0
         self.star_state = StarStatus()
 
+    def move_to(self, x, y):
+        self.pos = Pos(x, y)
+
 
 class PlayerInfo:
+    __slots__ = ('player_id', 'side', 'stars')
+
     def __init__(self, player_id, side, team_name):
         self.player_id = player_id
         self.side = side
-        if team_name == "A":
-            self.stars = [StarInfo(1), StarInfo(2), StarInfo(3), StarInfo(4), StarInfo(5)]
-        elif team_name == "B":
-            self.stars = [StarInfo(6), StarInfo(7), StarInfo(8), StarInfo(9), StarInfo(10)]
+        self.stars = [StarInfo(star.star_id) for star in get_roster().stars(team_name)]
 
 
 class BallPassInfo:
+    __slots__ = ('start_pos', 'target_pos', 'round_begin', 'round_end', 'path')
+
     def __init__(self, start_pos, target_pos, round_begin, round_end, path):
         self.start_pos = start_pos
         self.target_pos = target_pos
@@ -66,6 +228,8 @@ class BallPassInfo:
 
 
 class BallInfo:
+    __slots__ = ('status', 'pos', 'player_id', 'star_id', 'pass_info')
+
     def __init__(self):
         self.status = "stand"
         self.pos = Pos(-1, -1)
@@ -73,14 +237,43 @@ class BallInfo:
         self.star_id = -1
         self.pass_info = None
 
+    def place(self, pos):
+        # 球停在某处无人控制
+        self.status = "stand"
+        self.pos = pos
+        self.player_id = -1
+        self.star_id = -1
+        self.pass_info = None
+
+    def hold(self, player_id, star_id, pos):
+        self.status = "hold"
+        self.pos = pos
+        self.player_id = player_id
+        self.star_id = star_id
+        self.pass_info = None
+
+    def start_pass(self, player_id, pass_info):
+        self.status = "pass"
+        self.pos = pass_info.start_pos
+        self.player_id = player_id
+        self.star_id = -1
+        self.pass_info = pass_info
+
 
 class RoundInfo:
+    __slots__ = ('ball_info', 'player_info', 'score')
+
     def __init__(self):
         self.ball_info = None
         self.player_info = []
+        self.score = {}
 
 
 class GameState:
+    __slots__ = ('static_player_info', 'round_info', 'spatial_index', 'star_owners')
+
     def __init__(self):
         self.static_player_info = []
         self.round_info = RoundInfo()
+        self.spatial_index = None  # 球员位置的空间索引，由规则模块维护
+        self.star_owners = None  # star_id -> PlayerInfo，随空间索引一起建立
@@ -1,15 +1,46 @@
 import argparse
+import itertools
 import json
+import os
+import random
+import secrets
 import socket
 import sys
 import time
 from threading import Thread
 from game_state import *
+from checkpoint import (DEFAULT_CHECKPOINT_INTERVAL, CheckpointWriter, load_checkpoint, round_info_from_state,
+                        static_players_from_json, static_players_to_json)
+from metrics import ServerMetrics, write_snapshot
+from replay import ReplayWriter
+from spectators import DEFAULT_SPECTATOR_QUEUE, Spectator
+from rules import kickoff, max_score_reached, resolve_round
 import select
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.codec import CODECS, JSON_CODEC, CodecError
+from common.delta import DeltaEncoder, state_from_round_info
+from common.framing import FRAMING_MODES, FrameDecoder, FrameError, encode_frame
+from common.log import add_log_arguments, get_logger, setup_logging_from_args
+
+
+# 比赛打完得出最终结果的结束原因，其余（掉线、会话过期、回合超时）视为中断
+FINAL_RESULTS = ("Game completed", "Max score reached")
+
+# 单个连接允许积压的最大未发送字节数，超过即视为客户端卡死
+MAX_WRITE_BUFFER = 4 * 1024 * 1024
+# 退出前写出积压数据（如比赛结束消息）时每个连接最多等待的秒数
+SHUTDOWN_FLUSH_TIMEOUT = 1.0
+
+# 录像文件名的进程内序号，同一秒、同一种子的比赛（例如-s固定种子的重赛）也不会同名
+_replay_numbers = itertools.count(1)
+
 
 class GameServer:
-    def __init__(self, host='0.0.0.0', port=6001, timeout=30, teams=None):
+    def __init__(self, host='0.0.0.0', port=6001, timeout=30, teams=None, framing='length', keyframe_interval=0,
+                 replay_dir=None, seed=None, metrics_file=None, metrics_interval=5.0, reconnect_grace=10.0,
+                 spectator_queue=DEFAULT_SPECTATOR_QUEUE, checkpoint_file=None,
+                 checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL, restore=False, rematches=0):
         self.awaiting_responses = None
         self.round_responses = None
         self.round_start_time = None
@@ -21,13 +52,41 @@ class GameServer:
         self.ready_teams = set()
         self.server_socket = None
         self.all_sockets = []
+        self.framing = framing
+        self.decoders = {}  # 每个连接的增量读缓冲
+        self.codecs = {}  # 注册时协商的编解码器，默认JSON
         self.running = False
         self.game_started = False
         self.round_count = 0
         self.max_rounds = 500
         self.round_timeout = 0.5  # 0.5秒回合超时
         self.team_timeout_times = {}
+        self.metrics = ServerMetrics()  # 各阶段耗时直方图、每队响应耗时和回合速率
+        self.metrics_file = metrics_file
+        self.metrics_interval = metrics_interval
+        self.next_metrics_dump = 0.0
+        self.round_deadline = None  # 当前回合的截止时间，到点后缺席的队伍按nope结算
+        self.reconnect_grace = reconnect_grace  # 比赛中掉线的队伍保留会话的秒数，0表示掉线即结束比赛
+        self.sessions = {}  # player_id -> 注册时发放的会话令牌
+        self.disconnected = {}  # player_id -> 会话过期时刻；期间该队按nope结算
+        self.inquiry_history = []  # 最近一个关键帧起发出的查询，用于给重连的客户端补发
+        self.spectators = {}  # socket -> Spectator，只接收状态，不参与比赛
+        self.outbox = {}  # socket -> 还没写出的字节，连接可写时由主循环继续发送
+        self.spectator_queue = spectator_queue
+        self.log = get_logger("server")
         self.game_state = GameState()
+        self.delta_encoder = DeltaEncoder(keyframe_interval)
+        self.replay_dir = replay_dir
+        self.replay = None
+        self.seed = seed  # 固定种子便于复现；为None时每场比赛随机生成并写入回放
+        self.match_seed = None
+        self.rng = random.Random()
+        self.checkpoint_file = checkpoint_file  # 每checkpoint_interval回合把比赛状态写入该文件，进程退出后可恢复
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoint = None
+        self.restore = restore
+        self.kickoff_state = None  # 开球时的状态快照，重赛时据此原地重置
+        self.rematches = rematches  # 比赛结束后在同一进程内接着进行的重赛场数
 
     def start(self):
         # 创建服务器socket
@@ -40,18 +99,37 @@ class GameServer:
         self.all_sockets = [self.server_socket]
         self.running = True
 
-        print(f"Server started on {self.host}:{self.port}")
-        print(f"Waiting for teams: {', '.join(self.required_teams)}")
-        print(f"Registration timeout: {self.register_timeout} seconds")
+        self.log.info("Server started", host=self.host, port=self.port, teams=self.required_teams,
+                      registration_timeout=self.register_timeout)
 
-        # 启动注册超时计时器
-        Thread(target=self.registration_timer).start()
+        if self.restore:
+            # 从检查点恢复时队伍早已注册，不再等待注册，直接等待各队凭令牌恢复会话
+            self.restore_checkpoint()
+        else:
+            # 启动注册超时计时器
+            Thread(target=self.registration_timer).start()
 
         # 主事件循环
         while self.running:
             try:
-                # 使用select处理多路IO
-                readable, _, _ = select.select(self.all_sockets, [], [], 1)
+                # 使用select处理多路IO，等待时间不超过当前回合的截止时间和最早的会话过期时刻
+                wait = 1
+                if self.round_deadline is not None:
+                    wait = min(wait, max(self.round_deadline - time.time(), 0))
+                if self.disconnected:
+                    wait = min(wait, max(min(self.disconnected.values()) - time.time(), 0))
+                writers = list(self.outbox)
+                if self.spectators:
+                    writers += [s.sock for s in self.spectators.values() if s.pending and s.sock not in self.outbox]
+                readable, writable, _ = select.select(self.all_sockets, writers, [], wait)
+
+                # 积压的数据在连接可写时继续发送
+                for sock in writable:
+                    if sock in self.outbox:
+                        self.flush_outbox(sock)
+                    spectator = self.spectators.get(sock)
+                    if spectator is not None:
+                        self.flush_spectator(spectator)
 
                 for sock in readable:
                     if sock is self.server_socket:
@@ -61,25 +139,31 @@ class GameServer:
                         # 处理客户端消息
                         self.handle_client_message(sock)
 
+                self.check_round_deadline()
+                self.check_sessions()
+
             except Exception as e:
-                print(f"Error: {e}")
+                self.log.error("Event loop error", exc_info=True, error=str(e))
                 continue
 
     def registration_timer(self):
         # 等待注册超时
         time.sleep(self.register_timeout)
+        self.check_registration()
 
-        if not self.running:
+    def check_registration(self):
+        # 比赛已经开始（所有队伍到齐后提前开赛）时不再检查，掉线的队伍由重连宽限期处理
+        if not self.running or self.game_started:
             return
 
-        # 检查是否所有队伍都已注册
-        missing_teams = [t for t in self.required_teams if t not in self.registered_teams]
+        # 检查是否所有队伍都已注册，处于重连宽限期内的队伍也算已注册
+        missing_teams = [t for t in self.required_teams if t not in self.registered_teams and t not in self.disconnected]
 
         if missing_teams:
-            print(f"Registration timeout. Missing teams: {', '.join(missing_teams)}")
+            self.log.warning("Registration timeout", missing=missing_teams)
             self.shutdown()
         elif self.required_teams:
-            print("All teams registered. Starting game...")
+            self.log.info("All teams registered, starting game")
             self.start_game()
 
     def accept_new_connection(self):
@@ -87,42 +171,132 @@ class GameServer:
             client_socket, addr = self.server_socket.accept()
             client_socket.setblocking(False)
             self.all_sockets.append(client_socket)
-            print(f"New connection from {addr}")
+            self.decoders[client_socket] = FrameDecoder(self.framing)
+            self.log.info("New connection", peer=addr)
         except socket.error:
             pass
 
     def handle_client_message(self, client_socket):
         try:
-            data = client_socket.recv(4096)
+            data = client_socket.recv(65536)
             if not data:
                 # 客户端断开连接
                 self.remove_client(client_socket)
                 return
+            self.handle_data(client_socket, data)
+        except socket.error:
+            self.remove_client(client_socket)
 
+    def handle_data(self, client_socket, data):
+        try:
+            frames = self.decoders[client_socket].feed(data)
+        except FrameError as e:
+            self.log.warning("Invalid frame", error=str(e))
+            return
+        self.dispatch_frames(client_socket, frames)
+
+    def dispatch_frames(self, client_socket, frames):
+        # 一次可读事件中可能包含多条完整消息；注册消息可能切换后续消息的编解码器
+        metrics = self.metrics
+        for frame in frames:
+            if client_socket not in self.decoders:
+                return  # 处理前面的消息时连接已被关闭，例如注册被拒绝
+            started = time.perf_counter()
             try:
-                message = json.loads(data.decode())
-                self.process_message(client_socket, message)
-            except json.JSONDecodeError:
-                print("Received invalid JSON")
+                message = self.codecs.get(client_socket, JSON_CODEC).decode(frame)
+            except (json.JSONDecodeError, CodecError):
+                self.log.warning("Received invalid message")
+                continue
+            metrics.record("decode", time.perf_counter() - started)
+            metrics.messages_in += 1
+            metrics.bytes_in += len(frame)
+            self.process_message(client_socket, message)
+
+    def encode_message(self, message, codec=JSON_CODEC):
+        return encode_frame(codec.encode(message), self.framing)
+
+    def write(self, sock, data):
+        # 非阻塞写出：已有积压时排在后面，写不完的部分留在连接的发送缓冲里，等可写时再发，帧不会被截断
+        pending = self.outbox.get(sock)
+        if pending is None:
+            try:
+                sent = sock.send(data)
+            except BlockingIOError:
+                sent = 0
+            if sent == len(data):
+                return
+            data = data[sent:]
+            pending = self.outbox[sock] = bytearray()
+        if len(pending) + len(data) > MAX_WRITE_BUFFER:
+            raise ConnectionResetError("Write buffer overflow")
+        pending += data
+
+    def flush_outbox(self, sock):
+        pending = self.outbox[sock]
+        try:
+            sent = sock.send(pending)
+        except BlockingIOError:
+            return
         except socket.error:
-            self.remove_client(client_socket)
+            self.remove_client(sock)
+            return
+        del pending[:sent]
+        if not pending:
+            del self.outbox[sock]
+
+    def send_message(self, sock, message):
+        self.write(sock, self.encode_message(message, self.codecs.get(sock, JSON_CODEC)))
+
+    def broadcast(self, message, drop_failed=True):
+        # 同一条消息对每种编解码器只编码一次
+        started = time.perf_counter()
+        frames = {}
+        for player_id, sock in list(self.registered_teams.items()):
+            codec = self.codecs.get(sock, JSON_CODEC)
+            frame = frames.get(codec.name)
+            if frame is None:
+                frame = frames[codec.name] = self.encode_message(message, codec)
+            try:
+                self.write(sock, frame)
+                self.metrics.bytes_out += len(frame)
+            except socket.error:
+                self.log.warning("Send failed", msg=message['msgName'], team=player_id)
+                if drop_failed:
+                    self.remove_client(sock)
+        self.metrics.record("send", time.perf_counter() - started)
 
     def process_message(self, client_socket, message):
         msg_name = message.get('msgName')
         msg_data = message.get('msgData')
-        player_id = msg_data.get('playerId')
 
+        # 观战连接只订阅状态，之后发来的任何消息都忽略
+        if client_socket in self.spectators:
+            return
+        if msg_name == 'spectate':
+            self.add_spectator(client_socket, msg_data)
+            return
+
+        player_id = msg_data.get('playerId')
         if not player_id:
-            print("Missing player_id in message")
+            self.log.warning("Missing player_id in message", msg=msg_name)
             return
 
         # 处理注册消息
         if msg_name == 'register':
             player_name = msg_data.get('playerName')
             team_name = msg_data.get("team_name")
-            if player_id in self.registered_teams:
-                print(f"Team {player_id} already registered")
+            if player_id in self.registered_teams or player_id in self.disconnected:
+                self.log.warning("Team already registered", team=player_id)
                 return
+            codec = self.requested_codec(msg_data)
+            if codec is None:
+                self.remove_client(client_socket)
+                return
+            roster = get_roster()
+            if team_name not in roster:
+                self.log.warning("Unknown team roster, using default", team=player_id, roster=team_name,
+                                 default=roster.default_team)
+                team_name = roster.default_team
             if player_id == self.required_teams[0]:
                 side = 'left'
             else:
@@ -130,147 +304,486 @@ class GameServer:
             self.game_state.static_player_info.append(StaticPlayerInfo(player_id, side, player_name, team_name))
             # 记录注册的队伍
             self.registered_teams[player_id] = client_socket
+            self.codecs[client_socket] = codec
             self.team_timeout_times[player_id] = 0
-            print(f"Team registered: {player_id}")
+            self.metrics.team(player_id)
+            self.log.info("Team registered", team=player_id, codec=self.codecs.get(client_socket, JSON_CODEC).name)
+            # 发放会话令牌，掉线后凭它在宽限期内恢复
+            self.sessions[player_id] = secrets.token_hex(16)
+            try:
+                self.send_message(client_socket, {
+                    "msgName": "registered",
+                    "msgData": {
+                        "playerId": player_id,
+                        "token": self.sessions[player_id],
+                        "grace": self.reconnect_grace}})
+            except socket.error:
+                self.log.warning("Send failed", msg="registered", team=player_id)
             # 检查是否所有队伍都已注册
             if all(t in self.registered_teams for t in self.required_teams):
-                print("All teams registered. Starting game...")
+                self.log.info("All teams registered, starting game")
                 self.start_game()
 
         # 处理准备消息
         elif msg_name == 'gameready':
-            print(f"Team {player_id} is ready")
+            self.log.info("Team ready", team=player_id)
             self.ready_teams.add(player_id)
 
-            # 检查是否所有队伍都已准备
-            if self.ready_teams == set(self.required_teams):
-                print("All teams are ready. Starting rounds...")
+            # 检查是否所有队伍都已准备；重连的客户端可能重复发送，回合已开始时忽略
+            if self.ready_teams == set(self.required_teams) and self.awaiting_responses is None:
+                self.log.info("All teams ready, starting rounds")
                 self.start_round()
 
+        # 客户端发现增量序号不连续，补发完整状态
+        elif msg_name == 'resync':
+            if self.registered_teams.get(player_id) is client_socket and self.delta_encoder.prev is not None:
+                self.send_message(client_socket, {
+                    "msgName": "resync",
+                    "msgData": self.delta_encoder.keyframe()})
+
+        # 掉线的队伍凭令牌恢复会话
+        elif msg_name == 'resume':
+            self.resume_session(client_socket, player_id, msg_data)
+
         # 处理回合响应
         elif msg_name == 'response':
-            if player_id in self.awaiting_responses:
-                print(f"Received response from {player_id}")
+            # 忽略已经结束的回合的迟到响应
+            if msg_data.get('round', self.round_count) != self.round_count:
+                return
+            if self.awaiting_responses and player_id in self.awaiting_responses:
+                self.metrics.team(player_id).response(time.time() - self.round_start_time, msg_data.get('thinkTime'))
+                self.log.debug("Received response", team=player_id, round=self.round_count)
                 self.awaiting_responses.remove(player_id)
-                self.round_responses[player_id] = message.get('data', {})
-
-                # 游戏进行中，检查回合状态
-                if self.game_started and self.round_count < self.max_rounds:
-                    if not self.check_round_status(player_id):
-                        return
+                data = msg_data.get('data')
+                # 格式不对的回答按未作答处理，不能让结算在回合中途出错
+                self.round_responses[player_id] = data if isinstance(data, dict) else {}
 
-                # 检查是否所有队伍都已响应
+                # 所有队伍都已响应，不必等到截止时间
                 if not self.awaiting_responses:
-                    print("All teams responded. Processing round...")
-                    self.process_round()
-                    self.start_round()
+                    self.finish_round()
+
+    def add_spectator(self, client_socket, msg_data):
+        codec = self.requested_codec(msg_data)
+        if codec is None:
+            self.remove_client(client_socket)
+            return
+        self.codecs[client_socket] = codec
+        spectator = Spectator(client_socket, codec, msg_data.get('spectatorId'), self.spectator_queue)
+        self.spectators[client_socket] = spectator
+        spectator.offer_message(self.encode_message({
+            "msgName": "spectating",
+            "msgData": {
+                "teams": self.required_teams,
+                "max_rounds": self.max_rounds,
+                "round": self.round_count,
+                "codec": codec.name}}, codec))
+        if self.delta_encoder.prev is not None:
+            # 比赛已在进行，立即补一帧当前状态，不必等到下一回合
+            spectator.offer(None, False, lambda: self.encode_message(self.watch_keyframe(), codec))
+        self.log.info("Spectator joined", spectator=spectator.name, codec=codec.name, spectators=len(self.spectators))
+        self.flush_spectator(spectator)
+
+    def watch_keyframe(self):
+        msg_data = self.delta_encoder.keyframe()
+        msg_data["round"] = self.round_count
+        return {"msgName": "watch", "msgData": msg_data}
+
+    def publish(self, inquiry_data):
+        # 本回合状态对每种编解码器只编码一次，分发给所有观众；关键帧只在有观众需要重新同步时才编码
+        frames = {}
+        keyframes = {}
+
+        def keyframe_frame(codec):
+            frame = keyframes.get(codec.name)
+            if frame is None:
+                frame = keyframes[codec.name] = self.encode_message(self.watch_keyframe(), codec)
+            return frame
+
+        for spectator in list(self.spectators.values()):
+            codec = spectator.codec
+            frame = frames.get(codec.name)
+            if frame is None:
+                frame = frames[codec.name] = self.encode_message({"msgName": "watch", "msgData": inquiry_data}, codec)
+            spectator.offer(frame, inquiry_data["keyframe"], lambda codec=codec: keyframe_frame(codec))
+            self.flush_spectator(spectator)
+
+    def flush_spectator(self, spectator):
+        # 同一连接上还有普通消息没写完时先等它写完，两路数据不能交错
+        if spectator.sock in self.outbox:
+            return
+        if not spectator.flush():
+            self.remove_client(spectator.sock)
+
+    def requested_codec(self, msg_data):
+        # 客户端请求的编解码器；不存在或不支持本服务器的分帧模式（二进制只能用length）时返回None。
+        # 客户端发出请求后立即切换编解码器，所以不能悄悄退回JSON，只能拒绝连接
+        name = msg_data.get('codec', 'json')
+        codec = CODECS.get(name) if isinstance(name, str) else None
+        if codec is not None and self.framing in codec.framings:
+            return codec
+        self.log.warning("Unsupported codec", codec=name, framing=self.framing)
+        return None
+
+    def resume_session(self, client_socket, player_id, msg_data):
+        token = self.sessions.get(player_id)
+        codec = self.requested_codec(msg_data)
+        if codec is None or not self.game_started or token is None or msg_data.get('token') != token:
+            self.log.warning("Resume rejected", team=player_id)
+            try:
+                self.send_message(client_socket, {
+                    "msgName": "resumed",
+                    "msgData": {"playerId": player_id, "accepted": False}})
+            except socket.error:
+                pass
+            self.remove_client(client_socket)
+            return
+
+        old_socket = self.registered_teams.get(player_id)
+        self.registered_teams[player_id] = client_socket
+        self.disconnected.pop(player_id, None)
+        self.codecs[client_socket] = codec
+        if old_socket is not None and old_socket is not client_socket:
+            # 服务器还没发现旧连接断开，直接由新连接取代
+            self.remove_client(old_socket)
+
+        # 补发客户端缺失的查询：从它已有的序号之后开始，缺得太多时从最近的关键帧开始。
+        # 本回合还没响应时，最后一条作为查询发出，客户端照常作答
+        seq = msg_data.get('seq', 0)
+        history = self.inquiry_history
+        if history and history[0]["seq"] > seq + 1:
+            missed = list(history)
+        else:
+            missed = [inquiry for inquiry in history if inquiry["seq"] > seq]
+        pending = self.awaiting_responses is not None and player_id not in self.round_responses
+        if pending and history and history[-1] not in missed:
+            missed.append(history[-1])
+
+        player = next(p for p in self.game_state.round_info.player_info if p.player_id == player_id)
+        try:
+            self.send_message(client_socket, {
+                "msgName": "resumed",
+                "msgData": {
+                    "playerId": player_id,
+                    "accepted": True,
+                    "round": self.round_count,
+                    "max_rounds": self.max_rounds,
+                    "round_timeout": self.round_timeout,
+                    "side": player.side,
+                    "stars": [star.star_id for star in player.stars],
+                    "started": self.awaiting_responses is not None}})
+            for i, inquiry in enumerate(missed):
+                last = i == len(missed) - 1
+                self.send_message(client_socket, {
+                    "msgName": "inquiry" if last and pending else "resync",
+                    "msgData": inquiry})
+        except socket.error:
+            self.remove_client(client_socket)
+            return
+        self.log.info("Team resumed", team=player_id, round=self.round_count, missed=len(missed))
+
+        if pending:
+            self.awaiting_responses.add(player_id)
+            if self.round_deadline is None:
+                # 所有队伍都掉线时回合暂停，恢复后重新计时
+                self.round_start_time = time.time()
+                self.set_round_deadline(self.round_start_time + self.round_timeout)
 
     def start_game(self):
         if self.game_started:
             return
         self.game_started = True
         self.round_count = 0
-        self.game_state.round_info.ball_info = BallInfo()
-        self.game_state.round_info.player_info.append(
-            PlayerInfo(self.required_teams[0], 'left', self.game_state.static_player_info[0].team_name))
-        self.game_state.round_info.player_info.append(
-            PlayerInfo(self.required_teams[1], 'right', self.game_state.static_player_info[1].team_name))
-
-        # 发送游戏开始消息
-        game_start_msg = json.dumps({
-            "msgName": "gamestart",
-            "msgData": {
-                "max_rounds": self.max_rounds}
-        }).encode()
-
-        for player_id, sock in self.registered_teams.items():
+        static_info = {info.player_id: info for info in self.game_state.static_player_info}
+        left = static_info[self.required_teams[0]]
+        right = static_info[self.required_teams[1]]
+        roster = get_roster()
+        if not roster.compatible(left.team_name, right.team_name):
+            # 两队阵容的球员编号冲突时（例如选了同一套），右侧换用一套不冲突的，保证球员编号不重复
+            right = StaticPlayerInfo(right.player_id, 'right', right.player_name, roster.opponent_team(left.team_name))
+        self.game_state.static_player_info = [left, right]
+        self.kickoff_state = self.kickoff_snapshot()
+        self.begin_match()
+        self.send_gamestart()
+
+    def kickoff_snapshot(self):
+        # 按双方阵容摆好开球站位，返回开球时的状态快照
+        left, right = self.game_state.static_player_info
+        round_info = self.game_state.round_info
+        round_info.ball_info = BallInfo()
+        round_info.player_info = [PlayerInfo(left.player_id, 'left', left.team_name),
+                                  PlayerInfo(right.player_id, 'right', right.team_name)]
+        round_info.score = {left.player_id: 0, right.player_id: 0}
+        kickoff(self.game_state)
+        return state_from_round_info(round_info, 0)
+
+    def begin_match(self, seed=None):
+        if seed is None:
+            seed = self.seed if self.seed is not None else random.randrange(1 << 32)
+        self.match_seed = seed
+        self.rng.seed(self.match_seed)
+        if self.replay_dir:
+            self.start_replay()
+        if self.checkpoint_file:
+            self.checkpoint = CheckpointWriter(self.checkpoint_file)
+
+    def send_gamestart(self):
+        # 发送游戏开始消息，告知每队的场地方向和球员编号
+        for player in self.game_state.round_info.player_info:
+            sock = self.registered_teams.get(player.player_id)
+            if sock is None:
+                continue
+            game_start_msg = self.encode_message({
+                "msgName": "gamestart",
+                "msgData": {
+                    "max_rounds": self.max_rounds,
+                    "round_timeout": self.round_timeout,
+                    "side": player.side,
+                    "stars": [star.star_id for star in player.stars]}
+            }, self.codecs.get(sock, JSON_CODEC))
+            player_id = player.player_id
             try:
-                sock.send(game_start_msg)
-                print(f"Sent gamestart to {player_id}")
+                self.write(sock, game_start_msg)
+                self.log.info("Sent gamestart", team=player_id, side=player.side)
             except socket.error:
-                print(f"Failed to send gamestart to {player_id}")
+                self.log.warning("Send failed", msg="gamestart", team=player_id)
                 self.remove_client(sock)
 
-    def reset_game(self, msg_data):
-        return
-
-    def start_round(self):
+    def start_replay(self):
+        os.makedirs(self.replay_dir, exist_ok=True)
+        players = self.game_state.static_player_info
+        metadata = {
+            "players": [{"playerId": p.player_id, "side": p.side, "team": p.team_name} for p in players],
+            "max_rounds": self.max_rounds,
+            "seed": self.match_seed,
+            "created": time.time()}
+        prefix = f"{time.strftime('%Y%m%d-%H%M%S')}_{'_'.join(p.player_id for p in players)}_{self.match_seed}"
+        # 序号只在本进程内唯一，多个进程共用录像目录时文件可能已存在，换下一个序号重试
+        while True:
+            path = os.path.join(self.replay_dir, f"{prefix}_{next(_replay_numbers)}.rpl")
+            try:
+                self.replay = ReplayWriter(path, metadata)
+                break
+            except FileExistsError:
+                continue
+        self.replay.record(0, {}, state_from_round_info(self.game_state.round_info, 0))
+        self.log.info("Recording replay", path=path, seed=self.match_seed)
+
+    def reset_game(self, msg_data=None):
+        # 用开球快照原地重置比赛，连接、会话和阵容保持不变，各队收到新的gamestart后重新准备
+        msg_data = msg_data or {}
+        self.game_state.round_info = round_info_from_state(self.kickoff_state, self.game_state.static_player_info)
+        self.game_state.spatial_index = None
+        self.round_count = 0
+        self.team_timeout_times = {player_id: 0 for player_id in self.team_timeout_times}
+        self.ready_teams.clear()
+        self.awaiting_responses = None
+        self.round_responses = None
+        self.delta_encoder = DeltaEncoder(self.delta_encoder.keyframe_interval)
+        self.inquiry_history = []
+        self.begin_match(msg_data.get('seed'))
+        self.log.info("Rematch", seed=self.match_seed, remaining=self.rematches)
+        self.send_gamestart()
+
+    def save_checkpoint(self, state):
+        # 元数据在这里复制；状态快照生成后不再修改，随机数状态是不可变的元组，都交给后台线程编码写出
+        self.checkpoint.save({
+            "round": self.round_count,
+            "max_rounds": self.max_rounds,
+            "teams": self.required_teams,
+            "players": static_players_to_json(self.game_state.static_player_info),
+            "timeouts": dict(self.team_timeout_times),
+            "sessions": dict(self.sessions),
+            "seed": self.match_seed,
+            "seq": self.delta_encoder.seq,
+            "created": time.time()}, state, self.rng.getstate())
+
+    def restore_checkpoint(self):
+        # 按检查点重建比赛，各队视为掉线并保留会话，宽限期内凭原令牌恢复后从下一回合继续；
+        # 序号接着检查点往下编，下一回合发关键帧，客户端据此重置本地状态
+        metadata, state, rng_state = load_checkpoint(self.checkpoint_file)
+        self.required_teams = metadata["teams"]
+        self.max_rounds = metadata["max_rounds"]
+        self.game_state = GameState()
+        self.game_state.static_player_info = static_players_from_json(metadata["players"])
+        self.kickoff_state = self.kickoff_snapshot()
+        self.game_state.round_info = round_info_from_state(state, self.game_state.static_player_info)
+        self.game_state.spatial_index = None
+        self.round_count = metadata["round"]
+        self.team_timeout_times = metadata["timeouts"]
+        self.sessions = metadata["sessions"]
+        self.match_seed = metadata["seed"]
+        self.rng.setstate(rng_state)
+        self.delta_encoder.seq = metadata["seq"]
+        self.game_started = True
+        self.ready_teams = set(self.required_teams)
+        self.log.info("Match restored", path=self.checkpoint_file, round=self.round_count, seed=self.match_seed,
+                      teams=self.required_teams)
+        if self.replay_dir:
+            self.log.warning("Replay recording is not resumed after a restore")
+        self.checkpoint = CheckpointWriter(self.checkpoint_file)
+        for player_id in self.required_teams:
+            self.metrics.team(player_id)
+            self.hold_session(player_id)
+        self.start_round(state)
+
+    def start_round(self, state=None):
+        # state为上一回合结算后的状态快照，没有时现场生成
+        if not self.running:
+            return
         if self.round_count >= self.max_rounds:
             self.end_game("Game completed")
             return
 
         self.round_count += 1
-        self.round_start_time = time.time()
         self.awaiting_responses = set(self.registered_teams.keys())
         self.round_responses = {}
 
-        print(f"\nStarting round {self.round_count}/{self.max_rounds}")
-
-        # 发送回合查询消息
-        inquiry_msg = json.dumps({
+        # 发送回合查询消息，附带本回合开始时的状态（完整快照或增量），所有队伍共用一次编码
+        if state is None:
+            state = state_from_round_info(self.game_state.round_info, self.round_count)
+        else:
+            state = dict(state, round=self.round_count)
+        inquiry_data = self.delta_encoder.encode(state)
+        inquiry_data["round"] = self.round_count
+        if inquiry_data["keyframe"]:
+            self.inquiry_history = [inquiry_data]
+        else:
+            self.inquiry_history.append(inquiry_data)
+        self.round_start_time = time.time()
+        # 没有任何队伍在线时不计时，等待掉线的队伍恢复
+        self.set_round_deadline(self.round_start_time + self.round_timeout if self.awaiting_responses else None)
+        self.broadcast({
             "msgName": "inquiry",
-            "msgData": {
-                "round": self.round_count}
-        }).encode()
+            "msgData": inquiry_data
+        })
+        if self.spectators:
+            self.publish(inquiry_data)
+        self.log.debug("Round started", round=self.round_count)
 
-        for player_id, sock in self.registered_teams.items():
-            try:
-                sock.send(inquiry_msg)
-            except socket.error:
-                print(f"Failed to send inquiry to {player_id}")
-                self.remove_client(sock)
+    def set_round_deadline(self, deadline):
+        self.round_deadline = deadline
 
-    def check_round_status(self, player_id):
-        if not hasattr(self, 'round_start_time'):
-            return False
+    def check_round_deadline(self):
+        if self.round_deadline is not None and time.time() >= self.round_deadline:
+            self.on_round_timeout(self.round_count)
 
-        elapsed = time.time() - self.round_start_time
-        if elapsed > self.round_timeout and player_id:
-            print(f"Round timeout! Missing responses from: {player_id}")
-            self.team_timeout_times[player_id] += 1
-            if self.team_timeout_times[player_id] >= 10:
-                self.end_game("Round timeout")
-            return False
-        return True
+    def on_round_timeout(self, round_no):
+        if not self.running or round_no != self.round_count or self.round_deadline is None:
+            return
+        if self.awaiting_responses:
+            self.log.warning("Round timeout", round=round_no, missing=sorted(self.awaiting_responses))
+            for player_id in list(self.awaiting_responses):
+                self.team_timeout_times[player_id] += 1
+                if self.team_timeout_times[player_id] >= 10:
+                    self.end_game("Round timeout")
+                    return
+            self.awaiting_responses.clear()
+        self.finish_round()
+
+    def finish_round(self):
+        # 结算后立即发出下一回合的查询，结算时生成的状态快照同时用于录像和查询
+        self.set_round_deadline(None)
+        self.metrics.round_finished(time.time() - self.round_start_time)
+        state = self.process_round()
+        # 比赛在本回合结束并进入重赛时，等各队重新准备后再开始
+        if self.running and self.awaiting_responses is not None:
+            self.start_round(state)
+        if self.metrics_file and time.time() >= self.next_metrics_dump:
+            self.dump_metrics()
+
+    def dump_metrics(self):
+        self.next_metrics_dump = time.time() + self.metrics_interval
+        try:
+            write_snapshot(self.metrics_file, self.metrics.snapshot(self.round_timeout, self.team_timeout_times))
+        except OSError as e:
+            self.log.warning("Failed to write metrics", path=self.metrics_file, error=str(e))
 
     def process_round(self):
-        # 这里可以添加游戏逻辑，处理回合响应
-        print(f"Round {self.round_count} responses received")
-        # 示例：打印所有队伍的响应
+        # 未响应的队伍按nope处理，动作不是列表的同样视为全员nope
+        started = time.perf_counter()
+        actions = {}
         for player_id, response in self.round_responses.items():
-            print(f"  {player_id}: {response}")
+            player_actions = response.get('actions') if isinstance(response, dict) else None
+            actions[player_id] = player_actions if isinstance(player_actions, list) else []
+        round_info = resolve_round(self.game_state, actions, self.round_count, self.rng)
+        resolved = time.perf_counter()
+        self.metrics.record("resolve", resolved - started)
+        state = state_from_round_info(round_info, self.round_count)
+        self.log.debug("Round resolved", round=self.round_count, responded=sorted(actions), ball=state["ball"])
+        if self.replay:
+            self.replay.record(self.round_count, actions, state)
+        if self.checkpoint and self.round_count % self.checkpoint_interval == 0:
+            self.save_checkpoint(state)
+        self.metrics.record("process_round", time.perf_counter() - started)
+        if max_score_reached(round_info):
+            self.end_game("Max score reached")
+        return state
 
     def end_game(self, reason):
-        print(f"Game over: {reason}")
+        self.log.info("Game over", reason=reason, rounds=self.round_count, score=self.game_state.round_info.score)
+        self.set_round_deadline(None)
+        self.disconnected.clear()
+        for player_id, team in self.metrics.teams.items():
+            latency = team.latency
+            self.log.info("Team latency", team=player_id, responses=latency.count,
+                          p50_ms=round(latency.percentile(0.5) * 1000, 1),
+                          p99_ms=round(latency.percentile(0.99) * 1000, 1), max_ms=round(latency.max * 1000, 1),
+                          timeouts=self.team_timeout_times.get(player_id, 0))
+        if self.metrics_file:
+            self.dump_metrics()
+        if self.replay:
+            self.replay.close()
+            self.replay = None
+        if self.checkpoint:
+            # 比赛打出了最终结果才删除检查点，免得之后误恢复；因掉线、超时结束的保留，仍可用--restore继续
+            self.checkpoint.close(remove=reason in FINAL_RESULTS)
+            self.checkpoint = None
+        rematch = self.rematches > 0 and len(self.registered_teams) == len(self.required_teams)
 
         # 发送游戏结束消息
-        game_over_msg = json.dumps({
+        gameover_msg = {
             "msgName": "gameover",
             "msgData": {
                 "reason": reason,
-                "total_rounds": self.round_count}
-        }).encode()
-
-        for player_id, sock in self.registered_teams.items():
-            try:
-                sock.send(game_over_msg)
-                print(f"Sent gameover to {player_id}")
-            except socket.error:
-                print(f"Failed to send gameover to {player_id}")
-
+                "total_rounds": self.round_count,
+                "score": self.game_state.round_info.score}
+        }
+        if rematch:
+            gameover_msg["msgData"]["rematch"] = True
+        self.broadcast(gameover_msg, drop_failed=False)
+        self.log.debug("Sent gameover", teams=list(self.registered_teams))
+        for spectator in list(self.spectators.values()):
+            spectator.offer_message(self.encode_message(gameover_msg, spectator.codec))
+            self.flush_spectator(spectator)
+
+        if rematch:
+            self.rematches -= 1
+            self.reset_game()
+            return
         self.shutdown()
 
     def remove_client(self, client_socket):
+        spectator = self.spectators.pop(client_socket, None)
+        if spectator is not None:
+            self.log.info("Spectator left", spectator=spectator.name, dropped=spectator.dropped,
+                          spectators=len(self.spectators))
         if client_socket in self.all_sockets:
             self.all_sockets.remove(client_socket)
+        self.decoders.pop(client_socket, None)
+        self.codecs.pop(client_socket, None)
+        self.outbox.pop(client_socket, None)
 
         # 从注册队伍中移除
         for player_id, sock in list(self.registered_teams.items()):
             if sock == client_socket:
                 del self.registered_teams[player_id]
+                if self.game_started and self.running and self.reconnect_grace > 0:
+                    # 比赛中掉线先保留会话，宽限期内没有恢复才结束比赛
+                    self.hold_session(player_id)
+                    continue
                 if player_id in self.ready_teams:
                     self.ready_teams.remove(player_id)
-                print(f"Team disconnected: {player_id}")
+                self.log.warning("Team disconnected", team=player_id)
 
                 # 如果有队伍断开连接，结束游戏
                 if self.game_started:
@@ -281,9 +794,38 @@ class GameServer:
         finally:
             pass
 
+    def hold_session(self, player_id):
+        self.disconnected[player_id] = time.time() + self.reconnect_grace
+        self.log.warning("Team disconnected, holding session", team=player_id, grace=self.reconnect_grace)
+        if self.awaiting_responses and player_id in self.awaiting_responses:
+            self.awaiting_responses.discard(player_id)
+            if not self.awaiting_responses:
+                # 其余队伍都已响应就立即结算；没有队伍在线则暂停本回合
+                self.set_round_deadline(time.time() if self.registered_teams else None)
+
+    def check_sessions(self):
+        now = time.time()
+        for player_id, expires in list(self.disconnected.items()):
+            if now >= expires:
+                del self.disconnected[player_id]
+                self.log.warning("Session expired", team=player_id)
+                if self.game_started and self.running:
+                    self.end_game(f"Team {player_id} disconnected")
+                return
+
     def shutdown(self):
-        print("Shutting down server...")
+        self.log.info("Shutting down server")
         self.running = False
+        if self.checkpoint:
+            # 写完最后一个检查点再退出，之后可用--restore继续
+            self.checkpoint.close()
+        for sock, pending in self.outbox.items():
+            # 尽量把积压的数据写完再关闭连接
+            try:
+                sock.settimeout(SHUTDOWN_FLUSH_TIMEOUT)
+                sock.sendall(pending)
+            except socket.error:
+                pass
         for sock in self.all_sockets:
             try:
                 sock.close()
@@ -298,6 +840,33 @@ if __name__ == "__main__":
     parser.add_argument('-l', '--host', default='0.0.0.0', help='Listening IP (default: 0.0.0.0)')
     parser.add_argument('-c', '--timeout', type=int, default=30, help='Registration timeout in seconds (default: 30)')
     parser.add_argument('-C', '--teams', help='Comma-separated team IDs (e.g., "team1,team2")')
+    parser.add_argument('-f', '--framing', choices=FRAMING_MODES, default='length',
+                        help='Wire framing: length, line or raw (default: length)')
+    parser.add_argument('-k', '--keyframe-interval', type=int, default=0,
+                        help='Send a full state every K rounds and deltas in between (default: 0, always full)')
+    parser.add_argument('-R', '--replay-dir', help='Record every match to a replay file in this directory')
+    parser.add_argument('-s', '--seed', type=int,
+                        help='Fixed random seed for rule resolution (default: random per match)')
+    parser.add_argument('-M', '--metrics-file', help='Periodically write a JSON metrics snapshot to this file')
+    parser.add_argument('--metrics-interval', type=float, default=5.0,
+                        help='Seconds between metrics snapshots (default: 5)')
+    parser.add_argument('-g', '--grace', type=float, default=10.0,
+                        help='Seconds a disconnected team may resume before the match ends '
+                             '(default: 10, 0: end at once)')
+    parser.add_argument('--spectator-queue', type=int, default=DEFAULT_SPECTATOR_QUEUE,
+                        help='Messages a spectator may fall behind before skipping to the latest keyframe '
+                             f'(default: {DEFAULT_SPECTATOR_QUEUE})')
+    parser.add_argument('--checkpoint', help='Write the match state to this file so it can be resumed with --restore')
+    parser.add_argument('--checkpoint-interval', type=int, default=DEFAULT_CHECKPOINT_INTERVAL,
+                        help=f'Rounds between checkpoints (default: {DEFAULT_CHECKPOINT_INTERVAL})')
+    parser.add_argument('--restore', action='store_true',
+                        help='Resume the match saved in --checkpoint; teams reconnect with their session tokens')
+    parser.add_argument('--roster', help='Team roster and star attribute table (default: config/rosters.json)')
+    parser.add_argument('--rematches', type=int, default=0,
+                        help='Replay the match this many more times in-process after it ends (default: 0)')
+    add_log_arguments(parser)
+    parser.add_argument('-a', '--asyncio', action='store_true',
+                        help='Run the asyncio server core instead of the select loop')
 
     args = parser.parse_args()
 
@@ -305,11 +874,39 @@ if __name__ == "__main__":
         print("Error: At least two team IDs required for -C argument")
         sys.exit(1)
 
-    server = GameServer(
+    if args.restore and not args.checkpoint:
+        print("Error: --restore requires --checkpoint")
+        sys.exit(1)
+    if args.restore and args.grace <= 0:
+        print("Error: --restore needs a reconnect grace period (-g) for teams to resume")
+        sys.exit(1)
+
+    setup_logging_from_args(args)
+    if args.roster:
+        use_roster(args.roster)
+
+    server_class = GameServer
+    if args.asyncio:
+        from async_server import AsyncGameServer
+        server_class = AsyncGameServer
+
+    server = server_class(
         host=args.host,
         port=args.port,
         timeout=args.timeout,
-        teams=args.teams
+        teams=args.teams,
+        framing=args.framing,
+        keyframe_interval=args.keyframe_interval,
+        replay_dir=args.replay_dir,
+        seed=args.seed,
+        metrics_file=args.metrics_file,
+        metrics_interval=args.metrics_interval,
+        reconnect_grace=args.grace,
+        spectator_queue=args.spectator_queue,
+        checkpoint_file=args.checkpoint,
+        checkpoint_interval=args.checkpoint_interval,
+        restore=args.restore,
+        rematches=args.rematches
     )
 
     try:
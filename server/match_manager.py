@@ -0,0 +1,318 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import zlib
+from multiprocessing import reduction
+from threading import Thread
+
+from async_server import AsyncGameServer, Connection
+from game_state import use_roster
+from spectators import DEFAULT_SPECTATOR_QUEUE
+from common.framing import FRAMING_MODES, FrameDecoder, FrameError
+from common.log import add_log_arguments, get_logger, logging_options, setup_logging, setup_logging_from_args
+
+DEFAULT_MATCH_ID = "default"
+
+
+def peek_match_id(frames):
+    # 连接的第一条消息（register）决定它属于哪场比赛
+    for frame in frames:
+        try:
+            msg_data = json.loads(frame).get('msgData') or {}
+            match_id = msg_data.get('matchId')
+        except (json.JSONDecodeError, AttributeError):
+            continue
+        return str(match_id or DEFAULT_MATCH_ID)
+    return None
+
+
+class HostedMatch(AsyncGameServer):
+    def __init__(self, manager, match_id, **kwargs):
+        super().__init__(**kwargs)
+        self.manager = manager
+        self.match_id = match_id
+        self.log = get_logger("match", match=match_id)
+        # 未通过-C指定队伍时，按注册顺序确定左右两队
+        self.fixed_teams = bool(self.required_teams)
+        self.loop = manager.loop
+        self.running = True
+        self.registration_handle = self.loop.call_later(self.register_timeout, self.check_registration)
+
+    def attach(self, conn, decoder):
+        self.all_sockets.append(conn)
+        self.decoders[conn] = decoder
+
+    def process_message(self, client_socket, message):
+        msg_data = message.get('msgData') or {}
+        player_id = msg_data.get('playerId')
+        if message.get('msgName') == 'register' and not self.fixed_teams and player_id \
+                and player_id not in self.required_teams and len(self.required_teams) < 2:
+            self.required_teams.append(player_id)
+        super().process_message(client_socket, message)
+
+    def start_game(self):
+        # 第二支队伍注册之前不能开赛
+        if len(self.required_teams) < 2:
+            return
+        super().start_game()
+
+    def check_registration(self):
+        if self.running and len(self.required_teams) < 2:
+            self.log.warning("Registration timeout, not enough teams", teams=self.required_teams)
+            self.shutdown()
+            return
+        super().check_registration()
+
+    def shutdown(self):
+        if not self.running:
+            return
+        self.registration_handle.cancel()
+        super().shutdown()
+        self.manager.remove_match(self.match_id)
+
+
+class MatchManager:
+    def __init__(self, host='0.0.0.0', port=6001, timeout=30, teams=None, framing='length', workers=0,
+                 keyframe_interval=0, replay_dir=None, reconnect_grace=10.0, spectator_queue=DEFAULT_SPECTATOR_QUEUE,
+                 roster_file=None):
+        self.host = host
+        self.port = port
+        self.register_timeout = timeout
+        self.teams = teams
+        self.framing = framing
+        self.workers = workers
+        self.keyframe_interval = keyframe_interval
+        self.replay_dir = replay_dir
+        self.reconnect_grace = reconnect_grace
+        self.spectator_queue = spectator_queue
+        self.roster_file = roster_file
+        if roster_file:
+            # 阵容表每个进程加载一次，进程内所有比赛共享
+            use_roster(roster_file)
+        self.matches = {}
+        self.shards = []
+        self.loop = None
+        self.stopped = None
+        self.running = False
+        self.log = get_logger("manager")
+
+    def start(self):
+        # SIGTERM默认直接结束进程、不执行finally，换成SystemExit，保证工作进程随前端一起退出
+        signal.signal(signal.SIGTERM, _exit_on_sigterm)
+        try:
+            asyncio.run(self.serve())
+        except (KeyboardInterrupt, SystemExit):
+            self.log.info("Shutting down match manager")
+        finally:
+            for _, process in self.shards:
+                process.terminate()
+            for _, process in self.shards:
+                process.join()
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        self.running = True
+        if self.workers:
+            await self.serve_front()
+            return
+        listener = await asyncio.start_server(
+            self.handle_connection, self.host, self.port, reuse_address=True, backlog=1024)
+        self.log.info("Match manager started", host=self.host, port=self.port)
+        async with listener:
+            await self.stopped.wait()
+
+    def get_match(self, match_id):
+        match = self.matches.get(match_id)
+        if match is None:
+            match = HostedMatch(self, match_id, host=self.host, port=self.port, timeout=self.register_timeout,
+                                teams=self.teams, framing=self.framing,
+                                keyframe_interval=self.keyframe_interval, replay_dir=self.replay_dir,
+                                reconnect_grace=self.reconnect_grace, spectator_queue=self.spectator_queue)
+            self.matches[match_id] = match
+            self.log.info("Match created", match=match_id, active=len(self.matches))
+        return match
+
+    def remove_match(self, match_id):
+        if self.matches.pop(match_id, None) is not None:
+            self.log.info("Match finished", match=match_id, active=len(self.matches))
+
+    async def handle_connection(self, reader, writer, initial=b''):
+        conn = Connection(writer)
+        decoder = FrameDecoder(self.framing)
+        match = None
+        data = initial
+        try:
+            while self.running and not conn.closed:
+                if not data:
+                    data = await reader.read(65536)
+                    if not data:
+                        break
+                if match is not None:
+                    match.handle_data(conn, data)
+                    data = b''
+                    continue
+                try:
+                    frames = decoder.feed(data)
+                except FrameError as e:
+                    self.log.warning("Invalid frame", error=str(e))
+                    break
+                data = b''
+                match_id = peek_match_id(frames)
+                if match_id is None:
+                    continue
+                match = self.get_match(match_id)
+                match.attach(conn, decoder)
+                match.dispatch_frames(conn, frames)
+        except ConnectionError:
+            pass
+        finally:
+            if match is not None and match.running:
+                match.remove_client(conn)
+            else:
+                conn.close()
+
+    # ---- 多进程分片：前端进程只负责接受连接并按matchId把socket移交给工作进程 ----
+
+    def start_shards(self):
+        options = dict(host=self.host, port=self.port, timeout=self.register_timeout, teams=self.teams,
+                       framing=self.framing, keyframe_interval=self.keyframe_interval, replay_dir=self.replay_dir,
+                       reconnect_grace=self.reconnect_grace, spectator_queue=self.spectator_queue,
+                       roster_file=self.roster_file)
+        for _ in range(self.workers):
+            parent_pipe, child_pipe = multiprocessing.Pipe()
+            # 子进程会继承本进程持有的所有管道前端，必须在子进程里关掉，前端退出后工作进程才能读到EOF
+            inherited = [pipe for pipe, _ in self.shards] + [parent_pipe]
+            process = multiprocessing.Process(target=run_shard,
+                                              args=(child_pipe, options, logging_options(), inherited), daemon=True)
+            process.start()
+            child_pipe.close()
+            self.shards.append((parent_pipe, process))
+
+    async def serve_front(self):
+        # 先启动工作进程，避免它们继承监听socket
+        self.start_shards()
+        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server_socket.bind((self.host, self.port))
+        server_socket.listen(1024)
+        server_socket.setblocking(False)
+        self.log.info("Match manager started", host=self.host, port=self.port, workers=self.workers)
+        try:
+            while self.running:
+                client_socket, _ = await self.loop.sock_accept(server_socket)
+                self.loop.create_task(self.route_connection(client_socket))
+        finally:
+            server_socket.close()
+
+    async def route_connection(self, client_socket):
+        decoder = FrameDecoder(self.framing)
+        buffered = bytearray()
+        match_id = None
+        try:
+            while match_id is None:
+                data = await self.loop.sock_recv(client_socket, 65536)
+                if not data:
+                    return
+                buffered += data
+                match_id = peek_match_id(decoder.feed(data))
+            pipe, process = self.shards[zlib.crc32(match_id.encode()) % len(self.shards)]
+            # 已读到的字节随socket一起交给工作进程重新解码
+            pipe.send(bytes(buffered))
+            reduction.send_handle(pipe, client_socket.fileno(), process.pid)
+        except (ConnectionError, FrameError) as e:
+            self.log.warning("Failed to route connection", error=str(e))
+        finally:
+            client_socket.close()
+
+    async def serve_shard(self, pipe):
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        self.running = True
+        Thread(target=self.receive_handoffs, args=(pipe,), daemon=True).start()
+        await self.stopped.wait()
+
+    def receive_handoffs(self, pipe):
+        while True:
+            try:
+                initial = pipe.recv()
+                fd = reduction.recv_handle(pipe)
+            except (EOFError, OSError):
+                self.loop.call_soon_threadsafe(self.stopped.set)
+                return
+            self.loop.call_soon_threadsafe(self.adopt, fd, initial)
+
+    def adopt(self, fd, initial):
+        self.loop.create_task(self.adopt_connection(socket.socket(fileno=fd), initial))
+
+    async def adopt_connection(self, sock, initial):
+        reader, writer = await asyncio.open_connection(sock=sock)
+        await self.handle_connection(reader, writer, initial)
+
+
+def _exit_on_sigterm(signum, frame):
+    raise SystemExit(0)
+
+
+def run_shard(pipe, options, log_options=None, inherited=()):
+    # fork出的工作进程继承了前端的SIGTERM处理，恢复默认，terminate()时立即退出
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    for parent_pipe in inherited:
+        parent_pipe.close()
+    if log_options:
+        setup_logging(**log_options)
+    manager = MatchManager(**options)
+    try:
+        asyncio.run(manager.serve_shard(pipe))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Multi-match Game Server')
+    parser.add_argument('-p', '--port', type=int, default=6001, help='Listening port (default: 6001)')
+    parser.add_argument('-l', '--host', default='0.0.0.0', help='Listening IP (default: 0.0.0.0)')
+    parser.add_argument('-c', '--timeout', type=int, default=30,
+                        help='Per-match registration timeout in seconds (default: 30)')
+    parser.add_argument('-C', '--teams', help='Comma-separated team IDs required in every match')
+    parser.add_argument('-f', '--framing', choices=FRAMING_MODES, default='length',
+                        help='Wire framing: length, line or raw (default: length)')
+    parser.add_argument('-k', '--keyframe-interval', type=int, default=0,
+                        help='Send a full state every K rounds and deltas in between (default: 0, always full)')
+    parser.add_argument('-R', '--replay-dir', help='Record every match to a replay file in this directory')
+    parser.add_argument('-g', '--grace', type=float, default=10.0,
+                        help='Seconds a disconnected team may resume before its match ends (default: 10)')
+    parser.add_argument('--spectator-queue', type=int, default=DEFAULT_SPECTATOR_QUEUE,
+                        help='Messages a spectator may fall behind before skipping to the latest keyframe '
+                             f'(default: {DEFAULT_SPECTATOR_QUEUE})')
+    parser.add_argument('--roster', help='Team roster and star attribute table (default: config/rosters.json)')
+    add_log_arguments(parser)
+    parser.add_argument('-w', '--workers', type=int, default=0,
+                        help='Shard matches across N worker processes (0: single process, -1: one per core)')
+
+    args = parser.parse_args()
+
+    if args.teams and len(args.teams.split(',')) < 2:
+        print("Error: At least two team IDs required for -C argument")
+        sys.exit(1)
+
+    setup_logging_from_args(args)
+
+    MatchManager(
+        host=args.host,
+        port=args.port,
+        timeout=args.timeout,
+        teams=args.teams,
+        framing=args.framing,
+        workers=args.workers if args.workers >= 0 else os.cpu_count(),
+        keyframe_interval=args.keyframe_interval,
+        replay_dir=args.replay_dir,
+        reconnect_grace=args.grace,
+        spectator_queue=args.spectator_queue,
+        roster_file=args.roster
+    ).start()
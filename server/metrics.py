@@ -0,0 +1,139 @@
+import bisect
+import json
+import os
+import time
+
+# 耗时直方图的桶边界（秒）：1微秒到约100秒，每个2倍区间分8个桶，分位数相对误差约9%
+BUCKET_BOUNDS = [1e-6 * 2 ** (i / 8) for i in range(8 * 27)]
+
+# 服务器各阶段：消息解码、规则结算、整个process_round、广播（编码加发送）、整个回合（含等待最慢的队伍）
+PHASES = ("decode", "resolve", "process_round", "send", "round")
+
+
+class Histogram:
+    # 固定分桶，记录一次只是一次二分查找和几次加法
+    __slots__ = ('counts', 'count', 'total', 'max', 'last')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def record(self, value):
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+        self.last = value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, q):
+        # 返回所在桶的上界，不超过观测到的最大值
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(BUCKET_BOUNDS[i] if i < len(BUCKET_BOUNDS) else self.max, self.max)
+        return self.max
+
+    def snapshot(self):
+        # 对外统一用毫秒
+        return {"count": self.count,
+                "mean_ms": round(self.mean * 1000, 3),
+                "p50_ms": round(self.percentile(0.5) * 1000, 3),
+                "p99_ms": round(self.percentile(0.99) * 1000, 3),
+                "max_ms": round(self.max * 1000, 3)}
+
+
+class TeamMetrics:
+    # latency为服务器看到的响应耗时；客户端上报思考时间时，差值即网络和编解码耗时
+    __slots__ = ('latency', 'think', 'network')
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.think = Histogram()
+        self.network = Histogram()
+
+    def response(self, latency, think_time=None):
+        self.latency.record(latency)
+        if isinstance(think_time, (int, float)) and 0 <= think_time <= latency:
+            self.think.record(think_time)
+            self.network.record(latency - think_time)
+
+
+class ServerMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {phase: Histogram() for phase in PHASES}
+        self.teams = {}
+        self.rounds = 0
+        self.first_round = None  # 第一回合开始的时刻，回合速率不计等待注册的时间
+        self.messages_in = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        # 最近一个快照周期内的回合速率
+        self.window_start = self.started
+        self.window_rounds = 0
+
+    def record(self, phase, seconds):
+        self.phases[phase].record(seconds)
+
+    def round_finished(self, seconds):
+        if self.first_round is None:
+            self.first_round = time.perf_counter() - seconds
+        self.rounds += 1
+        self.phases["round"].record(seconds)
+
+    def team(self, player_id):
+        team = self.teams.get(player_id)
+        if team is None:
+            team = self.teams[player_id] = TeamMetrics()
+        return team
+
+    def snapshot(self, round_timeout, timeouts):
+        now = time.perf_counter()
+        uptime = now - self.started
+        playing = now - self.first_round if self.first_round is not None else 0.0
+        window = now - self.window_start
+        recent = (self.rounds - self.window_rounds) / window if window > 0 else 0.0
+        self.window_start = now
+        self.window_rounds = self.rounds
+        teams = {}
+        for player_id, team in self.teams.items():
+            p99 = team.latency.percentile(0.99)
+            teams[player_id] = {
+                "latency": team.latency.snapshot(),
+                "think": team.think.snapshot(),
+                "network": team.network.snapshot(),
+                "timeouts": timeouts.get(player_id, 0),
+                # p99响应耗时占回合超时的比例，接近1说明该队随时可能超时
+                "timeout_ratio_p99": round(p99 / round_timeout, 3) if round_timeout else None}
+        return {
+            "time": time.time(),
+            "uptime_s": round(uptime, 3),
+            "rounds": self.rounds,
+            "rounds_per_sec": round(self.rounds / playing, 2) if playing > 0 else 0.0,
+            "rounds_per_sec_recent": round(recent, 2),
+            "round_timeout_ms": round_timeout * 1000,
+            "messages_in": self.messages_in,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "phases": {phase: histogram.snapshot() for phase, histogram in self.phases.items()},
+            "teams": teams}
+
+
+def write_snapshot(path, snapshot):
+    # 先写临时文件再替换，读取方不会看到写了一半的内容
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(snapshot, f, indent=2)
+    os.replace(tmp_path, path)
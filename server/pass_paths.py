@@ -0,0 +1,59 @@
+from functools import lru_cache
+
+from game_state import Pos
+
+
+def line_offsets(dx, dy):
+    # 从原点到(dx, dy)的Bresenham直线偏移，不含起点，含终点
+    offsets = []
+    adx = abs(dx)
+    ady = -abs(dy)
+    sx = 1 if dx > 0 else -1
+    sy = 1 if dy > 0 else -1
+    err = adx + ady
+    x = y = 0
+    while x != dx or y != dy:
+        e2 = 2 * err
+        if e2 >= ady:
+            err += ady
+            x += sx
+        if e2 <= adx:
+            err += adx
+            y += sy
+        offsets.append((x, y))
+    return tuple(offsets)
+
+
+class PassShape:
+    # 一条传球路径的形状，只与偏移量和飞行回合数有关，平移到任意起点都可复用
+    def __init__(self, dx, dy, rounds):
+        self.offsets = line_offsets(dx, dy)
+        self.rounds = rounds
+        length = len(self.offsets)
+        # 格子偏移 -> 路径下标
+        self.index_of = {offset: index for index, offset in enumerate(self.offsets)}
+        # 路径下标 -> 第几个飞行回合经过该格（从0开始）
+        self.round_of = tuple(((index + 1) * rounds + length - 1) // length - 1 for index in range(length))
+        # 第e个飞行回合经过的路径区间[start, end)
+        self.segments = tuple((e * length // rounds, (e + 1) * length // rounds) for e in range(rounds))
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def path_from(self, x, y):
+        return [Pos(x + ox, y + oy) for ox, oy in self.offsets]
+
+    def flight_round(self, start_x, start_y, x, y):
+        # 球在第几个飞行回合经过格子(x, y)，不在路径上返回None
+        index = self.index_of.get((x - start_x, y - start_y))
+        return None if index is None else self.round_of[index]
+
+
+@lru_cache(maxsize=None)
+def pass_shape(dx, dy, rounds):
+    # 偏移量最大不超过长传距离，全部路径形状至多约8千种，缓存不设上限
+    return PassShape(dx, dy, rounds)
+
+
+def flight_rounds(dx, dy, speed):
+    return max(1, -(-max(abs(dx), abs(dy)) // speed))
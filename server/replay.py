@@ -0,0 +1,217 @@
+import argparse
+import bisect
+import json
+import mmap
+import os
+import queue
+import struct
+import sys
+from threading import Thread
+
+from rules import clamp_pos
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.codec import BinaryCodec
+from common.delta import DeltaDecoder, DeltaEncoder
+from config.game_config import GameConfig
+
+# 文件布局：
+#   文件头   MAGIC + 版本(u16) + 元数据JSON长度(u32) + 元数据JSON
+#   回合记录 长度(u32) + 类型(u8) + 回合(u16) + 动作 + 状态（关键帧或增量，沿用二进制编解码器的状态布局）
+#   索引     关键帧数量(u32) + 每个关键帧的 (回合u16, 偏移u64)
+#   文件尾   索引偏移(u64) + INDEX_MAGIC
+# 写入中断的文件没有索引和文件尾，读取时顺序扫描记录重建
+MAGIC = b"IPRP"
+INDEX_MAGIC = b"IPRI"
+VERSION = 1
+FILE_HEADER = struct.Struct("!4sHI")
+RECORD_HEADER = struct.Struct("!IBH")
+INDEX_ENTRY = struct.Struct("!HQ")
+FOOTER = struct.Struct("!Q4s")
+U8 = struct.Struct("!B")
+U16 = struct.Struct("!H")
+U32 = struct.Struct("!I")
+RECORD_KEYFRAME = 1
+RECORD_DELTA = 2
+
+DEFAULT_KEYFRAME_INTERVAL = 50
+STAR_ID_RANGE = range(256)
+
+_codec = BinaryCodec()
+
+
+def normalize_actions(actions):
+    # 按规则模块的解析方式整理动作，重放时得到完全相同的结果
+    normalized = []
+    if not isinstance(actions, list):
+        return normalized
+    for action in actions:
+        if not isinstance(action, dict) or not isinstance(action.get('action'), str) \
+                or action.get('action') not in GameConfig.STAMINA_COST:
+            continue
+        # 规则按相等比较球员编号，3.0与3视为同一名球员
+        star_id = action.get('starId')
+        if not isinstance(star_id, (int, float)) or star_id not in STAR_ID_RANGE:
+            continue
+        try:
+            x, y = clamp_pos(action.get('x', -1), action.get('y', -1))
+        except (TypeError, ValueError, OverflowError):
+            continue
+        normalized.append({"starId": int(star_id), "action": action['action'], "x": x, "y": y})
+    return normalized
+
+
+class ReplayWriter:
+    # 回合线程只做状态快照并入队，编码和写文件都在后台线程完成
+    def __init__(self, path, metadata, keyframe_interval=DEFAULT_KEYFRAME_INTERVAL):
+        self.path = path
+        self.metadata = dict(metadata, keyframe_interval=keyframe_interval)
+        self.encoder = DeltaEncoder(keyframe_interval)
+        self.queue = queue.Queue()
+        self.index = []
+        self.file = open(path, 'xb')  # 不覆盖已有录像，文件已存在时抛出FileExistsError
+        header = json.dumps(self.metadata).encode()
+        self.file.write(FILE_HEADER.pack(MAGIC, VERSION, len(header)) + header)
+        self.thread = Thread(target=self.write_loop, daemon=True)
+        self.thread.start()
+
+    def record(self, round_no, actions_by_player, state):
+        # state为state_from_round_info生成的快照，写入线程只读不改
+        self.queue.put((round_no, actions_by_player, state))
+
+    def write_loop(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            round_no, actions_by_player, state = item
+            message = self.encoder.encode(state)
+            kind = RECORD_KEYFRAME if message["keyframe"] else RECORD_DELTA
+            message["round"] = round_no
+            parts = [U8.pack(len(actions_by_player))]
+            for player_id, actions in actions_by_player.items():
+                encoded = _codec.encode_response({"playerId": player_id, "round": round_no,
+                                                  "data": {"actions": normalize_actions(actions)}})
+                parts.append(U16.pack(len(encoded)) + encoded)
+            parts.append(_codec.encode_state_message(message))
+            body = b"".join(parts)
+            if kind == RECORD_KEYFRAME:
+                self.index.append((round_no, self.file.tell()))
+            self.file.write(RECORD_HEADER.pack(len(body), kind, round_no) + body)
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.queue.put(None)
+        self.thread.join()
+        index_offset = self.file.tell()
+        self.file.write(U32.pack(len(self.index)))
+        for round_no, offset in self.index:
+            self.file.write(INDEX_ENTRY.pack(round_no, offset))
+        self.file.write(FOOTER.pack(index_offset, INDEX_MAGIC))
+        self.file.close()
+
+
+class ReplayReader:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, header_size = FILE_HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Not a replay file: {path}")
+        start = FILE_HEADER.size
+        self.metadata = json.loads(self.data[start:start + header_size])
+        self.records_start = start + header_size
+        self.records_end, self.index = self.load_index()
+
+    def load_index(self):
+        size = len(self.data)
+        if size - self.records_start >= FOOTER.size + U32.size:
+            index_offset, magic = FOOTER.unpack_from(self.data, size - FOOTER.size)
+            if magic == INDEX_MAGIC:
+                (count,) = U32.unpack_from(self.data, index_offset)
+                index = [INDEX_ENTRY.unpack_from(self.data, index_offset + U32.size + i * INDEX_ENTRY.size)
+                         for i in range(count)]
+                return index_offset, index
+        # 没有文件尾：顺序扫描完整的记录，丢弃末尾写了一半的记录
+        index = []
+        offset = self.records_start
+        while offset + RECORD_HEADER.size <= size:
+            length, kind, round_no = RECORD_HEADER.unpack_from(self.data, offset)
+            end = offset + RECORD_HEADER.size + length
+            if end > size:
+                break
+            if kind == RECORD_KEYFRAME:
+                index.append((round_no, offset))
+            offset = end
+        return offset, index
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def last_round(self):
+        last = None
+        for round_no, _, _ in self.iter_records(self.index[-1][1] if self.index else self.records_start):
+            last = round_no
+        return last
+
+    def iter_records(self, offset):
+        # 逐条返回 (回合, 记录类型, 记录体)，只读取用到的记录
+        while offset + RECORD_HEADER.size <= self.records_end:
+            length, kind, round_no = RECORD_HEADER.unpack_from(self.data, offset)
+            body_start = offset + RECORD_HEADER.size
+            yield round_no, kind, self.data[body_start:body_start + length]
+            offset = body_start + length
+
+    def decode_record(self, body):
+        (count,) = U8.unpack_from(body, 0)
+        offset = U8.size
+        actions = {}
+        for _ in range(count):
+            (size,) = U16.unpack_from(body, offset)
+            offset += U16.size
+            response = _codec.decode_response(body[offset:offset + size], 0)
+            actions[response["playerId"]] = response["data"]["actions"]
+            offset += size
+        return actions, _codec.decode_state_message(body, offset)
+
+    def iter_rounds(self, start_round=0):
+        # 从不晚于start_round的最近关键帧开始解码，逐回合产出 (回合, 各队动作, 完整状态)
+        position = bisect.bisect_right([round_no for round_no, _ in self.index], start_round) - 1
+        offset = self.index[position][1] if position >= 0 else self.records_start
+        decoder = DeltaDecoder()
+        for round_no, kind, body in self.iter_records(offset):
+            actions, message = self.decode_record(body)
+            state = decoder.apply(message)
+            if state is None:
+                raise ValueError(f"Replay {self.path} is missing a keyframe before round {round_no}")
+            if round_no >= start_round:
+                yield round_no, actions, state
+
+    def state_at(self, round_no):
+        for found, _, state in self.iter_rounds(round_no):
+            return state if found == round_no else None
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Replay inspector')
+    parser.add_argument('path', help='Replay file')
+    parser.add_argument('-r', '--round', type=int, help='Print the state at this round')
+
+    args = parser.parse_args()
+
+    with ReplayReader(args.path) as reader:
+        print(json.dumps(reader.metadata))
+        print(f"Keyframes: {len(reader.index)}, last round: {reader.last_round}")
+        if args.round is not None:
+            print(json.dumps(reader.state_at(args.round)))
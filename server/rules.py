@@ -0,0 +1,335 @@
+import os
+import random
+import sys
+
+from game_state import *
+from pass_paths import flight_rounds, pass_shape
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from config.game_config import GameConfig
+from common.spatial import SpatialIndex
+
+FIELD_WIDTH = GameConfig.FIELD_WIDTH
+FIELD_HEIGHT = GameConfig.FIELD_HEIGHT
+MOVE_STEPS = {"run": 1, "rush": 2}
+TACKLES = ("steal", "slide")
+PASSES = ("shortPass", "longPass")
+
+GOAL_Y_MIN = FIELD_HEIGHT // 2 - GameConfig.GOAL_WIDTH // 2
+GOAL_Y_MAX = GOAL_Y_MIN + GameConfig.GOAL_WIDTH - 1
+
+# 偏移量(dx, dy)在预计算表中的下标：dx∈[-(W-1), W-1]，dy∈[-(H-1), H-1]
+OFFSET_STRIDE = 2 * FIELD_HEIGHT - 1
+
+
+def offset_index(dx, dy):
+    return (dx + FIELD_WIDTH - 1) * OFFSET_STRIDE + dy + FIELD_HEIGHT - 1
+
+
+def _build_offset_tables():
+    # 整个91x61场地上所有可能偏移的距离，以及每种动作在该偏移下是否合法，启动时算一次
+    distance_table = bytearray((2 * FIELD_WIDTH - 1) * OFFSET_STRIDE)
+    valid_tables = {action: bytearray(len(distance_table)) for action in GameConfig.ACTION_RANGE}
+    for dx in range(-(FIELD_WIDTH - 1), FIELD_WIDTH):
+        for dy in range(-(FIELD_HEIGHT - 1), FIELD_HEIGHT):
+            index = offset_index(dx, dy)
+            dist = max(abs(dx), abs(dy))
+            distance_table[index] = dist
+            for action, (low, high) in GameConfig.ACTION_RANGE.items():
+                valid_tables[action][index] = low <= dist <= high
+    return distance_table, valid_tables
+
+
+DISTANCE_TABLE, ACTION_VALID = _build_offset_tables()
+
+
+def clamp_pos(x, y):
+    x = min(max(int(x), 0), FIELD_WIDTH - 1)
+    y = min(max(int(y), 0), FIELD_HEIGHT - 1)
+    return x, y
+
+
+def distance(x1, y1, x2, y2):
+    # 棋盘距离：斜向移动一格也算一步
+    return DISTANCE_TABLE[offset_index(x2 - x1, y2 - y1)]
+
+
+def in_range(action_type, x1, y1, x2, y2):
+    return ACTION_VALID[action_type][offset_index(x2 - x1, y2 - y1)]
+
+
+def goal_side(x, y):
+    # 返回该格所在球门的防守方，不在球门内返回None
+    if GOAL_Y_MIN <= y <= GOAL_Y_MAX:
+        if x == 0:
+            return 'left'
+        if x == FIELD_WIDTH - 1:
+            return 'right'
+    return None
+
+
+def shape_of(pass_info):
+    start = pass_info.start_pos
+    target = pass_info.target_pos
+    return pass_shape(target.x - start.x, target.y - start.y, pass_info.round_end - pass_info.round_begin + 1)
+
+
+def spatial_index(game_state):
+    # 首次使用时按当前站位建立索引和球员归属表，之后随球员移动增量更新
+    if game_state.spatial_index is None:
+        index = SpatialIndex()
+        owners = {}
+        for player in game_state.round_info.player_info:
+            for star in player.stars:
+                owners[star.star_id] = (player, star)
+                if star.pos is not None:
+                    index.update(star.star_id, star.pos.x, star.pos.y, player.player_id)
+        game_state.spatial_index = index
+        game_state.star_owners = owners
+    return game_state.spatial_index
+
+
+def move_star(index, star, x, y):
+    star.move_to(x, y)
+    index.update(star.star_id, x, y)
+
+
+def kickoff(game_state, reset_stamina=True):
+    # 双方按阵型站位，球放在中圈；进球后重新开球时保留体力
+    for player in game_state.round_info.player_info:
+        for star, (x, y) in zip(player.stars, GameConfig.KICKOFF_FORMATION):
+            if player.side == 'right':
+                x = FIELD_WIDTH - 1 - x
+            star.move_to(x, y)
+            if reset_stamina:
+                star.stamina = GameConfig.MAX_STAMINA
+            star.star_state.reset()
+    game_state.spatial_index = None
+    spatial_index(game_state)
+    game_state.round_info.ball_info.place(Pos(FIELD_WIDTH // 2, FIELD_HEIGHT // 2))
+
+
+def parse_actions(stars, actions):
+    # 把客户端动作列表整理成 star_id -> (动作, 目标x, 目标y)，非法动作视为nope
+    own_ids = {star.star_id for star in stars}
+    parsed = {}
+    if not isinstance(actions, list):
+        return parsed
+    for action in actions:
+        if not isinstance(action, dict):
+            continue
+        star_id = action.get('starId')
+        action_type = action.get('action')
+        # 先检查类型，列表等不可哈希的值不能用in查表
+        if not isinstance(star_id, (int, float)) or not isinstance(action_type, str) \
+                or star_id not in own_ids or action_type not in GameConfig.STAMINA_COST:
+            continue
+        try:
+            x, y = clamp_pos(action.get('x', -1), action.get('y', -1))
+        except (TypeError, ValueError, OverflowError):
+            continue
+        parsed[star_id] = (action_type, x, y)
+    return parsed
+
+
+def spend_stamina(star, action_type):
+    # 体力不足时动作降级为原地不动
+    cost = GameConfig.STAMINA_COST[action_type]
+    if cost > star.stamina:
+        action_type = "nope"
+        cost = GameConfig.STAMINA_COST[action_type]
+    star.stamina = min(star.stamina - cost, GameConfig.MAX_STAMINA)
+    return action_type
+
+
+def collect_actions(round_info, actions_by_player):
+    # 按队伍、球员顺序把本回合动作分成移动（含原地恢复）、抢断铲球和传球三类，僵直的球员不参与
+    moves = []
+    tackles = []
+    passes = []
+    for player in round_info.player_info:
+        parsed = parse_actions(player.stars, actions_by_player.get(player.player_id))
+        for star in player.stars:
+            if star.star_state.state == "stun":
+                continue
+            action_type, x, y = parsed.get(star.star_id, ("nope", star.pos.x, star.pos.y))
+            if action_type in TACKLES:
+                tackles.append((player, star, action_type))
+            elif action_type in PASSES:
+                passes.append((player, star, action_type, x, y))
+            else:
+                moves.append((star, action_type, x, y))
+    return moves, tackles, passes
+
+
+def resolve_round(game_state, actions_by_player, round_no, rng=random):
+    round_info = game_state.round_info
+    index = spatial_index(game_state)
+    moves, tackles, passes = collect_actions(round_info, actions_by_player)
+
+    # 1. 僵直倒计时，其余球员先完成移动和原地恢复
+    for player in round_info.player_info:
+        for star in player.stars:
+            if star.star_state.state == "stun":
+                star.star_state.tick()
+    for star, action_type, x, y in moves:
+        action_type = spend_stamina(star, action_type)
+        steps = MOVE_STEPS.get(action_type, 0)
+        if steps:
+            new_x = star.pos.x
+            new_y = star.pos.y
+            for _ in range(steps):
+                new_x += (x > new_x) - (x < new_x)
+                new_y += (y > new_y) - (y < new_y)
+            if new_x != star.pos.x or new_y != star.pos.y:
+                move_star(index, star, new_x, new_y)
+    return settle_round(game_state, tackles, passes, round_no, rng)
+
+
+def settle_round(game_state, tackles, passes, round_no, rng=random):
+    # 移动之后的阶段：球的位置、抢断铲球、传球、拾球和进球。数组后端完成移动后也从这里接着结算
+    round_info = game_state.round_info
+    ball = round_info.ball_info
+    index = spatial_index(game_state)
+    owners = game_state.star_owners
+
+    # 2. 球跟随持球者，或沿传球路径飞行
+    if ball.status == "hold":
+        ball.pos = owners[ball.star_id][1].pos
+    elif ball.status == "pass":
+        advance_pass(game_state, round_no)
+
+    # 3. 抢断和铲球，同一回合多人争抢时随机决定先后
+    rng.shuffle(tackles)
+    for player, star, action_type in tackles:
+        holder = None
+        if ball.status == "hold" and ball.player_id != player.player_id:
+            # 在索引里查动作距离内的对方球员，持球者在其中才能出脚
+            low, high = GameConfig.ACTION_RANGE[action_type]
+            reachable = index.within(star.pos.x, star.pos.y, high, low, team=ball.player_id)
+            if any(star_id == ball.star_id for star_id, _ in reachable):
+                holder = owners[ball.star_id][1]
+        if holder is None:
+            spend_stamina(star, "nope")
+            continue
+        if spend_stamina(star, action_type) == "nope":
+            continue
+        if action_type == "steal":
+            if rng.random() < GameConfig.STEAL_SUCCESS_RATE:
+                take_ball(ball, player, star)
+        elif rng.random() < GameConfig.SLIDE_SUCCESS_RATE:
+            take_ball(ball, player, star)
+            stun(holder)
+        else:
+            stun(star)
+
+    # 4. 仍持球的球员发起传球
+    for player, star, action_type, x, y in passes:
+        if ball.status != "hold" or ball.star_id != star.star_id \
+                or not in_range(action_type, star.pos.x, star.pos.y, x, y):
+            spend_stamina(star, "nope")
+            continue
+        if spend_stamina(star, action_type) == "nope":
+            continue
+        launch_pass(ball, player, star, action_type, x, y, round_no)
+
+    # 5. 散落的球由站在球上的球员拾取
+    if ball.status == "stand":
+        candidates = []
+        for star_id in sorted(index.at(ball.pos.x, ball.pos.y)):
+            if owners[star_id][1].star_state.state != "stun":
+                candidates.append(owners[star_id])
+        if candidates:
+            take_ball(ball, *rng.choice(candidates))
+
+    check_goal(game_state)
+    return round_info
+
+
+def stun(star):
+    star.star_state.stun(GameConfig.MAX_STUN_ROUNDS)
+
+
+def take_ball(ball, player, star):
+    ball.hold(player.player_id, star.star_id, star.pos)
+
+
+def launch_pass(ball, player, star, action_type, x, y, round_no):
+    # 出球当回合球停在传球者脚下，从下一回合开始飞行；路径形状取自缓存
+    dx = x - star.pos.x
+    dy = y - star.pos.y
+    rounds = flight_rounds(dx, dy, GameConfig.PASS_SPEED[action_type])
+    path = pass_shape(dx, dy, rounds).path_from(star.pos.x, star.pos.y)
+    ball.start_pass(player.player_id, BallPassInfo(star.pos, Pos(x, y), round_no + 1, round_no + rounds, path))
+
+
+def advance_pass(game_state, round_no):
+    ball = game_state.round_info.ball_info
+    pass_info = ball.pass_info
+    shape = shape_of(pass_info)
+    elapsed = round_no - pass_info.round_begin
+    start, end = shape.segments[elapsed]
+    sx = pass_info.start_pos.x
+    sy = pass_info.start_pos.y
+
+    # 路径上的任何球员（包括对手）都会截下球：先用空间索引取出本回合路段外接方框内的球员，
+    # 再查“格子 -> 飞行回合”表确认确实在本段上；经过的球员里离出球点最近的截球
+    first = pass_info.path[start]
+    last = pass_info.path[end - 1]
+    radius = max(-(-abs(last.x - first.x) // 2), -(-abs(last.y - first.y) // 2))
+    owners = game_state.star_owners
+    candidates = []
+    for star_id, _ in spatial_index(game_state).within((first.x + last.x) // 2, (first.y + last.y) // 2, radius):
+        star = owners[star_id][1]
+        if star.star_state.state == "stun" or shape.flight_round(sx, sy, star.pos.x, star.pos.y) != elapsed:
+            continue
+        candidates.append((shape.index_of[(star.pos.x - sx, star.pos.y - sy)], star_id))
+    stop = end
+    receiver = None
+    if candidates:
+        # 同一格上有多名球员时按队伍、球员顺序取第一个
+        order = list(owners)
+        stop, star_id = min(candidates, key=lambda candidate: (candidate[0], order.index(candidate[1])))
+        receiver = owners[star_id]
+
+    # 只有贴着底线的传球才可能中途经过球门
+    if sx in (0, FIELD_WIDTH - 1) or pass_info.target_pos.x in (0, FIELD_WIDTH - 1):
+        for index in range(start, stop):
+            cell = pass_info.path[index]
+            if goal_side(cell.x, cell.y):
+                ball.pos = cell
+                return
+
+    if receiver is not None:
+        ball.pos = pass_info.path[stop]
+        take_ball(ball, *receiver)
+        return
+    ball.pos = pass_info.path[end - 1]
+    if end >= len(pass_info.path):
+        ball.place(ball.pos)
+
+
+def check_goal(game_state):
+    # 球进入球门且不在防守方脚下即算进球，进球后重新开球
+    round_info = game_state.round_info
+    ball = round_info.ball_info
+    side = goal_side(ball.pos.x, ball.pos.y)
+    if side is None:
+        return None
+    defender = attacker = None
+    for player in round_info.player_info:
+        if player.side == side:
+            defender = player
+        else:
+            attacker = player
+    if defender is None or attacker is None:
+        return None
+    if ball.status == "hold" and ball.player_id == defender.player_id:
+        return None
+    round_info.score[attacker.player_id] = round_info.score.get(attacker.player_id, 0) + 1
+    kickoff(game_state, reset_stamina=False)
+    return attacker.player_id
+
+
+def max_score_reached(round_info):
+    return any(score >= GameConfig.MAX_SCORE for score in round_info.score.values())
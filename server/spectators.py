@@ -0,0 +1,60 @@
+from collections import deque
+
+# 每个观战连接最多积压的消息数，超过即视为落后
+DEFAULT_SPECTATOR_QUEUE = 8
+
+
+class Spectator:
+    # 观战连接的发送队列。所有写出都是非阻塞的，写不完的留到连接可写时再发；
+    # 队列满时丢弃积压的增量，下一条改发当前回合的关键帧，慢的观众只会跳帧，不会拖慢回合
+    __slots__ = ('sock', 'codec', 'name', 'max_queue', 'queue', 'buffer', 'synced', 'dropped')
+
+    def __init__(self, sock, codec, name=None, max_queue=DEFAULT_SPECTATOR_QUEUE):
+        self.sock = sock
+        self.codec = codec
+        self.name = name
+        self.max_queue = max_queue
+        self.queue = deque()
+        self.buffer = b''  # 已出队但还没写完的一帧，必须写完才能保持分帧完整
+        self.synced = False  # 已排入关键帧，后续增量可以接上
+        self.dropped = 0
+
+    @property
+    def pending(self):
+        return bool(self.buffer or self.queue)
+
+    def offer(self, frame, keyframe, keyframe_frame):
+        # keyframe_frame()按需返回本回合关键帧的编码，只有需要重新同步时才调用
+        if len(self.queue) >= self.max_queue:
+            self.dropped += len(self.queue)
+            self.queue.clear()
+            self.synced = False
+        if not self.synced and not keyframe:
+            frame = keyframe_frame()
+        self.synced = True
+        self.queue.append(frame)
+
+    def offer_message(self, frame):
+        # 不属于状态流的消息（如比赛结束），队列满时同样丢弃积压
+        if len(self.queue) >= self.max_queue:
+            self.dropped += len(self.queue)
+            self.queue.clear()
+            self.synced = False
+        self.queue.append(frame)
+
+    def flush(self):
+        # 尽量写出，返回False表示连接已失效
+        while True:
+            if not self.buffer:
+                if not self.queue:
+                    return True
+                self.buffer = self.queue.popleft()
+            try:
+                sent = self.sock.send(self.buffer)
+            except BlockingIOError:
+                return True
+            except OSError:
+                return False
+            self.buffer = self.buffer[sent:]
+            if self.buffer:
+                return True
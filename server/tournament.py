@@ -0,0 +1,377 @@
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+import zlib
+
+from engine import load_bot, play_match
+from metrics import write_snapshot
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+# 类形式的机器人（如bots:GreedyBot）在client目录；追加在最后，同名模块（main等）仍优先用server目录的
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'client'))
+from common.delta import state_from_round_info
+from common.log import add_log_arguments, get_logger, setup_logging_from_args
+from config.game_config import GameConfig
+
+FORMATS = ("round-robin", "swiss", "knockout")
+RESULTS_FILE = "results.jsonl"
+STANDINGS_FILE = "standings.json"
+WIN_POINTS = 3
+DRAW_POINTS = 1
+
+# 工作进程内已导入的机器人函数或类，整个锦标赛期间复用，不必每场重新导入
+_bots = {}
+
+
+class ClientBot:
+    # 把客户端的Bot类（setup/observe/think）包装成play_match调用的 bot(round_info, player_id)：
+    # 第一次调用时按本队阵容setup，每回合把完整状态作为关键帧交给observe。
+    # 锦标赛要求结果可复现，只取think()的第一个答案，不按时间继续搜索
+    def __init__(self, bot_class):
+        self.bot = bot_class()
+        self.seq = 0
+
+    def __call__(self, round_info, player_id):
+        if self.seq == 0:
+            for player in round_info.player_info:
+                if player.player_id == player_id:
+                    self.bot.setup(player_id, player.side, [star.star_id for star in player.stars])
+        self.seq += 1
+        state = self.bot.observe({"seq": self.seq, "keyframe": True,
+                                  "state": state_from_round_info(round_info, self.seq - 1)})
+        return next(iter(self.bot.think(state, time.monotonic())), None) or self.bot.fallback(state)
+
+
+def warm_bot(spec):
+    bot = _bots.get(spec)
+    if bot is None:
+        bot = load_bot(spec)
+        if isinstance(bot, type) and not all(hasattr(bot, name) for name in ("setup", "observe", "think")):
+            raise TypeError(f"Bot class {spec} does not implement the client Bot interface (setup/observe/think)")
+        if not callable(bot):
+            raise TypeError(f"Bot {spec} is neither a function nor a Bot class")
+        bot = _bots[spec] = bot
+    if isinstance(bot, type):
+        # 类形式的机器人每场比赛、每一方都新建实例，状态不会在比赛之间或同名参赛者之间共享
+        bot = ClientBot(bot)
+    return bot
+
+
+def play_job(job):
+    # 比赛种子同时用于规则结算和全局random，机器人只要不依赖外部状态，结果就可以复现
+    random.seed(job["seed"])
+    started = time.perf_counter()
+    match = play_match(warm_bot(job["left_spec"]), warm_bot(job["right_spec"]), job["max_rounds"], job["seed"])
+    score = match.game_state.round_info.score
+    return {"id": job["id"], "stage": job["stage"], "left": job["left"], "right": job["right"],
+            "score": [score[match.left_id], score[match.right_id]], "rounds": match.round_count,
+            "seed": job["seed"], "elapsed": round(time.perf_counter() - started, 3)}
+
+
+def parse_bots(entries):
+    # "名字=module:function"或"module:function"，同一个机器人出现多次时自动加后缀区分
+    bots = []
+    names = set()
+    for entry in entries:
+        name, _, spec = entry.rpartition('=')
+        name = name or spec
+        unique = name
+        n = 2
+        while unique in names:
+            unique = f"{name}#{n}"
+            n += 1
+        names.add(unique)
+        bots.append((unique, spec))
+    return bots
+
+
+class Table:
+    # 积分表：胜3分、平1分、负0分，依次按积分、净胜球、进球数排名，再按参赛顺序
+    def __init__(self, names):
+        self.order = {name: i for i, name in enumerate(names)}
+        self.rows = {name: {"name": name, "played": 0, "wins": 0, "draws": 0, "losses": 0, "byes": 0,
+                            "goals_for": 0, "goals_against": 0, "points": 0} for name in names}
+        self.opponents = {name: set() for name in names}
+
+    def add(self, result):
+        if result.get("bye"):
+            row = self.rows[result["left"]]
+            row["byes"] += 1
+            row["points"] += WIN_POINTS
+            return
+        left, right = result["left"], result["right"]
+        left_goals, right_goals = result["score"]
+        self.opponents[left].add(right)
+        self.opponents[right].add(left)
+        for name, goals_for, goals_against in ((left, left_goals, right_goals), (right, right_goals, left_goals)):
+            row = self.rows[name]
+            row["played"] += 1
+            row["goals_for"] += goals_for
+            row["goals_against"] += goals_against
+            if goals_for > goals_against:
+                row["wins"] += 1
+                row["points"] += WIN_POINTS
+            elif goals_for == goals_against:
+                row["draws"] += 1
+                row["points"] += DRAW_POINTS
+            else:
+                row["losses"] += 1
+
+    def ranked(self):
+        return sorted(self.rows.values(), key=lambda row: (
+            -row["points"], -(row["goals_for"] - row["goals_against"]), -row["goals_for"], self.order[row["name"]]))
+
+
+class Tournament:
+    def __init__(self, bots, fmt="round-robin", directory="tournament", games=2, max_rounds=GameConfig.MAX_TURNS,
+                 swiss_rounds=None, workers=None, seed=0):
+        self.bots = bots  # [(名字, spec)]
+        self.specs = dict(bots)
+        self.names = [name for name, _ in bots]
+        self.format = fmt
+        self.directory = directory
+        self.games = games
+        self.max_rounds = max_rounds
+        self.swiss_rounds = swiss_rounds or max(1, (len(bots) - 1).bit_length())
+        self.workers = workers or os.cpu_count()
+        self.seed = seed
+        self.log = get_logger("tournament")
+        self.table = Table(self.names)
+        self.done = {}  # 比赛编号 -> 结果，包括续跑时从文件读回的
+        self.champion = None
+        self.bracket = []
+        self.pool = None
+        self.results_file = None
+
+    def config(self):
+        return {"format": self.format, "bots": [list(bot) for bot in self.bots], "games": self.games,
+                "max_rounds": self.max_rounds, "swiss_rounds": self.swiss_rounds, "seed": self.seed}
+
+    # ---- 结果文件：首行是配置，之后每完成一场追加一行；重新运行同一目录即从中断处继续 ----
+
+    def load_results(self):
+        path = os.path.join(self.directory, RESULTS_FILE)
+        if not os.path.exists(path):
+            return
+        with open(path) as f:
+            lines = f.readlines()
+        if lines and json.loads(lines[0]).get("tournament") != self.config():
+            raise ValueError(f"{path} belongs to a tournament with different settings")
+        for line in lines[1:]:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                # 中断时写了一半的最后一行，这场比赛重新打
+                break
+            self.done[result["id"]] = result
+        self.log.info("Resuming tournament", completed=len(self.done))
+
+    def open_results(self):
+        # 续跑时重写已读回的结果，顺带去掉中断时写坏的末行
+        os.makedirs(self.directory, exist_ok=True)
+        self.results_file = open(os.path.join(self.directory, RESULTS_FILE), 'w')
+        self.results_file.write(json.dumps({"tournament": self.config()}) + "\n")
+        for result in self.done.values():
+            self.results_file.write(json.dumps(result) + "\n")
+        self.results_file.flush()
+
+    def record(self, result):
+        self.results_file.write(json.dumps(result) + "\n")
+        self.results_file.flush()
+        self.done[result["id"]] = result
+
+    def write_standings(self):
+        write_snapshot(os.path.join(self.directory, STANDINGS_FILE), {
+            "format": self.format,
+            "completed": len(self.done),
+            "standings": self.table.ranked(),
+            "bracket": self.bracket if self.format == "knockout" else None,
+            "champion": self.champion})
+
+    # ---- 调度 ----
+
+    def match_seed(self, match_id):
+        return zlib.crc32(f"{self.seed}:{match_id}".encode())
+
+    def job(self, match_id, stage, left, right):
+        return {"id": match_id, "stage": stage, "left": left, "right": right, "left_spec": self.specs[left],
+                "right_spec": self.specs[right], "max_rounds": self.max_rounds, "seed": self.match_seed(match_id)}
+
+    def pairing_jobs(self, stage, pairs):
+        # 每组对阵打games场，交替左右场地
+        jobs = []
+        for board, (a, b) in enumerate(pairs):
+            for game in range(self.games):
+                left, right = (a, b) if game % 2 == 0 else (b, a)
+                jobs.append(self.job(f"{stage}-{board}-{game}", stage, left, right))
+        return jobs
+
+    def play(self, jobs):
+        # 已完成的直接取回；其余分给工作进程，结果按完成顺序写入文件和积分表
+        results = {job["id"]: self.done[job["id"]] for job in jobs if job["id"] in self.done}
+        for result in results.values():
+            self.table.add(result)
+        pending = [job for job in jobs if job["id"] not in self.done]
+        if pending:
+            started = time.perf_counter()
+            outcomes = self.pool.imap_unordered(play_job, pending) if self.pool else map(play_job, pending)
+            for result in outcomes:
+                self.record(result)
+                self.table.add(result)
+                results[result["id"]] = result
+                self.write_standings()
+                self.log.debug("Match finished", match=result["id"], left=result["left"], right=result["right"],
+                               score=result["score"])
+            self.log.info("Stage finished", stage=jobs[0]["stage"], matches=len(pending),
+                          elapsed_s=round(time.perf_counter() - started, 2))
+        return [results[job["id"]] for job in jobs]
+
+    def bye(self, stage, name):
+        match_id = f"{stage}-bye"
+        result = self.done.get(match_id)
+        if result is None:
+            result = {"id": match_id, "stage": stage, "left": name, "right": None, "bye": True}
+            self.record(result)
+        self.table.add(result)
+
+    def run(self):
+        self.load_results()
+        self.open_results()
+        if self.workers > 1:
+            # 进程池在整个锦标赛中保持不变，工作进程里加载好的机器人跨场次复用
+            self.pool = multiprocessing.Pool(self.workers)
+        try:
+            getattr(self, "run_" + self.format.replace("-", "_"))()
+            self.write_standings()
+        finally:
+            if self.pool:
+                self.pool.terminate()
+            self.results_file.close()
+        return self.table.ranked()
+
+    def run_round_robin(self):
+        pairs = [(a, b) for i, a in enumerate(self.names) for b in self.names[i + 1:]]
+        self.play(self.pairing_jobs("rr", pairs))
+
+    def run_swiss(self):
+        for round_no in range(1, self.swiss_rounds + 1):
+            stage = f"swiss{round_no}"
+            ranked = [row["name"] for row in self.table.ranked()]
+            if len(ranked) % 2:
+                # 排名最低且没轮空过的轮空，记一场胜
+                name = next((name for name in reversed(ranked) if not self.table.rows[name]["byes"]), ranked[-1])
+                ranked.remove(name)
+                self.bye(stage, name)
+            self.play(self.pairing_jobs(stage, self.swiss_pairs(ranked)))
+
+    def swiss_pairs(self, ranked):
+        # 按当前排名从高到低，和排名最近、尚未交手的对手配对；找不到时允许重赛
+        pairs = []
+        unpaired = list(ranked)
+        while unpaired:
+            a = unpaired.pop(0)
+            b = next((name for name in unpaired if name not in self.table.opponents[a]), unpaired[0])
+            unpaired.remove(b)
+            pairs.append((a, b))
+        return pairs
+
+    def run_knockout(self):
+        # 按参赛顺序定种子，人数补齐到2的幂，1号对末位、2号对倒数第二……，空位即轮空
+        size = 1 << (len(self.names) - 1).bit_length()
+        alive = self.names + [None] * (size - len(self.names))
+        alive = [alive[i] for i in bracket_order(size)]
+        stage_no = 1
+        while len(alive) > 1:
+            stage = f"ko{stage_no}"
+            pairs = [(alive[i], alive[i + 1]) for i in range(0, len(alive), 2)]
+            played = [pair for pair in pairs if None not in pair]
+            results = self.play(self.pairing_jobs(stage, played))
+            winners = {}
+            for board, (a, b) in enumerate(played):
+                winners[(a, b)] = self.tie_winner(a, b, results[board * self.games:(board + 1) * self.games])
+            alive = [winners[pair] if None not in pair else pair[0] or pair[1] for pair in pairs]
+            self.bracket.append({"stage": stage, "pairs": [list(pair) for pair in pairs], "winners": list(alive)})
+            stage_no += 1
+        self.champion = alive[0]
+        self.log.info("Champion", bot=self.champion)
+
+    def tie_winner(self, a, b, results):
+        # 先比胜场，再比总进球，仍相同时种子靠前的晋级
+        wins = {a: 0, b: 0}
+        goals = {a: 0, b: 0}
+        for result in results:
+            left_goals, right_goals = result["score"]
+            goals[result["left"]] += left_goals
+            goals[result["right"]] += right_goals
+            if left_goals != right_goals:
+                wins[result["left"] if left_goals > right_goals else result["right"]] += 1
+        key = lambda name: (wins[name], goals[name], -self.table.order[name])
+        return max((a, b), key=key)
+
+
+def bracket_order(size):
+    # 标准种子排列：相邻两个位置为一组对阵，强种子在决赛前不会相遇
+    order = [0]
+    while len(order) < size:
+        n = len(order) * 2
+        order = [seed for i in order for seed in (i, n - 1 - i)]
+    return order
+
+
+def print_standings(ranked, champion=None):
+    print(f"{'#':>3} {'bot':<24} {'P':>3} {'W':>3} {'D':>3} {'L':>3} {'GF':>4} {'GA':>4} {'Pts':>4}")
+    for i, row in enumerate(ranked, 1):
+        print(f"{i:>3} {row['name']:<24} {row['played']:>3} {row['wins']:>3} {row['draws']:>3} {row['losses']:>3} "
+              f"{row['goals_for']:>4} {row['goals_against']:>4} {row['points']:>4}")
+    if champion:
+        print(f"Champion: {champion}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run a headless tournament between bots')
+    parser.add_argument('bots', nargs='+', help='Bots as module:function or name=module:function')
+    parser.add_argument('-f', '--format', choices=FORMATS, default='round-robin',
+                        help='Tournament format (default: round-robin)')
+    parser.add_argument('-d', '--dir', default='tournament',
+                        help='Directory for the results log and standings file; rerun to resume (default: tournament)')
+    parser.add_argument('-g', '--games', type=int, default=2,
+                        help='Games per pairing, alternating sides (default: 2)')
+    parser.add_argument('-r', '--rounds', type=int, default=GameConfig.MAX_TURNS,
+                        help=f'Rounds per match (default: {GameConfig.MAX_TURNS})')
+    parser.add_argument('--swiss-rounds', type=int, help='Swiss rounds (default: ceil(log2(bots)))')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='Worker processes (default: CPU count)')
+    parser.add_argument('-s', '--seed', type=int, default=0, help='Tournament seed for per-match seeds (default: 0)')
+    add_log_arguments(parser)
+
+    args = parser.parse_args()
+
+    if len(args.bots) < 2:
+        print("Error: At least two bots required")
+        sys.exit(1)
+
+    setup_logging_from_args(args)
+
+    bots = parse_bots(args.bots)
+    for _, spec in bots:
+        # 在主进程里先加载一遍，机器人写错时立即报错，而不是在工作进程里逐场失败
+        try:
+            warm_bot(spec)
+        except (ImportError, AttributeError, TypeError, ValueError) as e:
+            print(f"Error: cannot load bot {spec}: {e}")
+            sys.exit(1)
+
+    tournament = Tournament(bots, args.format, args.dir, args.games, args.rounds,
+                            args.swiss_rounds, args.workers, args.seed)
+    try:
+        ranked = tournament.run()
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    except KeyboardInterrupt:
+        print(f"Interrupted; rerun with -d {args.dir} to resume")
+        sys.exit(1)
+    print_standings(ranked, tournament.champion)
@@ -0,0 +1,103 @@
+import os
+import sys
+
+import numpy as np
+
+from game_state import *
+from rules import MOVE_STEPS, collect_actions, move_star, settle_round, spatial_index
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from config.game_config import GameConfig
+
+# 数组第二维按球员编号索引，0号位空置，1..MAX_STAR_ID为双方球员
+STAR_SLOTS = GameConfig.MAX_STAR_ID + 1
+
+STATE_CODES = {"normal": 0, "stun": 1}
+STATE_NAMES = {code: name for name, code in STATE_CODES.items()}
+STUN = STATE_CODES["stun"]
+
+ACTION_CODES = {name: code for code, name in enumerate(GameConfig.ACTION_TYPES)}
+NOPE = ACTION_CODES["nope"]
+STAMINA_COST_TABLE = np.array([GameConfig.STAMINA_COST[name] for name in GameConfig.ACTION_TYPES], dtype=np.int32)
+MOVE_STEP_TABLE = np.array([MOVE_STEPS.get(name, 0) for name in GameConfig.ACTION_TYPES], dtype=np.int16)
+
+
+class VectorState:
+    # 结构数组形式的球员状态，第一维是比赛编号，多场比赛的移动阶段一次数组运算完成。
+    # 抢断、传球和进球仍由rules在对象上逐场结算，所以每回合先从对象载入、移动后再写回
+    def __init__(self, n_matches=1):
+        self.n_matches = n_matches
+        self.pos = np.zeros((n_matches, STAR_SLOTS, 2), dtype=np.int16)
+        self.stamina = np.zeros((n_matches, STAR_SLOTS), dtype=np.int32)
+        self.state = np.zeros((n_matches, STAR_SLOTS), dtype=np.int8)
+        self.cd_remain = np.zeros((n_matches, STAR_SLOTS), dtype=np.int8)
+        self.valid = np.zeros((n_matches, STAR_SLOTS), dtype=bool)
+        # 本回合的移动类动作（含nope）和目标，不移动的位置moving为False
+        self.actions = np.full((n_matches, STAR_SLOTS), NOPE, dtype=np.int8)
+        self.targets = np.zeros((n_matches, STAR_SLOTS, 2), dtype=np.int16)
+        self.moving = np.zeros((n_matches, STAR_SLOTS), dtype=bool)
+
+    def load(self, index, game_state):
+        # 逐行整体赋值，避免逐个元素写numpy数组
+        stars = [star for player in game_state.round_info.player_info for star in player.stars]
+        slots = [star.star_id for star in stars]
+        self.valid[index] = False
+        self.valid[index, slots] = True
+        self.moving[index] = False
+        self.pos[index, slots] = [(star.pos.x, star.pos.y) for star in stars]
+        self.stamina[index, slots] = [star.stamina for star in stars]
+        self.state[index, slots] = [STATE_CODES[star.star_state.state] for star in stars]
+        self.cd_remain[index, slots] = [star.star_state.cd_remain for star in stars]
+
+    def load_moves(self, index, moves):
+        for star, action_type, x, y in moves:
+            slot = star.star_id
+            self.moving[index, slot] = True
+            self.actions[index, slot] = ACTION_CODES[action_type]
+            self.targets[index, slot] = (x, y)
+
+    def step(self):
+        # 与rules.resolve_round第1阶段相同：僵直倒计时；其余球员扣体力（不足则降级为nope），再向目标走1或2格
+        stunned = self.valid & (self.state == STUN)
+        self.cd_remain[stunned] -= 1
+        recovered = stunned & (self.cd_remain <= 0)
+        self.state[recovered] = STATE_CODES["normal"]
+        self.cd_remain[recovered] = 0
+
+        actions = np.where(self.moving & (STAMINA_COST_TABLE[self.actions] <= self.stamina), self.actions, NOPE)
+        cost = STAMINA_COST_TABLE[actions]
+        self.stamina = np.where(self.moving, np.minimum(self.stamina - cost, GameConfig.MAX_STAMINA), self.stamina)
+        steps = np.where(self.moving, MOVE_STEP_TABLE[actions], 0)[:, :, None]
+        self.pos += np.clip(self.targets - self.pos, -steps, steps).astype(np.int16)
+
+    def store(self, index, game_state):
+        # 把移动阶段的结果写回对象，位置变化的球员同步更新空间索引；整行先转成列表再逐个读取
+        spatial = spatial_index(game_state)
+        pos = self.pos[index].tolist()
+        stamina = self.stamina[index].tolist()
+        state = self.state[index].tolist()
+        cd_remain = self.cd_remain[index].tolist()
+        for player in game_state.round_info.player_info:
+            for star in player.stars:
+                slot = star.star_id
+                x, y = pos[slot]
+                if x != star.pos.x or y != star.pos.y:
+                    move_star(spatial, star, x, y)
+                star.stamina = stamina[slot]
+                star.star_state.state = STATE_NAMES[state[slot]]
+                star.star_state.cd_remain = cd_remain[slot]
+
+
+def resolve_rounds(vector, game_states, actions, round_nos, rngs):
+    # 多场比赛各结算一回合，结果与对每场调用rules.resolve_round相同；
+    # game_states最多vector.n_matches场，actions[i]是第i场的 {队伍编号: 动作列表}
+    pending = []
+    for index, (game_state, actions_by_player) in enumerate(zip(game_states, actions)):
+        moves, tackles, passes = collect_actions(game_state.round_info, actions_by_player)
+        vector.load(index, game_state)
+        vector.load_moves(index, moves)
+        pending.append((tackles, passes))
+    vector.step()
+    for index, (game_state, (tackles, passes), round_no, rng) in enumerate(zip(game_states, pending, round_nos, rngs)):
+        vector.store(index, game_state)
+        settle_round(game_state, tackles, passes, round_no, rng)
@@ -0,0 +1,103 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+from engine import Match
+from game_state import use_roster
+from replay import ReplayReader, normalize_actions
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.delta import diff_state, state_from_round_info
+
+
+def iter_replay_paths(paths):
+    # 逐个产出回放文件，目录按文件名顺序展开，不预先收集整个列表
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith('.rpl'):
+                    yield os.path.join(path, name)
+        else:
+            yield path
+
+
+def match_from_metadata(metadata):
+    left, right = metadata["players"]
+    return Match(left["playerId"], right["playerId"], left["team"], right["team"],
+                 metadata.get("max_rounds", 0), metadata["seed"])
+
+
+def verify_replay(path):
+    # 用记录的种子和动作重新结算，逐回合与记录的状态比较。
+    # 返回 (路径, 状态, 回合数, 首个不一致的回合, 不一致的字段)
+    try:
+        with ReplayReader(path) as reader:
+            if reader.metadata.get("seed") is None:
+                return path, "unseeded", 0, None, None
+            match = match_from_metadata(reader.metadata)
+            rounds = 0
+            for round_no, actions, recorded in reader.iter_rounds():
+                if round_no > 0:
+                    if round_no != match.round_count + 1:
+                        return path, "gap", rounds, round_no, f"expected round {match.round_count + 1}"
+                    # 服务器原样记录规范化后的动作，这里再规范化一次，兼容手工生成的回放
+                    match.apply({player_id: normalize_actions(player_actions)
+                                 for player_id, player_actions in actions.items()})
+                expected = state_from_round_info(match.game_state.round_info, round_no)
+                delta = diff_state(recorded, expected)
+                delta.pop("round")
+                if delta:
+                    return path, "diverged", rounds, round_no, delta
+                rounds += 1
+            return path, "ok", rounds, None, None
+    except (OSError, ValueError, KeyError) as e:
+        return path, "error", 0, None, str(e)
+
+
+def verify_all(paths, workers=None, roster=None):
+    # 文件路径惰性地分发给进程池，每个工作进程流式读取自己的回放；
+    # 录制时用了自定义阵容表的，需要用同一份阵容表重新结算
+    workers = workers or os.cpu_count()
+    jobs = iter_replay_paths(paths)
+    if workers == 1:
+        if roster:
+            use_roster(roster)
+        yield from map(verify_replay, jobs)
+        return
+    with multiprocessing.Pool(workers, *((use_roster, (roster,)) if roster else ())) as pool:
+        yield from pool.imap_unordered(verify_replay, jobs, chunksize=4)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Re-simulate recorded matches and check they reproduce exactly')
+    parser.add_argument('paths', nargs='+', help='Replay files or directories of .rpl files')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='Worker processes (default: CPU count)')
+    parser.add_argument('--roster', help='Roster table the matches were played with (default: config/rosters.json)')
+    parser.add_argument('-q', '--quiet', action='store_true', help='Only report problems')
+
+    args = parser.parse_args()
+
+    counts = {}
+    total_rounds = 0
+    start = time.perf_counter()
+    for path, status, rounds, bad_round, detail in verify_all(args.paths, args.workers, args.roster):
+        counts[status] = counts.get(status, 0) + 1
+        total_rounds += rounds
+        if status == "ok":
+            if not args.quiet:
+                print(f"OK       {path} ({rounds} rounds)")
+        elif status == "diverged":
+            print(f"DIVERGED {path} at round {bad_round}: {detail}")
+        elif status == "gap":
+            print(f"GAP      {path} at round {bad_round}: {detail}")
+        elif status == "unseeded":
+            print(f"SKIPPED  {path}: recorded without a seed")
+        else:
+            print(f"ERROR    {path}: {detail}")
+    elapsed = time.perf_counter() - start
+
+    summary = ", ".join(f"{count} {status}" for status, count in sorted(counts.items()))
+    print(f"Verified {sum(counts.values())} replays, {total_rounds} rounds in {elapsed:.2f}s ({summary})")
+    sys.exit(0 if set(counts) <= {"ok", "unseeded"} else 1)